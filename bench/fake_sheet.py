@@ -0,0 +1,100 @@
+import re, time, threading
+
+_CELL_RE = re.compile(r"^([A-Z]+)(\d*)$")
+
+
+def col_index(letters):
+    n = 0
+    for ch in letters:
+        n = n * 26 + (ord(ch) - 64)
+    return n
+
+
+def parse_range(rng):
+    """'I5', 'I5:I9' or the open-ended 'A2:A' -> (col1, row1, col2, row2 or None)."""
+    rng = rng.split("!")[-1]
+    first, _, last = rng.partition(":")
+    c1, r1 = _CELL_RE.match(first).groups()
+    if not last:
+        return col_index(c1), int(r1 or 1), col_index(c1), int(r1) if r1 else None
+    c2, r2 = _CELL_RE.match(last).groups()
+    return col_index(c1), int(r1 or 1), col_index(c2), int(r2) if r2 else None
+
+
+class FakeWorksheet:
+    """In-memory stand-in for the parts of gspread.Worksheet the scraper uses.
+
+    Every call sleeps `latency` seconds to stand in for a Sheets API round trip
+    and is counted in `calls`, so benchmarks can report API usage too.
+    """
+
+    def __init__(self, rows=None, latency=0.0):
+        self.grid = {}  # (row, col) -> str
+        self.latency = latency
+        self.calls = {}
+        self.lock = threading.Lock()
+        for r, values in enumerate(rows or [], start=1):
+            for c, value in enumerate(values, start=1):
+                if value != "":
+                    self.grid[(r, c)] = str(value)
+
+    def _call(self, name):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _bottom(self, col):
+        rows = [r for (r, c) in self.grid if c == col]
+        return max(rows) if rows else 0
+
+    def cell(self, row, col):
+        return self.grid.get((row, col), "")
+
+    def col_values(self, col):
+        self._call("col_values")
+        with self.lock:
+            return [self.cell(r, col) for r in range(1, self._bottom(col) + 1)]
+
+    def _read(self, rng):
+        c1, r1, c2, r2 = parse_range(rng)
+        with self.lock:
+            if r2 is None:
+                r2 = max(self._bottom(c) for c in range(c1, c2 + 1))
+            values = [[self.cell(r, c) for c in range(c1, c2 + 1)] for r in range(r1, r2 + 1)]
+        # Like the API: trailing empty cells and rows are dropped.
+        out = []
+        for row in values:
+            while row and row[-1] == "":
+                row.pop()
+            out.append(row)
+        while out and not out[-1]:
+            out.pop()
+        return out
+
+    def get(self, rng):
+        self._call("get")
+        return self._read(rng)
+
+    def batch_get(self, ranges):
+        self._call("batch_get")
+        return [self._read(rng) for rng in ranges]
+
+    def _write(self, rng, values):
+        c1, r1, _, _ = parse_range(rng)
+        with self.lock:
+            for dr, row in enumerate(values):
+                for dc, value in enumerate(row):
+                    if value == "" or value is None:
+                        self.grid.pop((r1 + dr, c1 + dc), None)
+                    else:
+                        self.grid[(r1 + dr, c1 + dc)] = str(value)
+
+    def update(self, rng, values):
+        self._call("update")
+        self._write(rng, values)
+
+    def batch_update(self, data):
+        self._call("batch_update")
+        for item in data:
+            self._write(item["range"], item["values"])
@@ -0,0 +1,308 @@
+"""Local HTTPS stand-ins for Slickdeals thread pages and Amazon product pages.
+
+One TLS server answers for every host: Chrome is pointed at it with
+--host-resolver-rules and the Python side with route_http_to(), so the
+scraper's real URLs (https://www.amazon.com/dp/..., https://slickdeals.net/...)
+work unchanged and nothing leaves the machine.
+"""
+import os, ssl, json, time, random, tempfile, threading, subprocess
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote
+
+# Thread page shapes, each exercising a different branch of process_row.
+KIND_CTA = "cta"              # preferred CTA with data-aps-asin (static HTML resolves it)
+KIND_REDIRECT = "redirect"    # only a slickdeals.net/click?u2=<amazon> link
+KIND_NEW_TAB = "newtab"       # Amazon CTA without ASIN, opens /f/redirect in a new tab
+KIND_IFRAME = "iframe"        # CTA with ASIN, SiteStripe rendered in a same-origin iframe
+KIND_NON_AMAZON = "nonamazon" # outclick to another store
+KIND_ERROR = "error400"       # Slickdeals 400 error page
+
+DEFAULT_MIX = {
+    KIND_CTA: 50,
+    KIND_REDIRECT: 15,
+    KIND_NEW_TAB: 15,
+    KIND_IFRAME: 10,
+    KIND_NON_AMAZON: 5,
+    KIND_ERROR: 5,
+}
+
+
+class Fixture:
+    def __init__(self, thread_id, kind, asin, widget_delay_ms, base="4.00%", bonus="1.00%"):
+        self.thread_id = thread_id
+        self.kind = kind
+        self.asin = asin
+        self.widget_delay_ms = widget_delay_ms
+        self.base = base
+        self.bonus = bonus
+
+    @property
+    def thread_url(self):
+        return f"https://slickdeals.net/f/{self.thread_id}-bench-deal"
+
+    @property
+    def expected(self):
+        if self.kind == KIND_ERROR:
+            return "400 Error"
+        if self.kind == KIND_NON_AMAZON:
+            return "NON-AMAZON"
+        total = float(self.base.rstrip("%")) + float(self.bonus.rstrip("%"))
+        return f"{total:.2f}%"
+
+
+def build_fixtures(count, mix=None, seed=1, distinct_asins=None, max_delay_ms=3000):
+    """Deterministic fixture set; distinct_asins < count makes ASINs repeat."""
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    kinds = [k for k, weight in mix.items() for _ in range(weight)]
+    distinct_asins = distinct_asins or count
+    fixtures = []
+    for i in range(count):
+        asin = f"B0BN{rng.randrange(distinct_asins):06d}"
+        rate = 1 + (int(asin[-6:]) % 8)
+        fixtures.append(Fixture(
+            thread_id=100000 + i,
+            kind=rng.choice(kinds),
+            asin=asin,
+            widget_delay_ms=rng.randint(100, max_delay_ms),
+            base=f"{rate:.2f}%",
+            bonus=f"{(rate % 3):.2f}%",
+        ))
+    return fixtures
+
+
+def _page(title, body):
+    return (
+        f"<!doctype html><html><head><meta charset='utf-8'><title>{escape(title)}</title>"
+        f"</head><body>{body}</body></html>"
+    )
+
+
+def thread_page(fx):
+    amazon = f"https://www.amazon.com/dp/{fx.asin}"
+    if fx.kind == KIND_ERROR:
+        return 400, _page("Error", "<h2 class='errorPage__headline'>400 Error</h2>")
+    if fx.kind in (KIND_CTA, KIND_IFRAME):
+        link = (
+            f"<a class='dealDetailsOutclickButton' data-store-slug='amazon' "
+            f"data-aps-asin='{fx.asin}' data-aps-asc-tag='slickdeals09-20' "
+            f"data-aps-asc-subtag='%ascsubtag%' href='https://slickdeals.net/f/redirect?sdtid={fx.thread_id}' "
+            f"target='_blank'>See Deal</a>"
+        )
+    elif fx.kind == KIND_REDIRECT:
+        link = f"<a href='https://slickdeals.net/click?u2={quote(amazon, safe='')}'>Buy at Amazon</a>"
+    elif fx.kind == KIND_NEW_TAB:
+        link = (
+            f"<a class='dealDetailsOutclickButton' data-store-slug='amazon' "
+            f"href='https://slickdeals.net/f/redirect?sdtid={fx.thread_id}' target='_blank'>See Deal</a>"
+        )
+    else:
+        link = (
+            f"<a class='dealDetailsOutclickButton' data-store-slug='walmart' "
+            f"href='https://www.walmart.com/ip/{fx.thread_id}' target='_blank'>See Deal</a>"
+        )
+    filler = "".join(f"<p>Comment {i}: <a href='/u/{i}'>user{i}</a></p>" for i in range(40))
+    return 200, _page(f"Deal {fx.thread_id}", f"<h1>Bench deal {fx.thread_id}</h1>{link}{filler}")
+
+
+# Like the real widget, the rates come from a background request made with the
+# page's cookies; see FixtureSite.sitestripe_rates.
+SITESTRIPE_SCRIPT = """
+<div id="sitestripe"></div>
+<script>
+setTimeout(function () {
+  fetch('/associates/sitestripe/rates?asin=%(asin)s', {credentials: 'include'})
+    .then(function (r) { return r.json(); })
+    .then(function (d) {
+      document.getElementById('sitestripe').innerHTML =
+        '<span id="amzn-ss-commission-rate-content">' + d.rates.commission + '</span>' +
+        '<span id="amzn-ss-cc-rate">' + d.rates.specialCommission + '</span>';
+    });
+}, %(delay)d);
+</script>
+"""
+
+# The stand-in SiteStripe endpoint only answers requests carrying this cookie,
+# which product pages set, so replays must reuse the browser's cookies.
+SESSION_COOKIE = "bench-session=1"
+
+
+def product_page(fx):
+    widget = SITESTRIPE_SCRIPT % {"asin": fx.asin, "delay": fx.widget_delay_ms}
+    if fx.kind == KIND_IFRAME:
+        widget = f"<iframe src='/sitestripe-frame/{fx.asin}' width='600' height='80'></iframe>"
+    return 200, _page(f"Amazon.com: {fx.asin}", f"<div id='dp'><h1>Product {fx.asin}</h1></div>{widget}")
+
+
+AFFILIATE_HOME = _page(
+    "Associates Central",
+    "<select id='menu-tab-store-id-picker'></select>"
+    "<span><span class='a-dropdown-prompt'>slickdeals09-20</span></span>",
+)
+
+
+class FixtureSite:
+    """The registry the request handler serves from."""
+
+    def __init__(self, fixtures, latency_ms=100):
+        self.latency_ms = latency_ms
+        self.by_thread = {str(fx.thread_id): fx for fx in fixtures}
+        self.by_asin = {}
+        for fx in fixtures:
+            self.by_asin.setdefault(fx.asin, fx)
+        self.requests = 0
+        self.sitestripe_calls = 0
+        self.lock = threading.Lock()
+
+    def sitestripe_rates(self, query, cookies):
+        with self.lock:
+            self.sitestripe_calls += 1
+        if SESSION_COOKIE not in cookies:
+            return 403, {"Content-Type": "application/json"}, json.dumps({"error": "not signed in"})
+        fx = self.by_asin.get(query.get("asin", [""])[0])
+        if not fx:
+            return 404, {"Content-Type": "application/json"}, json.dumps({"error": "unknown asin"})
+        body = {"asin": fx.asin, "rates": {"commission": fx.base, "specialCommission": fx.bonus}}
+        return 200, {"Content-Type": "application/json"}, json.dumps(body)
+
+    def route(self, host, path, query, cookies=""):
+        """Return (status, headers, body) for a request."""
+        with self.lock:
+            self.requests += 1
+        parts = [p for p in path.split("/") if p]
+
+        if "slickdeals" in host:
+            if parts[:2] == ["f", "redirect"]:
+                fx = self.by_thread.get(query.get("sdtid", [""])[0])
+                if not fx:
+                    return 404, {}, _page("Not found", "")
+                target = (
+                    f"https://www.walmart.com/ip/{fx.thread_id}"
+                    if fx.kind == KIND_NON_AMAZON
+                    else f"https://www.amazon.com/dp/{fx.asin}?tag=slickdeals09-20"
+                )
+                return 302, {"Location": target}, ""
+            if parts[:1] == ["click"]:
+                target = query.get("u2", [""])[0]
+                return (302, {"Location": target}, "") if target else (404, {}, "")
+            if parts[:1] == ["f"] and len(parts) > 1:
+                fx = self.by_thread.get(parts[1].split("-")[0])
+                if fx:
+                    status, body = thread_page(fx)
+                    return status, {}, body
+            return 404, {}, _page("Not found", "")
+
+        if "affiliate-program.amazon" in host:
+            return 200, {}, AFFILIATE_HOME
+
+        if "amazon." in host:
+            session = {"Set-Cookie": f"{SESSION_COOKIE}; Path=/"}
+            if parts[:1] == ["dp"] and len(parts) > 1:
+                fx = self.by_asin.get(parts[1])
+                if fx:
+                    status, body = product_page(fx)
+                    return status, session, body
+            if parts[:1] == ["sitestripe-frame"] and len(parts) > 1:
+                fx = self.by_asin.get(parts[1])
+                if fx:
+                    body = SITESTRIPE_SCRIPT % {"asin": fx.asin, "delay": fx.widget_delay_ms}
+                    return 200, session, _page("SiteStripe", body)
+            if parts[:3] == ["associates", "sitestripe", "rates"]:
+                return self.sitestripe_rates(query, cookies)
+            return 200, {}, _page("Amazon.com", "<h1>Amazon</h1>")
+
+        # Any other store an outclick may land on.
+        return 200, {}, _page(host, f"<h1>{escape(host)}</h1>")
+
+
+def make_handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _serve(self, send_body):
+            parsed = urlparse(self.path)
+            host = (self.headers.get("Host") or "").split(":")[0].lower()
+            status, headers, body = site.route(
+                host, parsed.path, parse_qs(parsed.query), self.headers.get("Cookie") or ""
+            )
+            if site.latency_ms and status == 200:
+                time.sleep(site.latency_ms / 1000.0)
+            data = body.encode("utf-8") if isinstance(body, str) else body
+            headers = dict(headers)
+            self.send_response(status)
+            self.send_header("Content-Type", headers.pop("Content-Type", "text/html; charset=utf-8"))
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            if send_body:
+                self.wfile.write(data)
+
+        def do_GET(self):
+            self._serve(True)
+
+        def do_HEAD(self):
+            self._serve(False)
+
+    return Handler
+
+
+def self_signed_context(workdir):
+    cert = os.path.join(workdir, "bench-cert.pem")
+    key = os.path.join(workdir, "bench-key.pem")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-keyout", key, "-out", cert, "-subj", "/CN=bench.local",
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.load_cert_chain(cert, key)
+    return ctx
+
+
+def start_server(site, workdir=None):
+    """Serve `site` over HTTPS on a free loopback port; returns (server, port)."""
+    workdir = workdir or tempfile.mkdtemp(prefix="bench-tls-")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(site))
+    server.daemon_threads = True
+    server.socket = self_signed_context(workdir).wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, name="bench-server", daemon=True).start()
+    return server, server.server_address[1]
+
+
+def chrome_args(port):
+    """Switches that send every Chrome request to the local server."""
+    return [
+        f"--host-resolver-rules=MAP * 127.0.0.1:{port}, EXCLUDE localhost",
+        "--ignore-certificate-errors",
+    ]
+
+
+def route_http_to(port):
+    """Send every requests/urllib3 connection in this process to the local server."""
+    import urllib3
+    from urllib3.util import connection
+
+    original = connection.create_connection
+
+    def create_connection(address, *args, **kwargs):
+        return original(("127.0.0.1", port), *args, **kwargs)
+
+    connection.create_connection = create_connection
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    return original
+
+
+def fixtures_summary(fixtures):
+    counts = {}
+    for fx in fixtures:
+        counts[fx.kind] = counts.get(fx.kind, 0) + 1
+    return json.dumps(counts, sort_keys=True)
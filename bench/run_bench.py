@@ -0,0 +1,232 @@
+"""Offline throughput benchmark for process_row and the main cycle.
+
+Runs the real scraper code in headless Chromium against the local fixtures in
+bench/fixtures.py and an in-memory worksheet, with no network access:
+
+    python bench/run_bench.py --rows 40 --save before.json
+    # ...change something...
+    python bench/run_bench.py --rows 40 --baseline before.json
+
+Needs chromium + chromedriver (CHROME_BIN / CHROMEDRIVER_PATH) and openssl.
+"""
+import os, sys, json, time, shlex, argparse, tempfile, importlib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import fixtures  # noqa: E402
+import trace_report  # noqa: E402
+from fake_sheet import FakeWorksheet  # noqa: E402
+
+
+def percentile(values, pct):
+    return trace_report.percentile(sorted(values), pct)
+
+
+def configure_env(port, workdir, args):
+    """Point the scraper at throwaway state and the local server, before import."""
+    env = {
+        "AMZ_EMAIL": "bench@example.com",
+        "AMZ_PASS": "bench",
+        "STATE_DIR": os.path.join(workdir, "state"),
+        "CHROME_USER_DATA_DIR": os.path.join(workdir, "profiles"),
+        "TRACE_PATH": os.path.join(workdir, "row-trace.jsonl"),
+        "CHROME_EXTRA_ARGS": shlex.join(fixtures.chrome_args(port)),
+        "WORKER_COUNT": str(args.workers),
+        "CRASH_COOLDOWN": "5",
+        "DOM_EXTRACT": args.dom_extract,
+        "SITESTRIPE_REPLAY": "1" if args.sitestripe_replay else "0",
+        "PIPELINE_DEPTH": str(args.pipeline_depth),
+        "RESOLVE_WORKERS": str(args.resolve_workers),
+    }
+    for key, value in env.items():
+        os.environ[key] = value
+    os.environ.pop("AMAZON_COOKIES", None)
+
+
+def import_scraper():
+    """The commission_scraper package, with its modules loaded as attributes."""
+    import commission_scraper as sc
+    for name in ("browser", "commission", "config", "cycle", "pool", "scrape", "sheets", "state", "threads"):
+        # Loading a submodule sets it as an attribute of the package.
+        importlib.import_module(f"commission_scraper.{name}")
+
+    threads = sc.threads
+    make_session = threads.new_http_session
+
+    def bench_session():
+        session = make_session()
+        # The fixtures use a self-signed certificate; trust_env would let
+        # REQUESTS_CA_BUNDLE override verify=False.
+        session.trust_env = False
+        session.verify = False
+        return session
+
+    threads.new_http_session = bench_session
+    return sc
+
+
+def check(results, fixture_list):
+    by_url = {fx.thread_url: fx for fx in fixture_list}
+    wrong = [(url, got, by_url[url].expected) for url, got in results if got != by_url[url].expected]
+    for url, got, want in wrong[:10]:
+        print(f"   ✗ {url}: got {got!r}, expected {want!r}")
+    return len(wrong)
+
+
+def webdriver_cmds_per_row(sc, since):
+    """Mean WebDriver commands per traced row that started after `since`."""
+    rows, _ = trace_report.load_records(sc.config.TRACE_PATH)
+    cmds = [rec.get("webdriver_cmds", 0) for rec in rows if rec.get("start", 0) >= since]
+    return round(sum(cmds) / len(cmds), 1) if cmds else 0.0
+
+
+def bench_rows(sc, fixture_list):
+    """process_row on one driver, one row at a time."""
+    driver = sc.browser.new_driver_with_retries(slot=0)
+    try:
+        sc.browser.ensure_amazon_session(driver, sc.config.AMZ_EMAIL, sc.config.AMZ_PASS)
+        latencies, results = [], []
+        t0 = time.time()
+        for i, fx in enumerate(fixture_list, start=2):
+            r0 = time.time()
+            got = sc.scrape.process_row(driver, i, fx.thread_url)
+            latencies.append(time.time() - r0)
+            results.append((fx.thread_url, got))
+        wall = time.time() - t0
+    finally:
+        driver.quit()
+    return {
+        "rows": len(fixture_list),
+        "wall_s": round(wall, 2),
+        "rows_per_min": round(len(fixture_list) / wall * 60, 2),
+        "p50_s": round(percentile(latencies, 50), 2),
+        "p95_s": round(percentile(latencies, 95), 2),
+        "webdriver_cmds": webdriver_cmds_per_row(sc, t0),
+        "wrong": check(results, fixture_list),
+    }
+
+
+def bench_cycle(sc, fixture_list, sheet_latency):
+    """One full cycle: scan, worker pool, write-back and writer drain."""
+    rows = [["Date", "Thread"] + [""] * 6 + ["Commission"]]
+    rows += [["bench", fx.thread_url] for fx in fixture_list]
+    sheet = FakeWorksheet(rows, latency=sheet_latency)
+    sc.sheets.set_sheet(sheet)
+    if not sc.sheets.sheet_writer.is_alive():
+        sc.sheets.sheet_writer.start()
+
+    cfg = sc.config
+    scanner = sc.cycle.SheetScanner(
+        os.path.join(cfg.STATE_DIR, "bench-scan.json"), "full", cfg.SCAN_RESCAN_WINDOW, cfg.SCAN_FULL_EVERY
+    )
+    scheduler = sc.cycle.RowScheduler(
+        os.path.join(cfg.STATE_DIR, "bench-schedule.json"), cfg.MANUAL_RETRY_BASE, cfg.MANUAL_RETRY_CAP
+    )
+    pool = sc.pool.WorkerPool(cfg.WORKER_COUNT)
+    boot0 = time.time()
+    pool.start()
+    boot = time.time() - boot0
+    try:
+        t0 = time.time()
+        rows_to_process, manual_rows = scanner.scan()
+        sc.cycle.write_back(pool, rows_to_process, "commission", scanner, scheduler)
+        sc.sheets.sheet_writer.drain()
+        scanner.finish_cycle()
+        wall = time.time() - t0
+        settled = pool.settled()
+    finally:
+        pool.shutdown()
+
+    results = [(fx.thread_url, sheet.cell(i, 9) or None) for i, fx in enumerate(fixture_list, start=2)]
+    return {
+        "rows": len(fixture_list),
+        "workers": cfg.WORKER_COUNT,
+        "boot_s": round(boot, 2),
+        "wall_s": round(wall, 2),
+        "rows_per_min": round(len(fixture_list) / wall * 60, 2),
+        "settled_over_http": settled,
+        "sheet_calls": dict(sheet.calls),
+        "webdriver_cmds": webdriver_cmds_per_row(sc, t0),
+        "wrong": check(results, fixture_list),
+    }
+
+
+def print_comparison(current, baseline):
+    print("\n📈 Against baseline:")
+    for mode in ("rows", "cycle"):
+        cur, base = current.get(mode), baseline.get(mode)
+        if not cur or not base:
+            continue
+        for key in ("rows_per_min", "p50_s", "p95_s", "wall_s", "webdriver_cmds"):
+            if key in cur and key in base and base[key]:
+                delta = (cur[key] - base[key]) / base[key] * 100
+                print(f"   {mode}.{key}: {base[key]} → {cur[key]} ({delta:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=30)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--distinct-asins", type=int, default=None,
+                        help="fewer ASINs than rows exercises the commission cache")
+    parser.add_argument("--max-delay-ms", type=int, default=3000, help="slowest SiteStripe widget")
+    parser.add_argument("--latency-ms", type=int, default=100, help="server think time per page")
+    parser.add_argument("--sheet-latency-ms", type=int, default=150, help="fake Sheets API round trip")
+    parser.add_argument("--mode", choices=("rows", "cycle", "both"), default="both")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--dom-extract", choices=("script", "legacy"), default="script",
+                        help="CTA candidate collection in Chrome (compare WebDriver commands/row)")
+    parser.add_argument("--pipeline-depth", type=int, default=1,
+                        help="rows each worker keeps in flight in separate tabs (cycle mode)")
+    parser.add_argument("--resolve-workers", type=int, default=4,
+                        help="threads resolving thread pages over HTTP ahead of Chrome (cycle mode; 0 = inline)")
+    parser.add_argument("--sitestripe-replay", action="store_true",
+                        help="replay the captured SiteStripe request instead of loading product pages")
+    parser.add_argument("--save", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare against a previous --save file")
+    args = parser.parse_args()
+
+    fixture_list = fixtures.build_fixtures(
+        args.rows, seed=args.seed, distinct_asins=args.distinct_asins, max_delay_ms=args.max_delay_ms
+    )
+    site = fixtures.FixtureSite(fixture_list, latency_ms=args.latency_ms)
+    workdir = tempfile.mkdtemp(prefix="commission-bench-")
+    server, port = fixtures.start_server(site, workdir)
+    fixtures.route_http_to(port)
+    configure_env(port, workdir, args)
+    sc = import_scraper()
+
+    print(f"🏁 Benchmark: {args.rows} rows {fixtures.fixtures_summary(fixture_list)}, server on :{port}")
+    results = {"args": vars(args)}
+    if args.mode in ("rows", "both"):
+        sc.state.commission_cache.entries.clear()
+        results["rows"] = bench_rows(sc, fixture_list)
+        print(f"\n📊 process_row: {json.dumps(results['rows'])}")
+    if args.mode in ("cycle", "both"):
+        sc.state.commission_cache.entries.clear()
+        results["cycle"] = bench_cycle(sc, fixture_list, args.sheet_latency_ms / 1000.0)
+        print(f"\n📊 cycle: {json.dumps(results['cycle'])}")
+
+    results["sitestripe"] = dict(sc.commission.sitestripe.stats(), endpoint_calls=site.sitestripe_calls)
+    print(f"\n🎯 SiteStripe: {json.dumps(results['sitestripe'])}")
+
+    rows, flushes = trace_report.load_records(sc.config.TRACE_PATH)
+    print("\n" + trace_report.summarize(rows, flushes))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Saved results to {args.save}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            print_comparison(results, json.load(f))
+
+    sc.sheets.sheet_writer.stop()
+    server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,15 @@
+"""Fills in Amazon Associates commission rates for Slickdeals threads in a Google Sheet.
+
+Modules, lowest level first: config, tracing, state, sheets, browser,
+commission, threads, scrape, pool, leases, cycle and cli. Importing any of
+them reads settings but connects to nothing: the worksheet opens on first
+use (sheets.get_sheet) and Chrome boots with the first rows a WorkerPool
+gets, so components can be imported and benchmarked on their own.
+"""
+import warnings
+
+# Suppress the noisy urllib3/chardet RequestsDependencyWarning
+warnings.filterwarnings(
+    "ignore",
+    message="urllib3 (.*) or chardet (.*) doesn't match a supported",
+)
@@ -0,0 +1,790 @@
+"""Chrome drivers, network blocking, page weight, and the Amazon session."""
+import os, time, random, json, traceback, threading, shutil, socket
+
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import SessionNotCreatedException, TimeoutException, WebDriverException
+
+from .config import (
+    AMZ_EMAIL,
+    AMZ_PASS,
+    BLOCK_ALLOW,
+    BLOCK_PROFILE,
+    CHROMEDRIVER_PATH,
+    CHROME_BIN,
+    CHROME_EXTRA_ARGS,
+    DEBUG_PORT_BASE,
+    DEFAULT_USER_AGENT,
+    MEASURE_PAGE_WEIGHT,
+    PIPELINE_DEPTH,
+    PROFILE_MAX_AGE,
+    PROFILE_ROOT,
+    RECYCLE_AFTER_PAGES,
+    RECYCLE_RSS_MB,
+    SESSION_COOKIES_PATH,
+    SESSION_TTL,
+    SITESTRIPE_REPLAY,
+)
+from .tracing import count_webdriver_commands, current_trace
+from .ratelimit import rate_limiter
+from .state import write_json_atomic
+
+
+class DriverCrashed(Exception):
+    pass
+
+
+def is_driver_connection_error(e: Exception) -> bool:
+    msg = str(e)
+    return (
+        "HTTPConnectionPool(host='localhost" in msg
+        or "DevToolsActivePort file doesn't exist" in msg
+        or "chrome not reachable" in msg.lower()
+        or "unable to connect to renderer" in msg.lower()
+    )
+
+
+def chrome_driver(debug_port=DEBUG_PORT_BASE, profile_dir=None):
+    service = Service(CHROMEDRIVER_PATH)
+    options = webdriver.ChromeOptions()
+    options.binary_location = CHROME_BIN
+    options.add_argument("--headless=new")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--window-size=1920,1080")
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    options.add_argument("--disable-features=NetworkServiceInProcess")
+    options.add_argument("--log-level=3")
+    options.add_argument(f"--remote-debugging-port={debug_port}")
+    for arg in CHROME_EXTRA_ARGS:
+        options.add_argument(arg)
+    
+    # === USE CUSTOM USER AGENT ===
+    custom_ua = os.environ.get("USER_AGENT")
+    if custom_ua:
+        print(f"🕵️ Using Custom User-Agent: {custom_ua[:50]}...")
+        options.add_argument(f"user-agent={custom_ua}")
+    else:
+        print("⚠️ No USER_AGENT env var found. Using default.")
+        options.add_argument(f"user-agent={DEFAULT_USER_AGENT}")
+
+    if profile_dir is None:
+        profile_dir = os.path.join(
+            PROFILE_ROOT,
+            f"profile-{int(time.time() * 1000)}-{random.randint(1000, 9999)}",
+        )
+    options.add_argument(f"--user-data-dir={profile_dir}")
+
+    if MEASURE_PAGE_WEIGHT or SITESTRIPE_REPLAY:
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    if PIPELINE_DEPTH > 1:
+        # Background tabs must keep running their timers for SiteStripe to render.
+        options.add_argument("--disable-background-timer-throttling")
+        options.add_argument("--disable-backgrounding-occluded-windows")
+        options.add_argument("--disable-renderer-backgrounding")
+
+    options.page_load_strategy = "eager"
+    driver = webdriver.Chrome(service=service, options=options)
+    driver.set_page_load_timeout(60)
+    count_webdriver_commands(driver)
+    apply_block_profile(driver)
+    return driver
+
+
+def process_tree_memory(root_pid):
+    """Bytes of memory used by root_pid and all its descendants, or None.
+
+    Uses PSS from smaps_rollup where the kernel has it, so pages Chrome's
+    processes share are not counted once per process; RSS otherwise.
+    """
+    children = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return None
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces and parentheses.
+                ppid = int(f.read().rpartition(")")[2].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    total = 0
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    pending = [root_pid]
+    while pending:
+        pid = pending.pop()
+        pending.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Pss:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+            continue
+        except (OSError, ValueError):
+            pass
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, ValueError, IndexError):
+            continue
+    return total
+
+
+def driver_memory(driver):
+    """Memory of the chromedriver process and every Chrome process under it."""
+    try:
+        return process_tree_memory(driver.service.process.pid)
+    except Exception:
+        return None
+
+
+def recycle_reason(driver):
+    """Why this driver should be replaced before its next row, or None."""
+    pages = getattr(driver, "pages_loaded", 0)
+    if RECYCLE_AFTER_PAGES and pages >= RECYCLE_AFTER_PAGES:
+        return f"{pages} pages loaded"
+    if RECYCLE_RSS_MB:
+        used = driver_memory(driver)
+        if used is not None and used >= RECYCLE_RSS_MB * 1024 * 1024:
+            return f"Chrome uses {used / 1024 / 1024:.0f} MB"
+    return None
+
+
+# === NETWORK BLOCKING ===
+
+# CDP blocking has no exceptions, so every pattern names the host it blocks
+# and allowlisting drops the patterns for allowed hosts. Media is blocked
+# only on the hosts the thread and product pages load it from.
+MEDIA_HOSTS = ["slickdeals.net", "slickdealscdn.com", "media-amazon.com", "ssl-images-amazon.com", "images-amazon.com"]
+MEDIA_EXTENSIONS = [
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif", ".ico", ".bmp",
+    ".woff", ".woff2", ".ttf", ".otf", ".eot",
+    ".mp4", ".webm", ".m3u8", ".mp3", ".ogg",
+]
+MEDIA_BLOCK_PATTERNS = [f"*{host}/*{ext}*" for host in MEDIA_HOSTS for ext in MEDIA_EXTENSIONS]
+
+TRACKER_BLOCK_PATTERNS = [
+    "*doubleclick.net*", "*googlesyndication.com*", "*googletagservices.com*",
+    "*googletagmanager.com*", "*google-analytics.com*", "*adservice.google.*",
+    "*facebook.net*", "*facebook.com/tr*", "*connect.facebook.*",
+    "*scorecardresearch.com*", "*criteo.*", "*taboola.com*", "*outbrain.com*",
+    "*quantserve.com*", "*adsrvr.org*", "*adnxs.com*", "*rubiconproject.com*",
+    "*pubmatic.com*", "*openx.net*", "*casalemedia.com*", "*moatads.com*",
+    "*hotjar.com*", "*newrelic.com*", "*nr-data.net*", "*bing.com/bat*",
+    "*tiktok.com*", "*pinterest.com/ct*", "*twitter.com/i/adsct*",
+    "*fls-na.amazon.com*", "*unagi.amazon.com*", "*unagi-na.amazon.com*",
+]
+
+# Hosts the SiteStripe commission widget loads from; never blocked.
+BLOCK_ALWAYS_ALLOW = ["affiliate-program.amazon.com", "amazon-adsystem.com", "assoc-amazon.com"]
+
+BLOCK_PROFILES = {
+    "off": [],
+    "media": MEDIA_BLOCK_PATTERNS,
+    "standard": MEDIA_BLOCK_PATTERNS + TRACKER_BLOCK_PATTERNS,
+}
+
+
+def pattern_host(pattern):
+    """The host part of a block pattern: "*facebook.com/tr*" -> "facebook.com"."""
+    return pattern.strip("*").split("/")[0].rstrip("*")
+
+
+def host_allowed(host, allow):
+    """Whether a pattern on host could block a request to an allowed host.
+
+    Either side may be a subdomain of the other, and a pattern host ending in
+    "." ("criteo.") stands for every top-level domain.
+    """
+    for a in allow:
+        a = a.lower().strip(".")
+        if host.endswith("."):
+            if a.startswith(host) or f".{host}" in a:
+                return True
+        elif a == host or a.endswith("." + host) or host.endswith("." + a):
+            return True
+    return False
+
+
+def blocked_url_patterns(profile=None):
+    allow = BLOCK_ALWAYS_ALLOW + BLOCK_ALLOW
+    patterns = BLOCK_PROFILES.get(profile or BLOCK_PROFILE, [])
+    return [p for p in patterns if not host_allowed(pattern_host(p).lower(), allow)]
+
+
+def apply_block_profile(driver):
+    """Install the blocklist on the current tab (CDP blocking is per target)."""
+    patterns = blocked_url_patterns()
+    if not patterns:
+        return
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+    except Exception as e:
+        print(f"⚠️ Could not apply network block profile '{BLOCK_PROFILE}': {e}")
+
+
+page_weight_lock = threading.Lock()
+page_weight_totals = {"pages": 0, "bytes": 0, "ready_ms": 0.0, "blocked": 0}
+
+
+def read_performance_log(driver):
+    """Drain Chrome's performance log into parsed DevTools messages.
+
+    Reading also keeps chromedriver from buffering the log without bound.
+    """
+    if not (MEASURE_PAGE_WEIGHT or SITESTRIPE_REPLAY):
+        return []
+    try:
+        entries = driver.get_log("performance")
+    except Exception as e:
+        if is_driver_connection_error(e):
+            raise
+        return []
+    messages = []
+    for entry in entries:
+        try:
+            messages.append(json.loads(entry["message"])["message"])
+        except Exception:
+            continue
+    return messages
+
+
+def measure_page(driver, row_num, label, messages=None):
+    """Log bytes on the wire since the last call and the page-ready time.
+
+    Bytes come from the performance log, so they include every tab. Compare
+    runs with BLOCK_PROFILE=off and BLOCK_PROFILE=standard. Pass messages
+    when the caller has already drained the log.
+    """
+    if not MEASURE_PAGE_WEIGHT:
+        return None
+    if messages is None:
+        messages = read_performance_log(driver)
+    try:
+        ready_ms = driver.execute_script(
+            """
+            const nav = performance.getEntriesByType('navigation')[0];
+            return nav ? nav.domContentLoadedEventEnd : 0;
+            """
+        ) or 0
+    except Exception as e:
+        if is_driver_connection_error(e):
+            raise
+        return None
+
+    total_bytes = 0
+    blocked = 0
+    for msg in messages:
+        if msg.get("method") == "Network.loadingFinished":
+            total_bytes += int(msg["params"].get("encodedDataLength") or 0)
+        elif msg.get("method") == "Network.loadingFailed" and msg["params"].get("blockedReason"):
+            blocked += 1
+
+    trace = current_trace()
+    if trace is not None:
+        trace.notes[f"{label}_bytes"] = total_bytes
+        trace.notes[f"{label}_ready_ms"] = round(ready_ms)
+    with page_weight_lock:
+        page_weight_totals["pages"] += 1
+        page_weight_totals["bytes"] += total_bytes
+        page_weight_totals["ready_ms"] += ready_ms
+        page_weight_totals["blocked"] += blocked
+    print(
+        f"📦 Row {row_num} {label} [{BLOCK_PROFILE}]: {total_bytes / 1e6:.2f} MB, "
+        f"ready {ready_ms:.0f} ms, {blocked} requests blocked"
+    )
+    return {"bytes": total_bytes, "ready_ms": ready_ms, "blocked": blocked}
+
+
+def page_weight_summary():
+    with page_weight_lock:
+        t = dict(page_weight_totals)
+    if not t["pages"]:
+        return None
+    return (
+        f"📦 Page weight [{BLOCK_PROFILE}]: {t['pages']} pages, "
+        f"avg {t['bytes'] / t['pages'] / 1e6:.2f} MB, "
+        f"avg ready {t['ready_ms'] / t['pages']:.0f} ms, {t['blocked']} requests blocked."
+    )
+
+
+def new_driver_with_retries(max_retries=3, backoff=5, debug_port=DEBUG_PORT_BASE, slot=None):
+    """Start Chrome; with a slot, on that slot's warm profile from the profile store."""
+    last_exc = None
+    for attempt in range(1, max_retries + 1):
+        profile_dir = None
+        if slot is not None:
+            # A profile that keeps failing to start is probably corrupt.
+            profile_dir = profile_store.prepare(slot, wipe=attempt == max_retries)
+        try:
+            print(f"🚗 Starting Chrome (attempt {attempt}/{max_retries})")
+            return chrome_driver(debug_port=debug_port, profile_dir=profile_dir)
+        except (SessionNotCreatedException, WebDriverException) as e:
+            last_exc = e
+            print(f"💥 WebDriverException on startup; retrying in {backoff}s... {e}")
+            time.sleep(backoff)
+    raise DriverCrashed(f"Could not start Chrome after {max_retries} attempts: {last_exc}")
+
+
+# === PROFILE STORE ===
+
+def amazon_cookies(driver):
+    """Every Amazon cookie in the driver's profile, across all tabs and frames."""
+    cookies = driver.execute_cdp_cmd("Network.getAllCookies", {}).get("cookies", [])
+    return [c for c in cookies if "amazon." in c.get("domain", "")]
+
+
+class ProfileStore:
+    """Warm Chrome profiles per worker slot plus an on-disk Amazon cookie jar.
+
+    Each slot reuses PROFILE_ROOT/warm-<slot> across restarts, so Chrome keeps
+    its own cookies. The jar (saved after every successful login) restores
+    them into a fresh profile through CDP without loading a page, and is
+    trusted for SESSION_TTL as long as the auth cookies have not expired.
+    The Store ID may live with the account rather than in the cookies, so
+    the first restore in a process still checks it on a page (store_checked).
+    """
+
+    # Without these the affiliate session is gone, whatever else is saved.
+    AUTH_COOKIES = ("at-main", "sess-at-main", "session-id")
+    # Caches Chrome rebuilds on its own; cleared at every (re)start.
+    CACHE_DIRS = ("Cache", "Code Cache", "GPUCache", "Service Worker/CacheStorage", "Service Worker/ScriptCache")
+    LOCK_FILES = ("SingletonLock", "SingletonSocket", "SingletonCookie")
+
+    def __init__(self, root, cookies_path, ttl, max_age):
+        self.root = root
+        self.cookies_path = cookies_path
+        self.ttl = ttl
+        self.max_age = max_age
+        self.in_use = set()
+        self.lock = threading.Lock()
+        self.store_checked = False
+
+    def profile_dir(self, slot):
+        return os.path.join(self.root, f"warm-{slot}")
+
+    def prepare(self, slot, wipe=False):
+        path = self.profile_dir(slot)
+        if wipe and os.path.isdir(path):
+            print(f"🧹 Wiping warm profile {path}")
+            shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+        # Left behind when Chrome dies; they would make it refuse the profile.
+        for name in self.LOCK_FILES:
+            try:
+                os.unlink(os.path.join(path, name))
+            except OSError:
+                pass
+        for sub in self.CACHE_DIRS:
+            shutil.rmtree(os.path.join(path, "Default", sub), ignore_errors=True)
+        os.utime(path)
+        with self.lock:
+            self.in_use.add(path)
+        return path
+
+    def gc(self):
+        """Delete one-off profile-* dirs and warm profiles idle past max_age."""
+        removed = 0
+        now = time.time()
+        with self.lock:
+            in_use = set(self.in_use)
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return 0
+        for name in names:
+            path = os.path.join(self.root, name)
+            if path in in_use or not os.path.isdir(path):
+                continue
+            stale = name.startswith("profile-") or (
+                name.startswith("warm-") and now - os.path.getmtime(path) > self.max_age
+            )
+            if stale:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        if removed:
+            print(f"🧹 Removed {removed} stale Chrome profile directories.")
+        return removed
+
+    def save_session(self, driver):
+        try:
+            cookies = amazon_cookies(driver)
+        except Exception as e:
+            print(f"⚠️ Could not read cookies to save the session: {e}")
+            return False
+        if not cookies:
+            return False
+        try:
+            write_json_atomic(self.cookies_path, {"saved_at": time.time(), "cookies": cookies})
+            return True
+        except Exception as e:
+            print(f"⚠️ Could not save Amazon session: {e}")
+            return False
+
+    def _load_cookies(self):
+        try:
+            with open(self.cookies_path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable saved session: {e}")
+            return None
+
+        now = time.time()
+        if now - data.get("saved_at", 0) > self.ttl:
+            return None
+        cookies = data.get("cookies") or []
+        names = set()
+        for c in cookies:
+            expires = c.get("expires", -1)
+            # Session cookies (expires == -1) only die with the browser.
+            if expires is None or expires < 0 or expires > now + 60:
+                names.add(c.get("name"))
+        if not any(name in names for name in self.AUTH_COOKIES):
+            return None
+        return cookies
+
+    def session_valid(self):
+        return self._load_cookies() is not None
+
+    def restore_session(self, driver):
+        cookies = self._load_cookies()
+        if not cookies:
+            return False
+        keep = ("name", "value", "domain", "path", "secure", "httpOnly", "sameSite", "expires")
+        params = []
+        for c in cookies:
+            cookie = {k: c[k] for k in keep if k in c}
+            if cookie.get("expires", -1) < 0:
+                cookie.pop("expires", None)
+            params.append(cookie)
+        try:
+            driver.execute_cdp_cmd("Network.setCookies", {"cookies": params})
+            return True
+        except Exception as e:
+            if is_driver_connection_error(e):
+                raise DriverCrashed(str(e))
+            print(f"⚠️ Could not restore saved Amazon session: {e}")
+            return False
+
+    def invalidate(self):
+        self.store_checked = False
+        try:
+            os.unlink(self.cookies_path)
+        except FileNotFoundError:
+            pass
+
+
+profile_store = ProfileStore(PROFILE_ROOT, SESSION_COOKIES_PATH, SESSION_TTL, PROFILE_MAX_AGE)
+
+
+def open_amazon_page(driver, url, settle=10):
+    """Load an Amazon page under the rate limiter and wait for it to finish.
+
+    Pages return at DOMContentLoaded (page_load_strategy "eager"); waiting for
+    readyState "complete" lets login redirects land without a fixed sleep.
+    """
+    rate_limiter.acquire(url)
+    driver.get(url)
+    try:
+        WebDriverWait(driver, settle).until(
+            lambda d: d.execute_script("return document.readyState") == "complete"
+        )
+    except TimeoutException:
+        pass
+
+
+# === COOKIE HELPER (IMPROVED) ===
+
+def inject_cookies_from_env(driver):
+    env_cookies = os.environ.get("AMAZON_COOKIES")
+    if not env_cookies:
+        return False
+
+    print("🍪 AMAZON_COOKIES found! Attempting injection...")
+    try:
+        cookies = json.loads(env_cookies)
+        
+        # 1. Go to root domain first (Crucial for session cookies)
+        open_amazon_page(driver, "https://www.amazon.com")
+        driver.delete_all_cookies()
+        
+        # 2. Inject
+        for cookie in cookies:
+            if 'sameSite' in cookie and cookie['sameSite'] not in ["Strict", "Lax", "None"]:
+                del cookie['sameSite']
+            # Remove domain to let Selenium set it for current context (amazon.com)
+            if 'domain' in cookie:
+                del cookie['domain']
+                
+            try:
+                driver.add_cookie(cookie)
+            except Exception:
+                pass
+                
+        # 3. Go to Affiliate Page
+        print("✅ Cookies injected. Navigating to Affiliate Home...")
+        open_amazon_page(driver, "https://affiliate-program.amazon.com/home")
+        
+        # 4. Verify
+        current_url = driver.current_url.lower()
+        if "signin" not in current_url and "ap/signin" not in current_url:
+            print("🎉 Session restored via Cookies! Login bypassed.")
+            return True
+        else:
+            print(f"⚠️ Cookie injection failed. Redirected to: {current_url[:60]}...")
+            return False
+            
+    except Exception as e:
+        print(f"❌ Error injecting cookies: {e}")
+        return False
+
+
+# === STANDARD HELPERS ===
+
+def select_store_id(driver, target_store="slickdeals09-20"):
+    try:
+        wait = WebDriverWait(driver, 10)
+        try:
+            current_label = driver.find_element(By.CSS_SELECTOR, "#menu-tab-store-id-picker + span .a-dropdown-prompt")
+            if current_label.text.strip() == target_store:
+                print(f"✅ Store ID already set to {target_store}")
+                return True
+        except Exception:
+            pass
+
+        print("📂 Attempting to select Store ID...")
+        dropdown_btn = wait.until(EC.element_to_be_clickable(
+            (By.CSS_SELECTOR, "#menu-tab-store-id-picker + span .a-button-text")
+        ))
+        dropdown_btn.click()
+        
+        option = wait.until(EC.element_to_be_clickable(
+            (By.XPATH, f"//a[contains(@class, 'a-dropdown-link') and normalize-space(text())='{target_store}']")
+        ))
+        
+        body = driver.find_element(By.TAG_NAME, "body")
+        option.click()
+        print(f"✅ {target_store} clicked")
+        
+        try:
+            wait.until(EC.staleness_of(body))
+            print("🔄 Page refresh detected after store selection.")
+        except TimeoutException:
+            print("⚠️ Page did not refresh, but option was clicked.")
+
+        return True
+    except Exception as e:
+        print(f"⚠️ Could not select Store ID '{target_store}': {e}")
+        return False
+
+
+def amazon_login(driver, email, password, timeout=30):
+    try:
+        wait = WebDriverWait(driver, timeout)
+        open_amazon_page(driver, "https://affiliate-program.amazon.com/home")
+
+        if "/home" in driver.current_url.lower():
+            if driver.find_elements(By.CSS_SELECTOR, "a.ac-creatorhub-header-item-login-button"):
+                pass
+            else:
+                print("✅ Already signed in (home).")
+                return True
+
+        if "signin" in driver.current_url.lower() or driver.find_elements(By.ID, "ap_email"):
+            print("🔐 On Amazon sign-in form.")
+        else:
+            try:
+                sign_in_link = wait.until(
+                    EC.element_to_be_clickable(
+                        (By.CSS_SELECTOR, "a.ac-creatorhub-header-item-login-button")
+                    )
+                )
+                driver.execute_script("arguments[0].click();", sign_in_link)
+                print("✅ Clicked Sign In link.")
+            except TimeoutException:
+                if "/home" in driver.current_url.lower():
+                    print("✅ Already signed in.")
+                    return True
+
+        try:
+            email_input = wait.until(EC.visibility_of_element_located((By.ID, "ap_email")))
+            email_input.clear()
+            email_input.send_keys(email)
+            print("✅ Entered email.")
+            wait.until(EC.element_to_be_clickable((By.ID, "continue"))).click()
+            print("✅ Clicked Continue.")
+        except TimeoutException:
+            pass
+
+        try:
+            password_input = wait.until(EC.visibility_of_element_located((By.ID, "ap_password")))
+            password_input.clear()
+            password_input.send_keys(password)
+            print("✅ Entered password.")
+            sign_in_btn = wait.until(EC.element_to_be_clickable((By.ID, "signInSubmit")))
+            driver.execute_script("arguments[0].click();", sign_in_btn)
+            print("✅ Clicked Sign In.")
+            # Let the form submit before looking for a CAPTCHA on the next page.
+            WebDriverWait(driver, 10).until(EC.staleness_of(sign_in_btn))
+        except TimeoutException:
+            pass
+
+        # === CHECK FOR CAPTCHA ===
+        if "characters you see" in driver.page_source.lower() or "puzzle" in driver.page_source.lower():
+            print("🚨 CAPTCHA DETECTED. Automatic login failed.")
+            return False
+
+        try:
+            wait.until(EC.url_contains("/home"))
+            print("✅ Login successful. Ready to process rows.")
+            return True
+        except TimeoutException:
+            return False
+
+    except Exception as e:
+        print(f"❌ Error during login automation: {e}")
+        traceback.print_exc()
+        if is_driver_connection_error(e):
+            raise DriverCrashed(str(e))
+        return False
+
+
+def check_restored_session(driver):
+    """One page load to confirm a restored session is signed in with the right Store ID."""
+    try:
+        open_amazon_page(driver, "https://affiliate-program.amazon.com/home")
+        if "signin" in driver.current_url.lower():
+            return False
+        profile_store.store_checked = select_store_id(driver, "slickdeals09-20")
+        return profile_store.store_checked
+    except Exception as e:
+        if is_driver_connection_error(e):
+            raise DriverCrashed(str(e))
+        print(f"🔐 Saved Amazon session check failed... ({e})")
+        return False
+
+
+def ensure_amazon_session(driver, email, password, trust_saved=True):
+    # 0. Reuse the saved session, loading a page only for its first restore
+    if trust_saved and profile_store.restore_session(driver):
+        if profile_store.store_checked or check_restored_session(driver):
+            print("🍪 Reusing saved Amazon session (no login needed).")
+            return True
+        print("🍪 Saved Amazon session did not check out, logging in again.")
+
+    # 1. Try to inject cookies first (Bypass login)
+    if inject_cookies_from_env(driver):
+        profile_store.store_checked = select_store_id(driver, "slickdeals09-20")
+        profile_store.save_session(driver)
+        return True
+
+    # 2. Fallback to standard login
+    try:
+        open_amazon_page(driver, "https://affiliate-program.amazon.com/home")
+        
+        logged_in = False
+        if "signin" in driver.current_url.lower() or driver.find_elements(
+            By.CSS_SELECTOR, "a.ac-creatorhub-header-item-login-button"
+        ):
+            print("🔐 Amazon session not active, logging in...")
+            logged_in = amazon_login(driver, email, password, timeout=45)
+        else:
+            print("🔐 Amazon session active.")
+            logged_in = True
+        
+        if logged_in:
+            profile_store.store_checked = select_store_id(driver, "slickdeals09-20")
+            profile_store.save_session(driver)
+
+        return logged_in
+        
+    except Exception as e:
+        print(f"🔐 Amazon session check failed... ({e})")
+        if is_driver_connection_error(e):
+            raise DriverCrashed(str(e))
+        
+        return False
+
+
+def free_port():
+    """A local TCP port nothing is listening on right now."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LazyDriver:
+    """Stands in for a Chrome driver that boots and logs in on first use.
+
+    One-off scrapes (the CLI's probe) pass this to process_row, so Chrome
+    never starts when the HTTP fast path, the commission cache or a
+    SiteStripe replay already has the answer. It runs on its own warm
+    profile and a free debug port, next to a daemon's workers if one is up.
+    """
+
+    def __init__(self, slot="probe"):
+        self._slot = slot
+        self._driver = None
+
+    @property
+    def booted(self):
+        return self._driver is not None
+
+    def __getattr__(self, name):
+        if self._driver is None:
+            driver = new_driver_with_retries(debug_port=free_port(), slot=self._slot)
+            if not ensure_amazon_session(driver, AMZ_EMAIL, AMZ_PASS):
+                driver.quit()
+                raise SystemExit("❌ Could not log in to Amazon; no commission to read.")
+            self._driver = driver
+        return getattr(self._driver, name)
+
+    def quit(self):
+        if self._driver is not None:
+            self._driver.quit()
+            self._driver = None
+
+
+def ensure_on_amazon(driver, max_wait=30):
+    t0 = time.time()
+    while time.time() - t0 < max_wait:
+        try:
+            if "amazon." in driver.current_url.lower():
+                return True
+        except Exception:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def safe_close_extra_tabs(driver, keep_handle, keep=()):
+    """Close every tab except keep_handle, `keep` and the driver's pinned tabs.
+
+    A pipelined worker pins the tabs of its other in-flight rows, so a row
+    finishing on the serial path doesn't close them.
+    """
+    keep = {keep_handle, *keep, *getattr(driver, "pinned_tabs", ())}
+    try:
+        for h in list(driver.window_handles):
+            if h not in keep:
+                try:
+                    driver.switch_to.window(h)
+                    driver.close()
+                except Exception:
+                    pass
+        driver.switch_to.window(keep_handle)
+    except Exception:
+        pass
@@ -0,0 +1,169 @@
+"""Command line: the daemon loop and one-shot commands.
+
+    python3 -m commission_scraper run            # scan and scrape forever (/metrics on METRICS_PORT)
+    python3 -m commission_scraper scan-once      # one cycle, then exit
+    python3 -m commission_scraper retry-manual   # only retry due MANUAL rows
+    python3 -m commission_scraper probe <url>    # scrape one thread, print the rate
+"""
+import sys, time, argparse, atexit, traceback
+
+from .config import (
+    CRASH_COOLDOWN,
+    CYCLE_INTERVAL,
+    LEASE_MODE,
+    LEASE_TTL,
+    MANUAL_RETRY_BASE,
+    MANUAL_RETRY_CAP,
+    METRICS_PORT,
+    NEW_ROW_POLL_SECONDS,
+    SCAN_FULL_EVERY,
+    SCAN_MODE,
+    SCAN_RESCAN_WINDOW,
+    SCAN_STATE_PATH,
+    SCHEDULE_STATE_PATH,
+    WORKER_COUNT,
+    WORKER_ID,
+    required_env,
+)
+from .metrics import start_metrics_server
+from .state import commission_cache
+from .sheets import get_sheet, sheet_writer
+from .browser import DriverCrashed, LazyDriver, profile_store
+from .scrape import process_row
+from .pool import WorkerPool, standby
+from .leases import leases
+from .cycle import RowScheduler, SheetScanner, checkpoint, run_cycle
+
+
+def start_sheet_services():
+    """Connect to the sheet and start the writer (and leases) for a sheet command."""
+    for name in ("GOOGLE_SERVICE_ACCOUNT_JSON", "SPREADSHEET_ID", "AMZ_EMAIL", "AMZ_PASS"):
+        required_env(name)
+    get_sheet()
+    sheet_writer.recover()
+    sheet_writer.start()
+    atexit.register(sheet_writer.stop)
+    checkpoint.recover()
+    if leases is not None:
+        print(f"🔒 Leasing rows as worker {WORKER_ID} ({LEASE_MODE}, {LEASE_TTL}s leases).")
+        leases.start()
+        # Registered after the writer, so it runs first and its clears get flushed.
+        atexit.register(leases.stop)
+    profile_store.gc()
+    scanner = SheetScanner(SCAN_STATE_PATH, SCAN_MODE, SCAN_RESCAN_WINDOW, SCAN_FULL_EVERY)
+    scheduler = RowScheduler(SCHEDULE_STATE_PATH, MANUAL_RETRY_BASE, MANUAL_RETRY_CAP)
+    return scanner, scheduler
+
+
+def run_forever(pool, scanner, scheduler):
+    manual_rows = []
+    resume = checkpoint.resume_point()
+    while True:
+        try:
+            manual_rows = run_cycle(pool, scanner, scheduler, resume)
+            resume = None
+
+        except DriverCrashed as e:
+            print(f"❌ Fatal loop error (Driver crashed): {e}")
+            checkpoint.defer(getattr(e, "rows", []))
+            sheet_writer.drain()
+            if standby is not None and standby.available():
+                print("🛟 Standby Chrome ready; restarting workers without a cool-down.")
+            else:
+                print(f"⏳ Cool-down {CRASH_COOLDOWN}s before attempting to restart Chrome workers...")
+                time.sleep(CRASH_COOLDOWN)
+
+            try:
+                pool.restart()
+            except DriverCrashed as e2:
+                print(f"❌ Could not recover WebDriver after crash: {e2}")
+                pool.shutdown()
+                raise SystemExit(1)
+
+            resume = checkpoint.resume_point()
+            if resume:
+                continue
+
+        except Exception as e:
+            print(f"❌ Fatal loop error: {e}")
+            traceback.print_exc()
+            checkpoint.clear()
+            resume = None
+            print(f"⏳ Cool-down {CRASH_COOLDOWN}s before next cycle...")
+            time.sleep(CRASH_COOLDOWN)
+
+        commission_cache.save()
+        profile_store.gc()
+        print(f"⏳ Waiting up to {CYCLE_INTERVAL}s for new rows...")
+        reason = scheduler.wait_for_work(scanner, manual_rows, CYCLE_INTERVAL, NEW_ROW_POLL_SECONDS)
+        print(f"⏰ Waking up: {reason}.")
+
+
+def cmd_run(args):
+    print("🚀 Commission scraper starting up...")
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+    scanner, scheduler = start_sheet_services()
+    pool = WorkerPool(WORKER_COUNT)
+    try:
+        run_forever(pool, scanner, scheduler)
+    finally:
+        pool.shutdown()
+
+
+def run_once(stages):
+    scanner, scheduler = start_sheet_services()
+    pool = WorkerPool(WORKER_COUNT)
+    try:
+        run_cycle(pool, scanner, scheduler, stages=stages)
+    except DriverCrashed as e:
+        print(f"❌ Chrome workers crashed: {e}")
+        return 1
+    finally:
+        pool.shutdown()
+        commission_cache.save()
+    return 0
+
+
+def cmd_scan_once(args):
+    return run_once(("commission", "manual"))
+
+
+def cmd_retry_manual(args):
+    return run_once(("manual",))
+
+
+def cmd_probe(args):
+    """Scrape one thread without touching the sheet; Chrome starts only if needed."""
+    driver = LazyDriver()
+    try:
+        total_pct = process_row(driver, 0, args.url)
+    except DriverCrashed as e:
+        print(f"❌ Chrome crashed: {e}")
+        return 1
+    finally:
+        driver.quit()
+        commission_cache.save()
+    print(f"\n{args.url} → {total_pct or 'MANUAL'}")
+    return 0 if total_pct else 2
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="commission_scraper", description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("run", help="scan the sheet and scrape new rows forever").set_defaults(func=cmd_run)
+    commands.add_parser(
+        "scan-once", help="run one cycle (new rows, then due MANUAL rows) and exit"
+    ).set_defaults(func=cmd_scan_once)
+    commands.add_parser(
+        "retry-manual", help="retry the MANUAL rows that are due and exit"
+    ).set_defaults(func=cmd_retry_manual)
+    probe = commands.add_parser("probe", help="scrape one thread URL and print its commission")
+    probe.add_argument("url")
+    probe.set_defaults(func=cmd_probe)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(sys.argv[1:] if argv is None else argv)
+    return args.func(args) or 0
@@ -0,0 +1,468 @@
+"""Reading SiteStripe commission rates, from the page or a replayed request."""
+import re, time, json, threading, base64
+from urllib.parse import urlparse
+
+from selenium.webdriver.common.by import By
+import requests
+
+from .config import (
+    COMMISSION_WAIT_MODE,
+    HTTP_TIMEOUT,
+    SITESTRIPE_COOKIE_REFRESH,
+    SITESTRIPE_MATCH,
+    SITESTRIPE_MAX_FAILURES,
+    SITESTRIPE_REPLAY,
+)
+from .tracing import current_trace, row_phase
+from .ratelimit import rate_limiter
+from .state import commission_cache
+from .browser import DriverCrashed, amazon_cookies, is_driver_connection_error
+from .threads import new_http_session
+
+
+def js_commission_probe(driver):
+    try:
+        return driver.execute_script(
+            """
+            const base = document.getElementById('amzn-ss-commission-rate-content');
+            const bonus = document.getElementById('amzn-ss-cc-rate');
+            const baseT = base ? base.textContent.trim() : '';
+            const bonusT = bonus ? bonus.textContent.trim() : '';
+            return [baseT, bonusT];
+        """
+        )
+    except Exception:
+        return ["", ""]
+
+
+def probe_iframes(driver):
+    iframes = driver.find_elements(By.CSS_SELECTOR, "iframe")
+    for fr in iframes[:6]:
+        try:
+            driver.switch_to.frame(fr)
+            b, c = js_commission_probe(driver)
+            driver.switch_to.default_content()
+            if b or c:
+                return b, c
+        except Exception:
+            try:
+                driver.switch_to.default_content()
+            except Exception:
+                pass
+    return "", ""
+
+
+def poll_commission_texts(driver, max_wait=45):
+    t0 = time.time()
+    base_text, bonus_text = "", ""
+    while time.time() - t0 < max_wait:
+        base_text, bonus_text = js_commission_probe(driver)
+        if base_text or bonus_text:
+            return base_text, bonus_text
+
+        b, c = probe_iframes(driver)
+        if b or c:
+            return b, c
+        time.sleep(1)
+    return base_text, bonus_text
+
+
+# Resolves with [base, bonus] as soon as either SiteStripe element has text in the
+# document or any same-origin iframe (including frames added later), or with
+# ['', ''] after arguments[0] ms.
+JS_COMMISSION_OBSERVER = """
+const timeoutMs = arguments[0];
+const done = arguments[arguments.length - 1];
+const observers = [];
+const seenFrames = new WeakSet();
+let finished = false;
+let timer = null;
+
+function finish(result) {
+    if (finished) return;
+    finished = true;
+    observers.forEach(o => o.disconnect());
+    if (timer) clearTimeout(timer);
+    done(result);
+}
+
+function check(doc) {
+    const base = doc.getElementById('amzn-ss-commission-rate-content');
+    const bonus = doc.getElementById('amzn-ss-cc-rate');
+    const baseT = base ? base.textContent.trim() : '';
+    const bonusT = bonus ? bonus.textContent.trim() : '';
+    if (baseT || bonusT) finish([baseT, bonusT]);
+}
+
+function watchFrame(fr) {
+    if (seenFrames.has(fr)) return;
+    seenFrames.add(fr);
+    const attach = () => {
+        try { watch(fr.contentDocument); } catch (e) { /* cross-origin */ }
+    };
+    attach();
+    fr.addEventListener('load', attach);
+}
+
+function watch(doc) {
+    if (!doc || finished) return;
+    check(doc);
+    if (finished) return;
+    const obs = new MutationObserver(mutations => {
+        for (const m of mutations) {
+            for (const node of m.addedNodes) {
+                if (node.tagName === 'IFRAME') watchFrame(node);
+                else if (node.querySelectorAll) node.querySelectorAll('iframe').forEach(watchFrame);
+            }
+        }
+        check(doc);
+    });
+    obs.observe(doc.documentElement || doc, {childList: true, subtree: true, characterData: true});
+    observers.push(obs);
+    doc.querySelectorAll('iframe').forEach(watchFrame);
+}
+
+watch(document);
+if (!finished) timer = setTimeout(() => finish(['', '']), timeoutMs);
+"""
+
+# Cross-origin frames are invisible to the observer, so they get a WebDriver
+# probe between observer slices of this many seconds.
+OBSERVER_SLICE = 10
+
+
+def wait_commission_observer(driver, max_wait=45):
+    t0 = time.time()
+    while True:
+        remaining = max_wait - (time.time() - t0)
+        if remaining <= 0:
+            return "", ""
+        slice_s = min(remaining, OBSERVER_SLICE)
+
+        try:
+            driver.set_script_timeout(slice_s + 5)
+            base_text, bonus_text = driver.execute_async_script(
+                JS_COMMISSION_OBSERVER, int(slice_s * 1000)
+            )
+        except Exception as e:
+            if is_driver_connection_error(e):
+                raise
+            # Usually the page navigated mid-wait; polling copes with that.
+            return poll_commission_texts(driver, max(0, max_wait - (time.time() - t0)))
+
+        if base_text or bonus_text:
+            return base_text, bonus_text
+
+        b, c = probe_iframes(driver)
+        if b or c:
+            return b, c
+
+
+def get_commission_texts(driver, max_wait=45):
+    if COMMISSION_WAIT_MODE == "poll":
+        return poll_commission_texts(driver, max_wait)
+    return wait_commission_observer(driver, max_wait)
+
+
+def extract_rate(txt):
+    m = re.search(r"([\d]+(?:\.\d+)?)", txt or "")
+    return float(m.group(1)) if m else 0.0
+
+
+# === SITESTRIPE REQUEST REPLAY ===
+
+RATE_TEXT_RE = re.compile(r"^\s*\d+(?:\.\d+)?\s*%?\s*$")
+SITESTRIPE_HTML_RE = {
+    "base": re.compile(r"id=[\"']amzn-ss-commission-rate-content[\"'][^>]*>([^<]*)<"),
+    "bonus": re.compile(r"id=[\"']amzn-ss-cc-rate[\"'][^>]*>([^<]*)<"),
+}
+REPLAY_DROP_HEADERS = {"cookie", "host", "content-length", "accept-encoding", "connection"}
+
+
+def rate_leaf(value):
+    """A JSON leaf as a rate, or None when it doesn't look like one."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str) and RATE_TEXT_RE.match(value):
+        return extract_rate(value)
+    return None
+
+
+def rate_paths(node, want, path=()):
+    """Key/index paths of every leaf in node holding the rate `want`."""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from rate_paths(value, want, path + (key,))
+    elif isinstance(node, list):
+        for i, value in enumerate(node):
+            yield from rate_paths(value, want, path + (i,))
+    elif rate_leaf(node) == want:
+        yield list(path)
+
+
+def value_at(node, path):
+    for key in path:
+        try:
+            node = node[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return node
+
+
+def html_rates(text):
+    found = {}
+    for name, pattern in SITESTRIPE_HTML_RE.items():
+        m = pattern.search(text or "")
+        if not m or not RATE_TEXT_RE.match(m.group(1)):
+            return None
+        found[name] = extract_rate(m.group(1))
+    return found["base"], found["bonus"]
+
+
+def learn_extractor(text, base, bonus):
+    """How to read base and bonus out of a response that showed them, or None.
+
+    JSON responses must hold each rate in exactly one leaf; anything else
+    is treated as HTML carrying the widget's element ids.
+    """
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    if isinstance(data, (dict, list)):
+        base_paths = list(rate_paths(data, base))
+        bonus_paths = list(rate_paths(data, bonus))
+        if len(base_paths) == 1 and len(bonus_paths) == 1:
+            return {"kind": "json", "base": base_paths[0], "bonus": bonus_paths[0]}
+        return None
+    if html_rates(text) == (base, bonus):
+        return {"kind": "html"}
+    return None
+
+
+def extract_replayed_rates(extractor, text):
+    if extractor["kind"] == "json":
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return None
+        rates = (rate_leaf(value_at(data, extractor["base"])), rate_leaf(value_at(data, extractor["bonus"])))
+    else:
+        rates = html_rates(text) or (None, None)
+    if any(r is None or not 0 <= r <= 100 for r in rates):
+        return None
+    return rates
+
+
+class SiteStripeReplay:
+    """Replays SiteStripe's own rate request for new ASINs over plain HTTP.
+
+    The request is captured once from the performance log of a product page
+    whose widget showed unambiguous rates: its URL, method, headers and body
+    become a template with the ASIN as a placeholder, and learn_extractor
+    records where the rates sit in the response. Replays carry the driver's
+    Amazon cookies. Any unexpected answer returns None so the caller falls
+    back to the page, and SITESTRIPE_MAX_FAILURES failures in a row drop the
+    template so the next product page recaptures it.
+    """
+
+    def __init__(self, enabled, match, cookie_refresh, max_failures):
+        self.enabled = enabled
+        self.match = match
+        self.cookie_refresh = cookie_refresh
+        self.max_failures = max_failures
+        self.template = None
+        self.cookies = []
+        self.cookies_at = 0.0
+        self.cookie_version = 0
+        self.failures = 0
+        self.replays = 0
+        self.fallbacks = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def learn(self, driver, messages, asin, base_text, bonus_text):
+        """Capture a template from a product page load, or refresh its cookies."""
+        if not self.enabled or not asin:
+            return
+        with self.lock:
+            have_template = self.template is not None
+            stale = time.time() - self.cookies_at > self.cookie_refresh
+        if have_template:
+            if stale:
+                self.refresh_cookies(driver)
+            return
+
+        base, bonus = extract_rate(base_text), extract_rate(bonus_text)
+        if base <= 0 or bonus <= 0 or base == bonus:
+            return  # Can't tell the two rates apart in the response.
+        template = self.capture(driver, messages, asin, base, bonus)
+        if not template:
+            return
+        with self.lock:
+            self.template = template
+            self.failures = 0
+        self.refresh_cookies(driver)
+        print(f"🎯 Captured SiteStripe request: {template['method']} {template['url'][:120]}")
+
+    def capture(self, driver, messages, asin, base, bonus):
+        candidates = {}
+        for msg in messages:
+            if msg.get("method") != "Network.requestWillBeSent":
+                continue
+            params = msg.get("params") or {}
+            req = params.get("request") or {}
+            url = req.get("url") or ""
+            if asin not in url and asin not in (req.get("postData") or ""):
+                continue
+            if "amazon." not in urlparse(url).netloc.lower() or not self.match.search(url):
+                continue
+            candidates[params.get("requestId")] = req
+
+        for request_id, req in candidates.items():
+            try:
+                resp = driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})
+            except Exception as e:
+                if is_driver_connection_error(e):
+                    raise DriverCrashed(str(e))
+                continue
+            text = resp.get("body") or ""
+            if resp.get("base64Encoded"):
+                try:
+                    text = base64.b64decode(text).decode("utf-8", "replace")
+                except Exception:
+                    continue
+            extractor = learn_extractor(text, base, bonus)
+            if not extractor:
+                continue
+            headers = {
+                k: str(v).replace(asin, "{asin}")
+                for k, v in (req.get("headers") or {}).items()
+                if not k.startswith(":") and k.lower() not in REPLAY_DROP_HEADERS
+            }
+            return {
+                "method": req.get("method") or "GET",
+                "url": req["url"].replace(asin, "{asin}"),
+                "headers": headers,
+                "body": (req.get("postData") or "").replace(asin, "{asin}") or None,
+                "extractor": extractor,
+            }
+        return None
+
+    def refresh_cookies(self, driver):
+        if not self.enabled:
+            return
+        try:
+            cookies = amazon_cookies(driver)
+        except Exception as e:
+            if is_driver_connection_error(e):
+                raise DriverCrashed(str(e))
+            print(f"⚠️ Could not read cookies for SiteStripe replay: {e}")
+            return
+        with self.lock:
+            self.cookies = cookies
+            self.cookies_at = time.time()
+            self.cookie_version += 1
+
+    def _session(self, version, cookies):
+        """Per-thread session, reseeded whenever the shared cookies change."""
+        if getattr(self.local, "version", None) != version:
+            session = new_http_session()
+            for c in cookies:
+                session.cookies.set(c["name"], c["value"], domain=c.get("domain"), path=c.get("path", "/"))
+            self.local.session = session
+            self.local.version = version
+        return self.local.session
+
+    def _failed(self, asin, reason):
+        with self.lock:
+            self.failures += 1
+            self.fallbacks += 1
+            dropped = self.failures >= self.max_failures and self.template is not None
+            if dropped:
+                self.template = None
+        print(f"⚠️ SiteStripe replay for {asin} failed ({reason}); loading the product page.")
+        if dropped:
+            print("🎯 Dropping the captured SiteStripe request; the next product page recaptures it.")
+
+    def replay(self, asin):
+        """(base, bonus) for asin from the captured request, or None."""
+        if not self.enabled or not asin:
+            return None
+        with self.lock:
+            template, version, cookies = self.template, self.cookie_version, self.cookies
+        if not template:
+            return None
+
+        body = template["body"].replace("{asin}", asin) if template["body"] else None
+        rate_limiter.acquire("amazon")
+        try:
+            with row_phase("sitestripe_replay"):
+                resp = self._session(version, cookies).request(
+                    template["method"],
+                    template["url"].replace("{asin}", asin),
+                    headers={k: v.replace("{asin}", asin) for k, v in template["headers"].items()},
+                    data=body,
+                    timeout=HTTP_TIMEOUT,
+                    allow_redirects=False,
+                )
+        except requests.RequestException as e:
+            self._failed(asin, e)
+            return None
+        if resp.status_code != 200:
+            self._failed(asin, f"HTTP {resp.status_code}")
+            return None
+        rates = extract_replayed_rates(template["extractor"], resp.text)
+        if rates is None:
+            self._failed(asin, "unexpected response")
+            return None
+        with self.lock:
+            self.failures = 0
+            self.replays += 1
+        return rates
+
+    def stats(self):
+        with self.lock:
+            return {
+                "captured": self.template is not None,
+                "replays": self.replays,
+                "fallbacks": self.fallbacks,
+            }
+
+
+sitestripe = SiteStripeReplay(
+    SITESTRIPE_REPLAY, SITESTRIPE_MATCH, SITESTRIPE_COOKIE_REFRESH, SITESTRIPE_MAX_FAILURES
+)
+
+
+def known_commission(asin, trace, claim=True, replay=True):
+    """Rates for asin without the SiteStripe wait: cache, another worker, or a replay.
+
+    claim=False only looks in the cache, without waiting on or claiming the
+    ASIN; replay=False skips the SiteStripe replay.
+    """
+    cached = commission_cache.get_or_claim(asin) if claim else commission_cache.get(asin, count_miss=False)
+    if cached:
+        print(f"🗃️ Cache hit for {asin}, skipping the product page.")
+        trace.notes["cache_hit"] = True
+        return cached
+    replayed = sitestripe.replay(asin) if replay else None
+    if replayed:
+        print(f"🎯 SiteStripe replay for {asin}, skipping the product page.")
+        trace.notes["sitestripe_replay"] = True
+        commission_cache.put(asin, *replayed)
+        return replayed
+    return None
+
+
+def format_commission(base_value, bonus_value):
+    total = base_value + bonus_value
+    trace = current_trace()
+    if trace:
+        trace.rates = (base_value, bonus_value)
+    print(
+        f"➡ Commission base={base_value:.2f}% bonus={bonus_value:.2f}% total={total:.2f}%"
+    )
+    return f"{total:.2f}%"
@@ -0,0 +1,179 @@
+"""Settings, read from the environment once at import.
+
+Nothing here needs credentials: the Google and Amazon ones are only checked
+where they are used, so the package imports (and `probe` runs) without them.
+"""
+import os, re, json, shlex, socket
+
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+
+SHEET_NAME = os.environ.get("SHEET_NAME", "Jeff's Thread Tracker v2")
+AMZ_EMAIL = os.environ.get("AMZ_EMAIL", "")
+AMZ_PASS = os.environ.get("AMZ_PASS", "")
+
+
+def required_env(name):
+    """An environment variable the current command cannot do without."""
+    value = os.environ.get(name, "")
+    if not value:
+        raise SystemExit(f"❌ {name} is not set.")
+    return value
+
+
+def service_account_info():
+    return json.loads(required_env("GOOGLE_SERVICE_ACCOUNT_JSON"))
+
+
+CHROME_BIN = os.environ.get("CHROME_BIN", "/usr/bin/chromium")
+CHROMEDRIVER_PATH = os.environ.get("CHROMEDRIVER_PATH", "/usr/bin/chromedriver")
+# Extra Chrome switches, shell-quoted (e.g. a proxy, or host rules for the benchmark).
+CHROME_EXTRA_ARGS = shlex.split(os.environ.get("CHROME_EXTRA_ARGS", ""))
+PROFILE_ROOT = os.environ.get("CHROME_USER_DATA_DIR", "/tmp/chrome-profile-root")
+os.makedirs(PROFILE_ROOT, exist_ok=True)
+
+# Number of parallel Chrome workers; "auto" means one per CPU core.
+_workers_env = os.environ.get("WORKER_COUNT", "1").strip().lower()
+WORKER_COUNT = max(1, os.cpu_count() or 1) if _workers_env == "auto" else max(1, int(_workers_env))
+CRASH_COOLDOWN = int(os.environ.get("CRASH_COOLDOWN", "60"))
+DEBUG_PORT_BASE = 9222
+# Rows each Chrome worker keeps in flight in separate tabs; 1 is the serial path.
+PIPELINE_DEPTH = max(1, int(os.environ.get("PIPELINE_DEPTH", "1")))
+PIPELINE_TICK = float(os.environ.get("PIPELINE_TICK", "0.25"))
+# Threads that resolve thread pages to Amazon URLs over HTTP ahead of the Chrome
+# workers (0 resolves inside the Chrome workers), and how many resolved rows may
+# wait for a free Chrome worker before the resolvers hold off.
+RESOLVE_WORKERS = max(0, int(os.environ.get("RESOLVE_WORKERS", "4")))
+BROWSER_QUEUE_SIZE = int(os.environ.get("BROWSER_QUEUE_SIZE", "0")) or 2 * WORKER_COUNT * PIPELINE_DEPTH
+# Chrome drivers kept booted and logged in, so a crashed or recycled worker
+# swaps one in instead of a cool-down and cold start. Each one is an idle
+# Chrome's worth of extra memory (a few hundred MB); 0 disables.
+STANDBY_DRIVERS = max(0, int(os.environ.get("STANDBY_DRIVERS", "0")))
+
+
+def cgroup_memory_mb():
+    """The container's memory limit in MB, or None when there is none."""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                text = f.read().strip()
+        except OSError:
+            continue
+        if text.isdigit() and int(text) < 2 ** 50:  # v1 reports "no limit" as a huge number
+            return int(text) // 2 ** 20
+    return None
+
+
+# Restart a worker's Chrome at the next row boundary once its process tree
+# uses this much memory or has loaded this many pages (0 disables either).
+# By default each Chrome (workers and standbys) gets an equal share of 60% of
+# the container's memory limit, at most 350 MB, so the recycle fires well
+# before the OOM killer on a 512 MB instance.
+_memory_limit = cgroup_memory_mb()
+_rss_default = 350 if _memory_limit is None else min(350, int(0.6 * _memory_limit / (WORKER_COUNT + STANDBY_DRIVERS)))
+RECYCLE_RSS_MB = int(os.environ.get("RECYCLE_RSS_MB", str(_rss_default)))
+RECYCLE_AFTER_PAGES = int(os.environ.get("RECYCLE_AFTER_PAGES", "400"))
+# Request pacing shared by all workers, per domain (slickdeals, amazon, sheets):
+# "name=rate:burst:jitter,..." with rate in requests/second, burst the requests
+# allowed back to back after idling, and up to jitter random seconds added to
+# each. Unset fields keep the defaults in ratelimit.py; a rate of 0 disables.
+RATE_LIMITS = os.environ.get("RATE_LIMITS", "")
+
+# Everything the scraper persists between restarts lives under STATE_DIR.
+STATE_DIR = os.environ.get("STATE_DIR", "/tmp/commission-scraper")
+os.makedirs(STATE_DIR, exist_ok=True)
+
+COMMISSION_CACHE_PATH = os.environ.get(
+    "COMMISSION_CACHE_PATH", os.path.join(STATE_DIR, "commission-cache.json")
+)
+COMMISSION_CACHE_TTL = int(os.environ.get("COMMISSION_CACHE_TTL", str(24 * 3600)))  # 0 disables
+COMMISSION_CACHE_MAX = int(os.environ.get("COMMISSION_CACHE_MAX", "5000"))
+# Per-row results and rate history; the sheet only gets cells that changed. Empty disables.
+RESULT_DB_PATH = os.environ.get("RESULT_DB_PATH", os.path.join(STATE_DIR, "results.sqlite3"))
+# How long a worker waits for another worker already scraping the same ASIN.
+ASIN_SINGLE_FLIGHT_WAIT = float(os.environ.get("ASIN_SINGLE_FLIGHT_WAIT", "120"))
+
+# Read thread pages over plain HTTP before falling back to a Chrome render.
+HTTP_FAST_PATH = os.environ.get("HTTP_FAST_PATH", "1") != "0"
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "15"))
+
+# "script" collects all CTA/outclick candidates in one execute_script call;
+# "legacy" uses find_elements plus per-element is_displayed/get_attribute.
+DOM_EXTRACT = os.environ.get("DOM_EXTRACT", "script").strip().lower()
+
+# Follow Slickdeals outclick redirects over HTTP instead of clicking them in Chrome.
+REDIRECT_RESOLVE = os.environ.get("REDIRECT_RESOLVE", "1") != "0"
+REDIRECT_MAX_HOPS = int(os.environ.get("REDIRECT_MAX_HOPS", "8"))
+REDIRECT_HOP_TIMEOUT = float(os.environ.get("REDIRECT_HOP_TIMEOUT", "6"))
+REDIRECT_MAX_LINKS = int(os.environ.get("REDIRECT_MAX_LINKS", "3"))  # outclicks tried per thread
+REDIRECT_CACHE_MAX = int(os.environ.get("REDIRECT_CACHE_MAX", "2000"))
+
+# "observer" waits on a MutationObserver inside the page, "poll" probes once a second.
+COMMISSION_WAIT_MODE = os.environ.get("COMMISSION_WAIT_MODE", "observer").strip().lower()
+
+# "incremental" re-reads only rows near the persisted watermark; "full" reads whole columns.
+SCAN_MODE = os.environ.get("SCAN_MODE", "incremental").strip().lower()
+SCAN_STATE_PATH = os.environ.get("SCAN_STATE_PATH", os.path.join(STATE_DIR, "scan-state.json"))
+SCAN_RESCAN_WINDOW = int(os.environ.get("SCAN_RESCAN_WINDOW", "200"))
+SCAN_FULL_EVERY = int(os.environ.get("SCAN_FULL_EVERY", "12"))  # cycles between full scans
+
+# MANUAL rows are retried after MANUAL_RETRY_BASE seconds, doubling per failed
+# retry up to MANUAL_RETRY_CAP. Between cycles the sheet is checked for new
+# rows every NEW_ROW_POLL_SECONDS, for at most CYCLE_INTERVAL seconds. Attempts
+# are read from the result store; SCHEDULE_STATE_PATH is used only without one.
+SCHEDULE_STATE_PATH = os.environ.get("SCHEDULE_STATE_PATH", os.path.join(STATE_DIR, "schedule.json"))
+MANUAL_RETRY_BASE = int(os.environ.get("MANUAL_RETRY_BASE", "300"))
+MANUAL_RETRY_CAP = int(os.environ.get("MANUAL_RETRY_CAP", str(24 * 3600)))
+CYCLE_INTERVAL = int(os.environ.get("CYCLE_INTERVAL", "300"))
+NEW_ROW_POLL_SECONDS = int(os.environ.get("NEW_ROW_POLL_SECONDS", "30"))
+
+# Several containers can split the backlog by leasing rows: "sheet" keeps
+# leases in LEASE_COLUMN, "sqlite" in a file shared by workers on one host
+# (and handy for tests), "off" runs a single worker without leases.
+LEASE_MODE = os.environ.get("LEASE_MODE", "off").strip().lower()
+WORKER_ID = os.environ.get("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+LEASE_TTL = int(os.environ.get("LEASE_TTL", "300"))
+LEASE_COLUMN = os.environ.get("LEASE_COLUMN", "J").strip().upper()
+LEASE_DB_PATH = os.environ.get("LEASE_DB_PATH", os.path.join(STATE_DIR, "leases.sqlite3"))
+LEASE_SETTLE_SECONDS = float(os.environ.get("LEASE_SETTLE_SECONDS", "2"))
+LEASE_BATCH = int(os.environ.get("LEASE_BATCH", "0")) or 2 * WORKER_COUNT  # rows claimed at a time
+
+# The background sheet writer flushes once this many cells are pending or the
+# oldest pending cell is this many seconds old.
+SHEET_FLUSH_CELLS = int(os.environ.get("SHEET_FLUSH_CELLS", "10"))
+SHEET_FLUSH_SECONDS = float(os.environ.get("SHEET_FLUSH_SECONDS", "30"))
+# Queued cells are journaled here until written, and replayed on startup.
+SHEET_JOURNAL_PATH = os.environ.get("SHEET_JOURNAL_PATH", os.path.join(STATE_DIR, "sheet-journal.jsonl"))
+# Rows of the pass in progress, so a Chrome crash resumes after the failing row.
+CHECKPOINT_PATH = os.environ.get("CHECKPOINT_PATH", os.path.join(STATE_DIR, "cycle-checkpoint.json"))
+
+# Network blocking: "off", "media" (images, fonts, video on the Slickdeals and
+# Amazon hosts) or "standard" (media plus ads and trackers). Off by default
+# until SiteStripe is verified under blocking. BLOCK_ALLOW adds comma-separated
+# hosts (and their subdomains) that are never blocked on top of what SiteStripe needs.
+BLOCK_PROFILE = os.environ.get("BLOCK_PROFILE", "off").strip().lower()
+BLOCK_ALLOW = [a.strip() for a in os.environ.get("BLOCK_ALLOW", "").split(",") if a.strip()]
+# Log bytes transferred and page-ready time for each page a row loads.
+MEASURE_PAGE_WEIGHT = os.environ.get("MEASURE_PAGE_WEIGHT", "0") == "1"
+
+# Capture the request SiteStripe makes for its rates from the performance log
+# and replay it over HTTP for later ASINs instead of rendering product pages.
+SITESTRIPE_REPLAY = os.environ.get("SITESTRIPE_REPLAY", "0") == "1"
+SITESTRIPE_MATCH = re.compile(os.environ.get("SITESTRIPE_MATCH", r"sitestripe|associates|commission"), re.I)
+SITESTRIPE_COOKIE_REFRESH = int(os.environ.get("SITESTRIPE_COOKIE_REFRESH", "1800"))
+SITESTRIPE_MAX_FAILURES = int(os.environ.get("SITESTRIPE_MAX_FAILURES", "3"))
+
+# Saved Amazon cookies are trusted without a page load for this long.
+SESSION_TTL = int(os.environ.get("SESSION_TTL", str(6 * 3600)))
+SESSION_COOKIES_PATH = os.environ.get(
+    "SESSION_COOKIES_PATH", os.path.join(STATE_DIR, "amazon-session.json")
+)
+# Idle warm profiles older than this are garbage-collected.
+PROFILE_MAX_AGE = int(os.environ.get("PROFILE_MAX_AGE", str(3 * 24 * 3600)))
+
+# Serve Prometheus metrics on this port while `run` is up; 0 disables.
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+
+# Per-row phase timings as JSONL (summarise with trace_report.py); "" disables.
+TRACE_PATH = os.environ.get("TRACE_PATH", os.path.join(STATE_DIR, "row-trace.jsonl"))
+
+DEFAULT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
@@ -0,0 +1,718 @@
+"""One scrape cycle: scan the sheet, scrape, retry MANUAL rows, write back."""
+import os, time, json, threading
+from collections import OrderedDict
+
+from gspread.exceptions import APIError
+
+from .config import CHECKPOINT_PATH, LEASE_BATCH, SITESTRIPE_REPLAY
+from .ratelimit import rate_limiter
+from .state import commission_cache, result_store, write_json_atomic
+from .sheets import queue_result, sheet_api, sheet_writer
+from .browser import DriverCrashed, page_weight_summary
+from .commission import sitestripe
+from .threads import redirect_resolver, thread_key
+from .pool import CRASH_SKIPPED, standby
+from .leases import leases
+
+
+def claim_groups(chunk, followers, scanner, scheduler):
+    """Leaders in chunk whose rows this worker leased; followers trimmed to leased rows.
+
+    Rows another worker holds are left alone until its lease runs out.
+    """
+    rows = [r for leader, _ in chunk for r in [leader] + [f for f, _ in followers[leader]]]
+    won, busy = leases.claim(rows)
+    won = set(won)
+    claimed, kept = [], set()
+
+    def skip(member_row, member_url):
+        scanner.record_unfinished(member_row)
+        checkpoint.mark_done(member_row)
+        if member_row in busy:
+            scheduler.defer(member_row, member_url, busy[member_row])
+
+    for leader, url in chunk:
+        if leader not in won:
+            for member_row, member_url in [(leader, url)] + followers[leader]:
+                skip(member_row, member_url)
+            continue
+        for member_row, member_url in followers[leader]:
+            if member_row not in won:
+                skip(member_row, member_url)
+        followers[leader] = [(r, u) for r, u in followers[leader] if r in won]
+        claimed.append((leader, url))
+        kept.update([leader] + [f for f, _ in followers[leader]])
+    if won - kept:
+        leases.done(sorted(won - kept), linger=0)
+    skipped = len(chunk) - len(claimed)
+    if skipped:
+        print(f"🔒 {skipped} of {len(chunk)} threads are leased by other workers; leaving them to them.")
+    return claimed
+
+
+def drop_filled(chunk, followers, scanner):
+    """Leaders in chunk with rows that still read MANUAL; followers trimmed to them.
+
+    MANUAL rows above the scan window come from an earlier scan, and someone
+    may have typed a value in since. One batch_get re-reads column I so the
+    clear before a retry never erases it.
+    """
+    rows = [(r, u) for leader in chunk for r, u in [leader] + followers[leader[0]]]
+    values = sheet_api("batch_get", [f"I{row_num}" for row_num, _ in rows])
+    filled = []
+    for (row_num, url), value in zip(rows, values):
+        text = str(value[0][0]).strip() if value and value[0] else ""
+        if text and text.upper() != "MANUAL":
+            filled.append(row_num)
+            checkpoint.mark_done(row_num)
+            scanner.record_result(row_num, url, text)
+    if not filled:
+        return chunk, []
+    print(f"✋ Rows {filled} are no longer MANUAL in the sheet; leaving them as they are.")
+    result_store.mark_filled(filled)
+    kept = []
+    for leader in chunk:
+        members = [(r, u) for r, u in [leader] + followers.pop(leader[0]) if r not in filled]
+        if members:
+            followers[members[0][0]] = members[1:]
+            kept.append(members[0])
+    return kept, filled
+
+
+def write_back(pool, rows, label, scanner, scheduler, clear_first=False):
+    """Run rows through the pool and hand their results to the sheet writer.
+
+    Rows of the same thread are scraped once and the result fanned out to
+    every one of them. With leases, rows are claimed LEASE_BATCH threads at
+    a time and rows other workers hold are skipped. clear_first blanks the
+    claimed cells before scraping, after checking they still read MANUAL.
+    Returns how many rows got a non-MANUAL result.
+    """
+    groups = OrderedDict()
+    for row_num, thread_url in rows:
+        groups.setdefault(thread_key(thread_url), []).append((row_num, thread_url))
+    leaders = [members[0] for members in groups.values()]
+    followers = {members[0][0]: members[1:] for members in groups.values()}
+    cache_before = commission_cache.stats()
+    settled_before = pool.settled()
+
+    resolved = 0
+    processed = 0
+    batch = max(1, LEASE_BATCH if leases is not None else len(leaders))
+    for start in range(0, len(leaders), batch):
+        chunk = leaders[start:start + batch]
+        if leases is not None:
+            chunk = claim_groups(chunk, followers, scanner, scheduler)
+            if not chunk:
+                continue
+        held = [r for leader, _ in chunk for r in [leader] + [f for f, _ in followers[leader]]]
+        failed = []
+        try:
+            if clear_first:
+                chunk, filled = drop_filled(chunk, followers, scanner)
+                # Coalesced with each row's new result unless the writer flushes first.
+                for row_num in held:
+                    if row_num not in filled:
+                        sheet_writer.put(row_num, "")
+            resolved += write_results(pool, chunk, followers, scanner, scheduler, failed)
+            processed += len(chunk)
+        finally:
+            if leases is not None:
+                leases.done(held)
+                # Other workers back off with this worker's failed rows.
+                leases.hold(scheduler.due_times(failed))
+
+    cache_after = commission_cache.stats()
+    # Dedup counts only results produced this cycle: repeated threads and
+    # ASINs another row scraped since start_cycle(). Rates cached by earlier
+    # cycles are cache hits, reported apart.
+    reused = (cache_after["reused"] - cache_before["reused"]) + (cache_after["shared"] - cache_before["shared"])
+    cached = (cache_after["hits"] - cache_before["hits"]) - (cache_after["reused"] - cache_before["reused"])
+    deduped = len(rows) - len(leaders) + reused
+    print(
+        f"🧮 {label} dedup: {len(rows)} rows → {len(leaders)} distinct threads → "
+        f"{max(0, processed - reused - cached)} scraped after {reused} ASIN reuses this cycle "
+        f"(dedup ratio {len(rows) / max(1, len(rows) - deduped):.2f}x); "
+        f"{cached} answered from rates cached by earlier cycles."
+    )
+    settled = pool.settled() - settled_before
+    if settled:
+        print(f"🔗 {settled} {label} threads settled over HTTP without a Chrome worker.")
+    print(f"✅ Queued {label} results for {len(rows)} threads.")
+    return resolved
+
+
+def write_results(pool, leaders, followers, scanner, scheduler, failed=None):
+    """Fan each leader's result out to its rows; MANUAL rows are added to failed."""
+    resolved = 0
+    for row_num, thread_url, total_pct in pool.map_rows(leaders):
+        for member_row, member_url in [(row_num, thread_url)] + followers[row_num]:
+            checkpoint.mark_done(member_row)
+            if total_pct is CRASH_SKIPPED:
+                print(f"⚠️ Row {member_row} crashed Chrome twice; leaving it for the next cycle.")
+                scanner.record_unfinished(member_row)
+                result_store.record(member_row, member_url, "CRASHED")
+                continue
+            result_store.record(member_row, member_url, total_pct, source_row=row_num)
+            if member_row != row_num:
+                print(f"🧮 Row {member_row} repeats row {row_num}'s thread, reusing its result.")
+            queue_result(member_row, total_pct)
+            scanner.record_result(member_row, member_url, total_pct)
+            scheduler.record_result(member_row, member_url, total_pct)
+            if total_pct is not None:
+                resolved += 1
+            elif failed is not None:
+                failed.append((member_row, member_url))
+    return resolved
+
+
+def retry_manual_rows(pool, scanner, scheduler, manual_rows, due=None):
+    """Retry the MANUAL rows that are due; `due` resumes an interrupted pass."""
+    try:
+        if due is None:
+            if not manual_rows:
+                print("✅ No MANUAL rows to retry.")
+                return
+
+            due = scheduler.due_manual_rows(manual_rows)
+            if not due:
+                print(f"✅ None of {len(manual_rows)} MANUAL rows is due for a retry yet.")
+                return
+            checkpoint.begin("manual", due, manual_rows)
+
+        print(f"🔁 Retrying {len(due)} of {len(manual_rows)} MANUAL rows.")
+        if write_back(pool, due, "MANUAL retry", scanner, scheduler, clear_first=True):
+            print("✅ Finished retry pass for MANUAL rows.")
+
+    except DriverCrashed:
+        raise
+    except APIError as e:
+        print(f"⚠️ Google Sheets API Error during MANUAL retry: {e}")
+    except Exception as e:
+        print(f"⚠️ Unexpected error during MANUAL retry: {e}")
+
+
+# === SHEET SCANNING ===
+
+class SheetScanner:
+    """Finds rows to scrape with one batch_get per cycle.
+
+    In incremental mode only rows from just below the watermark (the last row
+    up to which every row has a result) are read. Known MANUAL rows above that
+    window come from the result store (the state file when it is disabled)
+    instead of being re-read. A full
+    scan runs every SCAN_FULL_EVERY cycles, and whenever the row above the
+    window or the bottom row moved, since that means rows were inserted,
+    deleted or sorted.
+    """
+
+    def __init__(self, path, mode, window, full_every):
+        self.path = path
+        self.mode = mode
+        self.window = window
+        self.full_every = full_every
+        self.state = self._load()
+        self.unfinished = set()
+        self.window_start = 2
+        self.window_anchor = ""
+        self.window_urls = []
+
+    def _load(self):
+        state = {
+            "watermark": 1,
+            "bottom_row": 0,
+            "anchor_row": None,
+            "anchor": "",
+            "cycles_since_full": 0,
+            "manual": {},
+        }
+        try:
+            with open(self.path) as f:
+                state.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable scan state {self.path}: {e}")
+        return state
+
+    def save(self):
+        try:
+            write_json_atomic(self.path, self.state)
+        except Exception as e:
+            print(f"⚠️ Could not save scan state: {e}")
+
+    def _read(self, start):
+        ranges = [f"A{start}:A", f"B{start}:B", f"I{start}:I"]
+        if start > 2:
+            ranges.append(f"B{start - 1}")
+        value_ranges = sheet_api("batch_get", ranges)
+        cols = [[(r[0] if r else "") for r in vr] for vr in value_ranges]
+        while len(cols) < len(ranges):
+            cols.append([])
+        anchor = (cols[3][0] if len(cols) > 3 and cols[3] else "").strip()
+        return cols[0], cols[1], cols[2], anchor
+
+    def scan(self):
+        """Return (rows_to_process, manual_rows), newest rows first."""
+        st = self.state
+        full = (
+            self.mode == "full"
+            or st["watermark"] < 2
+            or st["cycles_since_full"] + 1 >= self.full_every
+        )
+        start = 2 if full else max(2, st["watermark"] - self.window + 1)
+
+        col_a, col_b, col_i, anchor = self._read(start)
+        while col_a and not col_a[-1].strip():
+            col_a.pop()
+        bottom_row = start - 1 + len(col_a)
+
+        if not full and (
+            bottom_row < st["bottom_row"]
+            or st["anchor_row"] != start - 1
+            or anchor != st["anchor"]
+        ):
+            print("🔎 Sheet changed above the scan window; doing a full rescan.")
+            start = 2
+            col_a, col_b, col_i, anchor = self._read(start)
+            while col_a and not col_a[-1].strip():
+                col_a.pop()
+            bottom_row = start - 1 + len(col_a)
+            full = True
+
+        size = bottom_row - start + 1
+        col_b += [""] * (size - len(col_b))
+        col_i += [""] * (size - len(col_i))
+
+        rows_to_process = []
+        window_manual = {}
+        for row_num in range(bottom_row, start - 1, -1):
+            url = (col_b[row_num - start] or "").strip()
+            commission = (col_i[row_num - start] or "").strip()
+            if url and not commission:
+                rows_to_process.append((row_num, url))
+            elif url and commission.upper() == "MANUAL":
+                window_manual[str(row_num)] = url
+
+        manual = {} if full else {r: u for r, u in self.known_manual().items() if int(r) < start}
+        manual.update(window_manual)
+
+        st["manual"] = {} if result_store.enabled else manual
+        st["bottom_row"] = bottom_row
+        st["cycles_since_full"] = 0 if full else st["cycles_since_full"] + 1
+        self.unfinished = {row_num for row_num, _ in rows_to_process}
+        self.window_start = start
+        self.window_anchor = anchor
+        self.window_urls = col_b
+        mode = "full" if full else f"incremental from row {start}"
+        print(f"🔎 Scanned rows {start}-{bottom_row} ({mode}).")
+
+        manual_rows = sorted(((int(r), u) for r, u in manual.items()), reverse=True)
+        return rows_to_process, manual_rows
+
+    def known_manual(self):
+        """{str(row): url} of rows last seen as MANUAL, from the result store or the state file."""
+        if result_store.enabled:
+            return {str(row_num): url for row_num, url, _, _ in result_store.manual_rows()}
+        return self.state["manual"]
+
+    def record_result(self, row_num, thread_url, total_pct):
+        self.unfinished.discard(row_num)
+        if result_store.enabled:
+            return  # write_results records the row's status in the store.
+        if total_pct is None:
+            self.state["manual"][str(row_num)] = thread_url
+        else:
+            self.state["manual"].pop(str(row_num), None)
+
+    def record_unfinished(self, row_num):
+        self.unfinished.add(row_num)
+
+    def has_new_rows(self, lookahead=20):
+        """Cheap single-range check for rows appended below the last scan."""
+        bottom = self.state["bottom_row"]
+        try:
+            values = sheet_api("get", f"A{bottom + 1}:A{bottom + lookahead}")
+        except Exception as e:
+            print(f"⚠️ New-row check failed: {e}")
+            return False
+        return any(row and str(row[0]).strip() for row in values)
+
+    def finish_cycle(self):
+        """Advance the watermark past every row that now has a result."""
+        st = self.state
+        st["watermark"] = min(self.unfinished) - 1 if self.unfinished else st["bottom_row"]
+
+        # Remember the URL just above next cycle's window; it was read this cycle
+        # unless the window moved backwards, in which case the next scan is full.
+        anchor_row = max(2, st["watermark"] - self.window + 1) - 1
+        offset = anchor_row - self.window_start
+        if anchor_row < 2:
+            st["anchor_row"], st["anchor"] = anchor_row, ""
+        elif anchor_row == self.window_start - 1:
+            st["anchor_row"], st["anchor"] = anchor_row, self.window_anchor
+        elif 0 <= offset < len(self.window_urls):
+            st["anchor_row"], st["anchor"] = anchor_row, (self.window_urls[offset] or "").strip()
+        else:
+            st["anchor_row"], st["anchor"] = None, ""
+        self.save()
+
+
+# === CYCLE CHECKPOINT ===
+
+class CycleCheckpoint:
+    """The rows of the pass in progress and which of them are done.
+
+    Saved after every row, so when all Chrome workers crash the main loop can
+    restart them and resume the same pass with the rows that are left,
+    skipping the rows the crash happened on (the next cycle's scan picks
+    those up again) instead of rescanning and starting over. Finished rows
+    are appended to a log next to the JSON, the way the sheet journal is,
+    and folded into it when the pass changes. A new process picks the pass
+    up again through recover().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.log_path = f"{path}.done"
+        self.state = None
+        self.lock = threading.Lock()
+
+    def begin(self, stage, rows, manual_rows):
+        with self.lock:
+            self.state = {
+                "stage": stage,
+                "started": time.time(),
+                "rows": [list(r) for r in rows],
+                "manual_rows": [list(r) for r in manual_rows],
+                "done": [],
+                "deferred": [],
+            }
+            self._save()
+
+    def _save(self):
+        """Rewrite the JSON with every done row and empty the log (caller holds lock)."""
+        try:
+            write_json_atomic(self.path, self.state)
+            open(self.log_path, "w").close()
+        except Exception as e:
+            print(f"⚠️ Could not save cycle checkpoint: {e}")
+
+    def mark_done(self, row_num):
+        with self.lock:
+            if self.state is None:
+                return
+            self.state["done"].append(row_num)
+            try:
+                with open(self.log_path, "a") as f:
+                    f.write(f"{row_num}\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError as e:
+                print(f"⚠️ Could not checkpoint row {row_num}: {e}")
+
+    def defer(self, rows):
+        with self.lock:
+            if self.state is None:
+                return
+            done = set(self.state["done"])
+            self.state["deferred"].extend(r for r in rows if r not in done)
+            self._save()
+
+    def resume_point(self):
+        """(stage, rows left, deferred rows, manual_rows) of an interrupted pass, or None."""
+        with self.lock:
+            if self.state is None:
+                return None
+            skip = set(self.state["done"]) | set(self.state["deferred"])
+            # Repeats of a crashed row's thread would crash the same way.
+            crashed = {thread_key(url) for row_num, url in self.state["rows"] if row_num in self.state["deferred"]}
+            left = [tuple(r) for r in self.state["rows"] if r[0] not in skip and thread_key(r[1]) not in crashed]
+            manual_rows = [tuple(r) for r in self.state["manual_rows"]]
+            return self.state["stage"], left, list(self.state["deferred"]), manual_rows
+
+    def clear(self):
+        with self.lock:
+            self.state = None
+            for path in (self.path, self.log_path):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    def _load(self):
+        """The saved pass with the logged rows folded in, or None."""
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable cycle checkpoint {self.path}: {e}")
+            return None
+        try:
+            with open(self.log_path) as f:
+                for line in f:
+                    try:
+                        state["done"].append(int(line))
+                    except ValueError:
+                        continue  # A torn last line from a crash mid-append.
+        except FileNotFoundError:
+            pass
+        return state
+
+    @staticmethod
+    def _rows_match(rows):
+        """Whether column B still has each (row, url), i.e. no rows moved since."""
+        if not rows:
+            return True
+        first, last = min(r for r, _ in rows), max(r for r, _ in rows)
+        values = sheet_api("get", f"B{first}:B{last}")
+        urls = [(v[0] if v else "").strip() for v in values]
+        return all(
+            row_num - first < len(urls) and urls[row_num - first] == url.strip()
+            for row_num, url in rows
+        )
+
+    def recover(self):
+        """Take over the pass a previous process left unfinished; True if there is one.
+
+        Its finished rows' results are in the sheet journal. The checkpoint is
+        dropped (and the next cycle rescans) when rows it has left moved since.
+        """
+        state = self._load()
+        if state is not None:
+            with self.lock:
+                self.state = state
+            left = self.resume_point()[1]
+            try:
+                matches = self._rows_match(left)
+            except Exception as e:
+                print(f"⚠️ Could not check the cycle checkpoint against the sheet: {e}")
+                matches = False
+            if matches:
+                with self.lock:
+                    self._save()
+                print(f"📒 Resuming the previous run's {state['stage']} pass ({len(left)} rows left).")
+                return True
+            print("📒 The sheet changed since the previous run's checkpoint; this cycle rescans.")
+        self.clear()
+        return False
+
+
+checkpoint = CycleCheckpoint(CHECKPOINT_PATH)
+
+
+# === ROW SCHEDULING ===
+
+class RowScheduler:
+    """Attempt history for MANUAL rows, so retries back off exponentially.
+
+    A row is keyed by number and URL, so a row that was replaced starts over.
+    After n failed attempts it is next due base * 2**(n-1) seconds later,
+    capped at cap. Rows without history are due with every cycle, but never
+    wake the loop early. The history is the result store's rows table
+    (status, attempts, last_attempt), which write_results and the scan keep
+    current; the JSON file at path only stands in when the store is
+    disabled. Rows leased by another worker are held back until its lease
+    runs out (defer()); that worker holds its failed rows' leases until
+    their next retry, so all workers share one backoff.
+    """
+
+    def __init__(self, path, base, cap):
+        self.path = path
+        self.base = base
+        self.cap = cap
+        self.history = {}
+        self.not_before = {}  # key -> end of another worker's lease
+        if result_store.enabled:
+            return
+        try:
+            with open(path) as f:
+                self.history = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable schedule state {path}: {e}")
+
+    @staticmethod
+    def key(row_num, thread_url):
+        return f"{row_num}|{thread_url}"
+
+    def save(self):
+        if result_store.enabled:
+            return
+        try:
+            write_json_atomic(self.path, self.history)
+        except Exception as e:
+            print(f"⚠️ Could not save schedule state: {e}")
+
+    def entries(self):
+        """{key: {"attempts", "next_due"}} for MANUAL rows with failed attempts."""
+        if not result_store.enabled:
+            return self.history
+        return {
+            self.key(row_num, url): {"attempts": attempts, "next_due": (last or 0) + self.backoff(attempts)}
+            for row_num, url, attempts, last in result_store.manual_rows() if attempts
+        }
+
+    def backoff(self, attempts):
+        return min(self.cap, self.base * 2 ** max(0, attempts - 1))
+
+    def _due_at(self, history, row_num, url):
+        """When a row is next due; 0 for a row without history or hold."""
+        key = self.key(row_num, url)
+        entry = history.get(key)
+        return max(entry["next_due"] if entry else 0, self.not_before.get(key, 0))
+
+    def due_manual_rows(self, manual_rows, now=None):
+        """Due MANUAL rows, least-failed first (most likely to succeed), newest next."""
+        now = now or time.time()
+        history = self.entries()
+        due = []
+        for row_num, url in manual_rows:
+            if self._due_at(history, row_num, url) > now:
+                continue
+            entry = history.get(self.key(row_num, url))
+            due.append((entry["attempts"] if entry else 0, -row_num, row_num, url))
+        due.sort()
+        return [(row_num, url) for _, _, row_num, url in due]
+
+    def next_due(self, manual_rows):
+        """Earliest time a row that is waiting out a backoff or lease becomes due, or None."""
+        history = self.entries()
+        times = [self._due_at(history, row_num, url) for row_num, url in manual_rows]
+        times = [t for t in times if t]
+        return min(times) if times else None
+
+    def due_times(self, rows):
+        """{row: next due time} for rows with a backoff or hold."""
+        history = self.entries()
+        times = {row_num: self._due_at(history, row_num, url) for row_num, url in rows}
+        return {row_num: t for row_num, t in times.items() if t}
+
+    def defer(self, row_num, thread_url, until):
+        """Hold a row back until `until`, when another worker's lease on it ends."""
+        self.not_before[self.key(row_num, thread_url)] = until
+
+    def record_result(self, row_num, thread_url, total_pct):
+        if result_store.enabled:
+            return
+        key = self.key(row_num, thread_url)
+        if total_pct is not None:
+            self.history.pop(key, None)
+            return
+        entry = self.history.setdefault(key, {"attempts": 0, "next_due": 0})
+        entry["attempts"] += 1
+        entry["last_attempt"] = time.time()
+        entry["next_due"] = entry["last_attempt"] + self.backoff(entry["attempts"])
+
+    def prune(self, manual_rows):
+        """Forget rows that are no longer MANUAL in the sheet."""
+        live = {self.key(row_num, url) for row_num, url in manual_rows}
+        now = time.time()
+        self.not_before = {k: t for k, t in self.not_before.items() if k in live and t > now}
+        if result_store.enabled:
+            return  # sync_scan already moved them out of 'manual'.
+        for key in [k for k in self.history if k not in live]:
+            del self.history[key]
+
+    def wait_for_work(self, scanner, manual_rows, max_wait, poll):
+        """Sleep until max_wait passes, new rows appear or a MANUAL retry falls due."""
+        t0 = time.time()
+        next_manual = self.next_due(manual_rows)
+        while True:
+            remaining = max_wait - (time.time() - t0)
+            if remaining <= 0:
+                return "interval"
+            if next_manual is not None and next_manual <= time.time():
+                return "manual retry due"
+            time.sleep(min(poll, remaining))
+            if scanner.has_new_rows():
+                return "new rows"
+
+
+def print_cycle_stats(cache_before):
+    cache_after = commission_cache.stats()
+    hits = cache_after["hits"] - cache_before["hits"]
+    reused = cache_after["reused"] - cache_before["reused"]
+    misses = cache_after["misses"] - cache_before["misses"]
+    print(
+        f"🗃️ Commission cache: {hits} hits ({reused} on rates scraped this cycle) / {misses} misses "
+        f"this cycle ({hits} Amazon page loads saved, {cache_after['size']} ASINs cached)."
+    )
+    replay = sitestripe.stats()
+    if SITESTRIPE_REPLAY:
+        print(
+            f"🎯 SiteStripe replay: {replay['replays']} replayed / {replay['fallbacks']} fell back "
+            f"since start (request {'captured' if replay['captured'] else 'not captured yet'})."
+        )
+    redirects = redirect_resolver.stats()
+    if redirects["hits"] or redirects["misses"]:
+        print(
+            f"🔗 Redirect resolver: {redirects['hits']} cached / {redirects['misses']} followed "
+            f"since start ({redirects['size']} links cached)."
+        )
+    weight = page_weight_summary()
+    if weight:
+        print(weight)
+    if standby is not None:
+        print(f"🛟 Standby Chrome: {standby.promoted} promoted since start, {standby.available()} ready.")
+    pacing = rate_limiter.stats()
+    print("🚦 Rate limiter: " + ", ".join(
+        f"{name} {s['permits']} requests / {s['waited']}s waited" for name, s in pacing.items()
+    ) + " since start.")
+    counts = result_store.status_counts()
+    if counts:
+        print("🗄️ Result store: " + ", ".join(f"{k}={v}" for k, v in sorted(counts.items())) + ".")
+
+
+def run_cycle(pool, scanner, scheduler, resume=None, stages=("commission", "manual")):
+    """Scan, scrape new rows, retry MANUAL rows and flush; returns the MANUAL rows.
+
+    resume is a CycleCheckpoint.resume_point() to finish an interrupted
+    cycle from, without scanning again. stages picks the passes to run
+    (the CLI's retry-manual runs only "manual").
+    """
+    commission_cache.start_cycle()
+    cache_before = commission_cache.stats()
+    if resume is None:
+        print("\n⏳ Starting new cycle: scanning for empty commission cells...")
+        rows_to_process, manual_rows = scanner.scan()
+        result_store.sync_scan(rows_to_process, manual_rows, scanner.window_start)
+        stage, left = "commission", rows_to_process
+        if "commission" in stages:
+            checkpoint.begin("commission", rows_to_process, manual_rows)
+            print(f"\n🔁 Found {len(rows_to_process)} rows needing scraping.")
+    else:
+        stage, left, deferred, manual_rows = resume
+        for row_num in deferred:
+            scanner.record_unfinished(row_num)
+        print(
+            f"\n⏯️ Resuming the {stage} pass with {len(left)} rows left "
+            f"(skipping crashed rows {deferred} until the next cycle)."
+        )
+
+    if stage == "commission":
+        if "commission" not in stages:
+            pass
+        elif left:
+            if write_back(pool, left, "commission", scanner, scheduler):
+                print("✅ Commission rates queued for the sheet.")
+            else:
+                print("✅ No commission rates found this round.")
+        else:
+            print("✅ No new rows to scrape.")
+        scheduler.prune(manual_rows)
+        if "manual" in stages:
+            retry_manual_rows(pool, scanner, scheduler, manual_rows)
+    elif left:
+        retry_manual_rows(pool, scanner, scheduler, manual_rows, due=left)
+
+    # The next scan must see this cycle's results in column I.
+    sheet_writer.drain()
+    scanner.finish_cycle()
+    scheduler.save()
+    checkpoint.clear()
+    print_cycle_stats(cache_before)
+    return sorted(((int(r), u) for r, u in scanner.known_manual().items()), reverse=True)
@@ -0,0 +1,229 @@
+"""Row leases, so several workers can split one backlog."""
+import time, threading, sqlite3
+from contextlib import closing
+
+from .config import (
+    LEASE_COLUMN,
+    LEASE_DB_PATH,
+    LEASE_MODE,
+    LEASE_SETTLE_SECONDS,
+    LEASE_TTL,
+    SHEET_FLUSH_SECONDS,
+    WORKER_ID,
+)
+from .sheets import sheet_api, sheet_writer
+
+
+# === ROW LEASES ===
+
+class SqliteLeaseStore:
+    """Row leases in a SQLite file shared by the workers on one host."""
+
+    def __init__(self, path):
+        self.path = path
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                "row INTEGER PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def claim(self, rows, owner, ttl):
+        """(rows won, {row: expires} of rows another owner holds)."""
+        now = time.time()
+        won, busy = [], {}
+        with closing(self._connect()) as db, db:
+            db.execute("BEGIN IMMEDIATE")
+            for row in rows:
+                held = db.execute("SELECT owner, expires FROM leases WHERE row = ?", (row,)).fetchone()
+                if held and held[0] != owner and held[1] > now:
+                    busy[row] = held[1]
+                    continue
+                db.execute(
+                    "INSERT OR REPLACE INTO leases (row, owner, expires) VALUES (?, ?, ?)",
+                    (row, owner, now + ttl),
+                )
+                won.append(row)
+        return won, busy
+
+    def renew(self, rows, owner, ttl):
+        kept = []
+        with closing(self._connect()) as db, db:
+            for row in rows:
+                cur = db.execute(
+                    "UPDATE leases SET expires = ? WHERE row = ? AND owner = ?",
+                    (time.time() + ttl, row, owner),
+                )
+                if cur.rowcount:
+                    kept.append(row)
+        return kept
+
+    def release(self, rows, owner, linger):
+        with closing(self._connect()) as db, db:
+            db.executemany(
+                "UPDATE leases SET expires = ? WHERE row = ? AND owner = ?",
+                [(time.time() + linger, row, owner) for row in rows],
+            )
+
+    def hold(self, until, owner):
+        with closing(self._connect()) as db, db:
+            db.executemany(
+                "UPDATE leases SET expires = ? WHERE row = ? AND owner = ?",
+                [(expires, row, owner) for row, expires in until.items()],
+            )
+
+
+class SheetLeaseStore:
+    """Row leases as "owner|expires" in a spare sheet column.
+
+    The Sheets API has no compare-and-swap, so a claim writes its lease,
+    waits `settle` seconds and reads the cells back; whoever's value stuck
+    owns the row. Two claims racing inside that window can both win, which
+    costs one duplicate scrape writing the same value.
+    """
+
+    def __init__(self, column, settle):
+        self.column = column
+        self.settle = settle
+
+    def _read(self, rows):
+        values = sheet_api("batch_get", [f"{self.column}{row}" for row in rows])
+        leases = {}
+        for row, value in zip(rows, values):
+            text = str(value[0][0]).strip() if value and value[0] else ""
+            owner, _, expires = text.rpartition("|")
+            try:
+                leases[row] = (owner, float(expires)) if owner else None
+            except ValueError:
+                leases[row] = None
+        return leases
+
+    def _write(self, rows, owner, ttl):
+        value = f"{owner}|{time.time() + ttl:.0f}"
+        sheet_api("batch_update", [{"range": f"{self.column}{row}", "values": [[value]]} for row in rows])
+
+    def claim(self, rows, owner, ttl):
+        """(rows won, {row: expires} of rows another owner holds)."""
+        now = time.time()
+        current = self._read(rows)
+        free = [r for r in rows if not current[r] or current[r][0] == owner or current[r][1] <= now]
+        busy = {r: current[r][1] for r in rows if r not in free}
+        if not free:
+            return [], busy
+        self._write(free, owner, ttl)
+        time.sleep(self.settle)
+        after = self._read(free)
+        won = [r for r in free if after[r] and after[r][0] == owner]
+        busy.update((r, after[r][1] if after[r] else now + ttl) for r in free if r not in won)
+        return won, busy
+
+    def renew(self, rows, owner, ttl):
+        current = self._read(rows)
+        kept = [r for r in rows if current[r] and current[r][0] == owner]
+        if kept:
+            self._write(kept, owner, ttl)
+        return kept
+
+    def release(self, rows, owner, linger):
+        # Cleared in the same batch that writes the rows' results.
+        for row in rows:
+            sheet_writer.put(row, "", column=self.column)
+
+    def hold(self, until, owner):
+        # Replaces a clear release() queued for the same cell.
+        for row, expires in until.items():
+            sheet_writer.put(row, f"{owner}|{expires:.0f}", column=self.column)
+
+
+class LeaseManager(threading.Thread):
+    """Claims rows for this worker and renews the leases until they're done.
+
+    Rows whose lease expired (their worker died or stalled) are claimable
+    again, which is how other containers pick up a dead worker's rows.
+    """
+
+    def __init__(self, store, owner, ttl, linger):
+        super().__init__(name="lease-renewer", daemon=True)
+        self.store = store
+        self.owner = owner
+        self.ttl = ttl
+        self.linger = linger
+        self.held = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def claim(self, rows):
+        """(rows this worker now leases, {row: expires} of rows another worker holds)."""
+        try:
+            won, busy = self.store.claim(rows, self.owner, self.ttl)
+        except Exception as e:
+            print(f"⚠️ Could not claim row leases: {e}")
+            return [], {}
+        with self.lock:
+            self.held.update(won)
+        return won, busy
+
+    def done(self, rows, linger=None):
+        """Stop renewing rows; their leases lapse once the results are visible."""
+        with self.lock:
+            self.held.difference_update(rows)
+        if not rows:
+            return
+        try:
+            self.store.release(rows, self.owner, self.linger if linger is None else linger)
+        except Exception as e:
+            print(f"⚠️ Could not release row leases: {e}")
+
+    def hold(self, until):
+        """Keep finished rows leased until {row: time}, e.g. a failed row's next retry.
+
+        Other workers cannot claim them before then, so a MANUAL row backs
+        off on every worker, not just on the one whose retry failed.
+        """
+        if not until:
+            return
+        try:
+            self.store.hold(until, self.owner)
+        except Exception as e:
+            print(f"⚠️ Could not hold row leases: {e}")
+
+    def run(self):
+        while not self.stopped.wait(self.ttl / 3):
+            with self.lock:
+                rows = sorted(self.held)
+            if not rows:
+                continue
+            try:
+                kept = self.store.renew(rows, self.owner, self.ttl)
+            except Exception as e:
+                print(f"⚠️ Could not renew row leases: {e}")
+                continue
+            lost = set(rows) - set(kept)
+            if lost:
+                # The row is still finished here; the other worker writes the same value.
+                print(f"⚠️ Lost leases on rows {sorted(lost)} to another worker.")
+                with self.lock:
+                    self.held.difference_update(lost)
+
+    def stop(self):
+        self.stopped.set()
+        with self.lock:
+            rows = sorted(self.held)
+        self.done(rows, linger=0)
+
+
+def make_lease_manager():
+    if LEASE_MODE == "sqlite":
+        store = SqliteLeaseStore(LEASE_DB_PATH)
+    elif LEASE_MODE == "sheet":
+        store = SheetLeaseStore(LEASE_COLUMN, LEASE_SETTLE_SECONDS)
+    else:
+        return None
+    # Results reach the sheet within a flush interval; keep finished rows
+    # leased until then so no one re-scrapes them from a stale scan.
+    return LeaseManager(store, WORKER_ID, LEASE_TTL, SHEET_FLUSH_SECONDS + 30)
+
+
+leases = make_lease_manager()
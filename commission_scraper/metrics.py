@@ -0,0 +1,203 @@
+"""Counters, histograms and gauges in the Prometheus text format.
+
+A small registry instead of prometheus_client, so the image needs no extra
+dependency. Nothing is served unless METRICS_PORT is set; recording costs a
+lock and a dict update either way.
+"""
+import math, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # label values -> sample(s)
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {sorted(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """[(name suffix, label values, extra labels, value)] for render()."""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_labels(self.labelnames, key, extra)} {_number(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [("", key, (), v) for key, v in sorted(self.values.items())]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key) or ([0] * len(self.buckets), 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value)
+
+    def samples(self):
+        out = []
+        with self.lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                for bound, n in zip(self.buckets, counts):
+                    out.append(("_bucket", key, (("le", _number(bound)),), n))
+                out.append(("_sum", key, (), round(total, 6)))
+                out.append(("_count", key, (), counts[-1]))
+        return out
+
+
+class Gauge(Metric):
+    """A value that is set, or read from a callback at scrape time.
+
+    A callback returning None (say, a worker without a driver) leaves its
+    sample out; one that raises is skipped the same way.
+    """
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def set_function(self, fn, **labels):
+        self.set(fn, **labels)
+
+    def samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        out = []
+        for key, value in items:
+            if callable(value):
+                try:
+                    value = value()
+                except Exception:
+                    value = None
+            if value is not None:
+                out.append(("", key, (), value))
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def _add(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._add(Gauge(name, help, labelnames))
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics)
+        return "\n".join(line for m in metrics for line in m.render()) + "\n"
+
+
+registry = Registry()
+
+rows_total = registry.counter(
+    "scraper_rows_total", "Rows finished, by outcome (percent, NON-AMAZON, 400 Error, MANUAL, CRASHED).", ["outcome"]
+)
+row_attempts = registry.histogram(
+    "scraper_row_attempts", "Attempts process_row needed per row.", buckets=(1, 2, 3)
+)
+commission_wait = registry.histogram(
+    "scraper_commission_wait_seconds", "Time spent waiting for the SiteStripe widgets per row."
+)
+driver_crashes = registry.counter("scraper_driver_crashes_total", "Chrome workers that hit DriverCrashed.")
+driver_recovery = registry.histogram(
+    "scraper_driver_recovery_seconds", "From a worker's Chrome crash until it has a working driver again.",
+    buckets=(1, 5, 15, 30, 60, 120, 300),
+)
+sheets_latency = registry.histogram(
+    "scraper_sheets_api_seconds", "Google Sheets API call latency, by call.", ["call"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+sheets_errors = registry.counter("scraper_sheets_api_errors_total", "Google Sheets API calls that raised, by call.", ["call"])
+queue_depth = registry.gauge("scraper_queue_depth", "Rows (or sheet cells) waiting in each queue.", ["queue"])
+chrome_memory = registry.gauge(
+    "scraper_chrome_memory_bytes", "Memory of each worker's Chrome process tree (PSS, RSS where PSS is missing).",
+    ["worker"],
+)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port):
+    """Serve /metrics on port from a daemon thread; returns the server."""
+    server = ThreadingHTTPServer(("", port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"📈 Serving metrics on :{port}/metrics")
+    return server
@@ -0,0 +1,502 @@
+"""Chrome workers and the pool that feeds them rows."""
+import time, traceback, queue, threading, atexit
+
+from .config import (
+    AMZ_EMAIL,
+    AMZ_PASS,
+    BROWSER_QUEUE_SIZE,
+    CRASH_COOLDOWN,
+    DEBUG_PORT_BASE,
+    HTTP_FAST_PATH,
+    PIPELINE_DEPTH,
+    RESOLVE_WORKERS,
+    STANDBY_DRIVERS,
+    WORKER_COUNT,
+)
+from .tracing import write_trace
+from .ratelimit import rate_limiter
+from .metrics import chrome_memory, driver_crashes, driver_recovery, queue_depth
+from .browser import (
+    DriverCrashed,
+    driver_memory,
+    ensure_amazon_session,
+    new_driver_with_retries,
+    profile_store,
+    recycle_reason,
+)
+from .scrape import TabPipeline, process_row, resolve_row
+
+
+# === STANDBY DRIVERS ===
+
+class StandbyDrivers(threading.Thread):
+    """Chrome drivers booted and logged in ahead of time, for instant failover.
+
+    Each standby has its own profile slot past the workers'. A worker that
+    needs a new driver takes a ready one and hands back its own slot, and
+    this thread builds the replacement on that slot in the background.
+    """
+
+    def __init__(self, count, first_slot):
+        super().__init__(name="chrome-standby", daemon=True)
+        self.count = count
+        self.free_slots = [first_slot + i for i in range(count)]
+        self.ready = []  # [(slot, driver)]
+        self.promoted = 0
+        self.stopping = False
+        self.cond = threading.Condition()
+
+    def take(self, give_slot):
+        """A ready (slot, driver), with give_slot handed back for rebuilding; None if none is ready.
+
+        The caller must have quit the driver on give_slot already.
+        """
+        while True:
+            with self.cond:
+                if not self.ready:
+                    return None
+                slot, driver = self.ready.pop(0)
+            try:
+                driver.current_url  # Chrome may have died while it idled.
+            except Exception as e:
+                print(f"⚠️ Standby Chrome on slot {slot} is dead, discarding it: {e}")
+                self._quit(driver)
+                with self.cond:
+                    self.free_slots.append(slot)
+                    self.cond.notify_all()
+                continue
+            with self.cond:
+                self.free_slots.append(give_slot)
+                self.promoted += 1
+                self.cond.notify_all()
+            return slot, driver
+
+    def available(self):
+        with self.cond:
+            return len(self.ready)
+
+    def _build(self, slot):
+        t0 = time.time()
+        try:
+            driver = new_driver_with_retries(debug_port=DEBUG_PORT_BASE + slot, slot=slot)
+        except DriverCrashed as e:
+            print(f"❌ Standby slot {slot}: could not start Chrome: {e}")
+            return None
+        try:
+            if ensure_amazon_session(driver, AMZ_EMAIL, AMZ_PASS):
+                print(f"🛟 Standby Chrome ready on slot {slot} in {time.time() - t0:.1f}s.")
+                return driver
+            print(f"❌ Standby slot {slot}: could not establish Amazon session.")
+        except Exception as e:
+            print(f"❌ Standby slot {slot}: error during login automation: {e}")
+        self._quit(driver)
+        return None
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.stopping and not self.free_slots:
+                    self.cond.wait()
+                if self.stopping:
+                    return
+                slot = self.free_slots.pop(0)
+            driver = self._build(slot)
+            with self.cond:
+                if driver is None:
+                    self.free_slots.append(slot)
+                elif self.stopping:
+                    self._quit(driver)
+                else:
+                    self.ready.append((slot, driver))
+                    continue
+                # Don't hammer a Chrome that won't start; wait out the cool-down.
+                self.cond.wait(CRASH_COOLDOWN)
+
+    def stop(self):
+        with self.cond:
+            self.stopping = True
+            ready, self.ready = self.ready, []
+            self.cond.notify_all()
+        for _, driver in ready:
+            self._quit(driver)
+
+
+standby = StandbyDrivers(STANDBY_DRIVERS, WORKER_COUNT) if STANDBY_DRIVERS else None
+
+
+# === WORKER POOL ===
+
+# Result handed back for a row whose worker crashed twice on it; the cell is
+# left empty so the next cycle picks it up again.
+CRASH_SKIPPED = object()
+
+
+class LinkResolver(threading.Thread):
+    """Stage one: resolves rows from `links` over HTTP for the Chrome workers.
+
+    Rows the thread page settles on its own go straight to `results`; the
+    rest go to `tasks` with the Link found. tasks is bounded, so resolvers
+    stay at most that many rows ahead of Chrome. Rows requeued after a crash
+    pass straight through.
+    """
+
+    def __init__(self, resolver_id, links, tasks, results):
+        super().__init__(name=f"link-resolver-{resolver_id}", daemon=True)
+        self.resolver_id = resolver_id
+        self.links = links
+        self.tasks = tasks
+        self.results = results
+        self.settled = 0
+
+    def run(self):
+        while True:
+            item = self.links.get()
+            if item is None:
+                return
+            seq, row_num, thread_url, crashes, link = item
+            if link is None and not crashes:
+                try:
+                    done, link = resolve_row(row_num, thread_url)
+                except Exception as e:
+                    print(f"⚠️ Resolver {self.resolver_id}: row {row_num} left to Chrome: {e}")
+                    done, link = False, None
+                if done:
+                    self.settled += 1
+                    self.results.put((seq, row_num, link))
+                    continue
+            self.tasks.put((seq, row_num, thread_url, crashes, link))
+
+
+class ChromeWorker(threading.Thread):
+    """One Chrome driver pulling rows from the shared task queue.
+
+    Rows a crash interrupted go back through `requeue`: the resolvers' queue
+    when there are resolvers (tasks is bounded, and only Chrome workers empty
+    it), else tasks itself.
+    """
+
+    def __init__(self, worker_id, tasks, results, requeue=None, slot=None):
+        super().__init__(name=f"chrome-worker-{worker_id}", daemon=True)
+        self.worker_id = worker_id
+        self.tasks = tasks
+        self.results = results
+        self.requeue = requeue or tasks
+        # What a new row usually requests first: resolved rows open on Amazon.
+        self.first_domain = "slickdeals" if requeue is None else "amazon"
+        chrome_memory.set_function(lambda: driver_memory(self.driver) if self.driver else None, worker=worker_id)
+        # Profile slot (and debug port offset); changes when a standby is promoted.
+        self.slot = worker_id if slot is None else slot
+        self.driver = None
+        self.ready = threading.Event()
+        self.alive = False
+        self.crashed_rows = []
+
+    def _promote_standby(self):
+        """Swap in a ready standby driver; the current one must be quit."""
+        if standby is None:
+            return False
+        taken = standby.take(self.slot)
+        if not taken:
+            return False
+        self.slot, self.driver = taken
+        print(f"🛟 Worker {self.worker_id}: promoted the standby Chrome on slot {self.slot}.")
+        write_trace({"type": "failover", "worker": self.worker_id, "slot": self.slot, "start": round(time.time(), 3)})
+        return True
+
+    def _boot(self):
+        if self._promote_standby():
+            return True
+        try:
+            self.driver = new_driver_with_retries(debug_port=DEBUG_PORT_BASE + self.slot, slot=self.slot)
+        except DriverCrashed as e:
+            print(f"❌ Worker {self.worker_id}: could not start Chrome: {e}")
+            return False
+
+        try:
+            if ensure_amazon_session(self.driver, AMZ_EMAIL, AMZ_PASS):
+                return True
+            print(f"❌ Worker {self.worker_id}: could not establish Amazon session.")
+        except Exception as e:
+            print(f"❌ Worker {self.worker_id}: error during login automation: {e}")
+        self._quit()
+        return False
+
+    def _quit(self):
+        try:
+            if self.driver:
+                self.driver.quit()
+        except Exception:
+            pass
+        self.driver = None
+
+    def _restart(self):
+        self._quit()
+        if self._promote_standby():
+            return True
+        print(f"⏳ Worker {self.worker_id}: cool-down {CRASH_COOLDOWN}s before restarting Chrome...")
+        time.sleep(CRASH_COOLDOWN)
+        return self._boot()
+
+    def _maybe_recycle(self):
+        """Planned restart between rows, before leaks turn into a crash mid-row."""
+        try:
+            reason = recycle_reason(self.driver)
+        except Exception:
+            reason = None
+        if not reason:
+            return
+        t0 = time.time()
+        print(f"♻️ Worker {self.worker_id}: recycling Chrome ({reason}).")
+        try:
+            # Fresh cookies for the new driver to restore without a login.
+            profile_store.save_session(self.driver)
+        except Exception:
+            pass
+        self._quit()
+        if self._boot() or self._restart():
+            print(f"♻️ Worker {self.worker_id}: Chrome recycled in {time.time() - t0:.1f}s.")
+            write_trace({
+                "type": "recycle", "worker": self.worker_id, "reason": reason,
+                "start": round(t0, 3), "duration": round(time.time() - t0, 3),
+            })
+            return
+        print(f"❌ Worker {self.worker_id}: could not restart Chrome after recycling, retiring.")
+        self.alive = False
+
+    def _crashed(self, items, e):
+        """Requeue rows a crash interrupted (or give up on them), then restart Chrome."""
+        self.crashed_rows = [item[1] for item in items]
+        print(f"💥 Worker {self.worker_id} crashed at rows {self.crashed_rows}: {e}")
+        driver_crashes.inc()
+        t0 = time.time()
+        for seq, row_num, thread_url, crashes, link in items:
+            if crashes + 1 >= 2:
+                self.results.put((seq, row_num, CRASH_SKIPPED))
+            else:
+                # Hand the row back so this or another worker retries it.
+                self.requeue.put((seq, row_num, thread_url, crashes + 1, link.retry() if link else None))
+        if not self._restart():
+            print(f"❌ Worker {self.worker_id}: could not recover WebDriver, retiring.")
+            self.alive = False
+            return
+        driver_recovery.observe(time.time() - t0)
+
+    def run(self):
+        self.alive = self._boot()
+        self.ready.set()
+        if PIPELINE_DEPTH > 1:
+            self.run_pipelined()
+            self._quit()
+            return
+
+        while self.alive:
+            item = self.tasks.get()
+            if item is None:
+                break
+            seq, row_num, thread_url, crashes, link = item
+
+            try:
+                total_pct = process_row(self.driver, row_num, thread_url, link)
+            except DriverCrashed as e:
+                self._crashed([item], e)
+                continue
+            except Exception as e:
+                print(f"❌ Worker {self.worker_id}: unexpected error at row {row_num}: {e}")
+                traceback.print_exc()
+                total_pct = None
+
+            self.results.put((seq, row_num, total_pct))
+            self._maybe_recycle()
+
+        self._quit()
+
+    def _put_finished(self, finished):
+        for item, total_pct in finished:
+            seq, row_num = item[:2]
+            self.results.put((seq, row_num, total_pct))
+
+    def run_pipelined(self):
+        """Like run(), with up to PIPELINE_DEPTH rows in flight in separate tabs."""
+        pipeline = TabPipeline(self.driver, PIPELINE_DEPTH)
+        stopping = False
+        recycle_due = False
+        while self.alive and not (stopping and not pipeline.tasks):
+            try:
+                if recycle_due and not pipeline.tasks:
+                    # Every tab has finished: the row boundary for all of them.
+                    recycle_due = False
+                    self._maybe_recycle()
+                    if not self.alive:
+                        break
+                    pipeline = TabPipeline(self.driver, PIPELINE_DEPTH)
+                # Start a new row only once the limiter would let its first
+                # request through.
+                pacing = rate_limiter.delay(self.first_domain)
+                while not (stopping or recycle_due) and pipeline.has_room() and not pacing:
+                    try:
+                        # Block only when there is nothing else to do.
+                        item = self.tasks.get(block=not pipeline.tasks, timeout=None)
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    pipeline.start(item)
+                    pacing = rate_limiter.delay(self.first_domain)
+                if pacing and not pipeline.tasks:
+                    time.sleep(pacing)
+                finished = pipeline.tick()
+                self._put_finished(finished)
+                if finished and not recycle_due:
+                    # Stop taking rows and let the tabs in flight finish first.
+                    recycle_due = recycle_reason(self.driver) is not None
+            except DriverCrashed as e:
+                self._put_finished(pipeline.take_finished())
+                self._crashed(pipeline.abandon(), e)
+                if self.alive:
+                    pipeline = TabPipeline(self.driver, PIPELINE_DEPTH)
+            except Exception as e:
+                print(f"❌ Worker {self.worker_id}: unexpected pipeline error: {e}")
+                traceback.print_exc()
+                self._put_finished(pipeline.take_finished())
+                for seq, row_num, *_ in pipeline.abandon("MANUAL"):
+                    self.results.put((seq, row_num, None))
+
+
+class WorkerPool:
+    """Rows streamed through LinkResolvers, then a fixed set of ChromeWorkers.
+
+    Rows go in through map_rows(), results come back out in submission order
+    so the sheet write-back stays a single ordered path on the main thread
+    (the SheetWriter batches it from there). The two stages run side by side:
+    resolvers settle what they can over HTTP while Chrome reads commissions,
+    and the bounded queue between them holds the resolvers back when Chrome
+    is the bottleneck. Chrome starts with the first rows unless start() was
+    called before, so a cycle with nothing to scrape never boots a browser.
+    """
+
+    def __init__(self, size, resolvers=RESOLVE_WORKERS):
+        self.size = size
+        self.resolver_count = resolvers if HTTP_FAST_PATH else 0
+        self.links = queue.Queue()
+        # Bounded only behind resolvers; without them map_rows fills it directly.
+        self.tasks = queue.Queue(max(size, BROWSER_QUEUE_SIZE) if self.resolver_count else 0)
+        self.results = queue.Queue()
+        self.workers = []
+        self.resolvers = []
+        # Each worker's profile slot. A promoted standby swaps a worker onto
+        # another slot and the standby thread owns the old one, so restarts
+        # carry the slots over instead of starting again from worker ids.
+        self.slots = list(range(size))
+        # Rows are tagged (generation, index): results of rows still in flight
+        # when an earlier map_rows call was abandoned are dropped by the next.
+        self.generation = 0
+        queue_depth.set_function(self.links.qsize, queue="resolve")
+        queue_depth.set_function(self.tasks.qsize, queue="browser")
+        queue_depth.set_function(self.results.qsize, queue="results")
+
+    def start(self):
+        requeue = self.links if self.resolver_count else None
+        # Resolvers first, so they work through queued rows while Chrome boots.
+        self.resolvers = [
+            LinkResolver(rid, self.links, self.tasks, self.results) for rid in range(self.resolver_count)
+        ]
+        for r in self.resolvers:
+            r.start()
+        self.workers = [
+            ChromeWorker(wid, self.tasks, self.results, requeue, slot=self.slots[wid]) for wid in range(self.size)
+        ]
+        for w in self.workers:
+            w.start()
+        for w in self.workers:
+            w.ready.wait()
+
+        alive = sum(1 for w in self.workers if w.alive)
+        if not alive:
+            raise DriverCrashed("No Chrome worker could start.")
+        print(f"👷 {alive}/{self.size} Chrome workers ready, {self.resolver_count} link resolvers.")
+        if standby is not None and not standby.is_alive():
+            # Only now, so standbys don't compete with the workers' own boot.
+            print(f"🛟 Building {standby.count} standby Chrome driver(s) in the background.")
+            standby.start()
+            atexit.register(standby.stop)
+
+    def any_alive(self):
+        return any(w.alive and w.is_alive() for w in self.workers)
+
+    def settled(self):
+        """Rows the resolvers finished without Chrome since the pool started."""
+        return sum(r.settled for r in self.resolvers)
+
+    def map_rows(self, rows):
+        """Process (row_num, url) pairs; yield (row_num, url, result) in input order."""
+        self.generation += 1
+        generation = self.generation
+        inbox = self.links if self.resolver_count else self.tasks
+        for index, (row_num, thread_url) in enumerate(rows):
+            inbox.put(((generation, index), row_num, thread_url, 0, None))
+
+        done = {}
+        next_seq = 0
+        try:
+            if rows and not self.workers:
+                self.start()
+            while next_seq < len(rows):
+                try:
+                    seq, row_num, total_pct = self.results.get(timeout=5)
+                except queue.Empty:
+                    if not self.any_alive():
+                        err = DriverCrashed("All Chrome workers are down.")
+                        # The rows the last crashes happened on, so a resume can skip them.
+                        err.rows = sorted({r for w in self.workers for r in w.crashed_rows})
+                        raise err
+                    continue
+                if seq[0] != generation:
+                    continue
+                done[seq[1]] = (row_num, rows[seq[1]][1], total_pct)
+                while next_seq in done:
+                    yield done.pop(next_seq)
+                    next_seq += 1
+        finally:
+            self._drain_tasks()
+
+    def _drain_tasks(self):
+        for q in (self.links, self.tasks):
+            try:
+                while True:
+                    q.get_nowait()
+            except queue.Empty:
+                pass
+
+    def shutdown(self):
+        self._drain_tasks()
+        for _ in self.resolvers:
+            self.links.put(None)
+        for r in self.resolvers:
+            # It may be blocked handing a row to the full browser queue.
+            while r.is_alive():
+                try:
+                    self.tasks.get_nowait()
+                except queue.Empty:
+                    pass
+                r.join(timeout=0.5)
+        self.resolvers = []
+        self._drain_tasks()
+        for w in self.workers:
+            if w.is_alive():
+                self.tasks.put(None)
+        for w in self.workers:
+            w.join(timeout=30)
+            self.slots[w.worker_id] = w.slot
+        self.workers = []
+
+    def restart(self):
+        self.shutdown()
+        self.start()
@@ -0,0 +1,128 @@
+"""Per-domain request pacing: callers take a permit before each request."""
+import time, random, threading
+from urllib.parse import urlparse
+
+from .config import RATE_LIMITS
+from .tracing import row_phase
+
+# Hosts each bucket covers; a bare name ("amazon") selects the bucket directly.
+DOMAIN_HOSTS = {
+    "slickdeals": ("slickdeals.net",),
+    "amazon": ("amazon.com",),
+    "sheets": ("sheets.googleapis.com",),
+}
+
+# (rate, burst, jitter) per domain, shared by all workers however many there
+# are: the single scraper's old 0.8-1.6 s + 0.6-1.2 s spacing between thread
+# loads, so each site sees the same load. Sheets stays inside the 60
+# requests/minute API quota.
+DEFAULT_LIMITS = {
+    "slickdeals": (0.5, 1, 0.6),
+    "amazon": (1.0, 2, 0.3),
+    "sheets": (1.0, 5, 0.0),
+}
+
+
+def parse_rate_limits(spec, defaults=DEFAULT_LIMITS):
+    """defaults overridden by "name=rate:burst:jitter,..." (burst and jitter optional)."""
+    limits = dict(defaults)
+    for part in spec.split(","):
+        name, _, values = part.partition("=")
+        name = name.strip().lower()
+        if not name or not values.strip():
+            continue
+        fields = [float(v) for v in values.split(":")]
+        rate, burst, jitter = fields + list(limits.get(name, (0, 1, 0)))[len(fields):]
+        limits[name] = (rate, burst, jitter)
+    return limits
+
+
+class TokenBucket:
+    """`rate` permits a second, up to `burst` saved up while idle.
+
+    Taking a permit never blocks under the lock: reserve() books the next
+    free slot and returns how long the caller has to wait for it, plus up to
+    `jitter` random seconds so requests do not land on a fixed beat.
+    """
+
+    def __init__(self, rate, burst, jitter):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.jitter = jitter
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return wait + random.uniform(0, self.jitter)
+
+    def delay(self):
+        """Seconds until a permit is free, without taking one."""
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            self._refill(time.monotonic())
+            return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    """One TokenBucket per domain, shared by every worker thread.
+
+    acquire() takes a name from DOMAIN_HOSTS or a URL; URLs on hosts no bucket
+    covers (redirectors, CDNs) are not paced. Waits are timed against the
+    current row as "rate_wait" so trace_report shows what pacing costs.
+    """
+
+    def __init__(self, limits):
+        self.buckets = {name: TokenBucket(*spec) for name, spec in limits.items()}
+        self.lock = threading.Lock()
+        self.permits = dict.fromkeys(self.buckets, 0)
+        self.waited = dict.fromkeys(self.buckets, 0.0)
+
+    def domain_for(self, target):
+        if target in self.buckets:
+            return target
+        host = urlparse(target or "").netloc.lower().split(":")[0]
+        for name, suffixes in DOMAIN_HOSTS.items():
+            if name in self.buckets and any(host == s or host.endswith("." + s) for s in suffixes):
+                return name
+        return None
+
+    def acquire(self, target):
+        """Wait for a permit to send one request to target's domain."""
+        name = self.domain_for(target)
+        if name is None:
+            return 0.0
+        wait = self.buckets[name].reserve()
+        if wait > 0:
+            with row_phase("rate_wait"):
+                time.sleep(wait)
+        with self.lock:
+            self.permits[name] += 1
+            self.waited[name] += wait
+        return wait
+
+    def delay(self, target):
+        """How long acquire(target) would wait right now (jitter aside)."""
+        name = self.domain_for(target)
+        return self.buckets[name].delay() if name else 0.0
+
+    def stats(self):
+        with self.lock:
+            return {
+                name: {"permits": self.permits[name], "waited": round(self.waited[name], 1)}
+                for name in self.buckets
+            }
+
+
+rate_limiter = RateLimiter(parse_rate_limits(RATE_LIMITS))
@@ -0,0 +1,555 @@
+"""Scraping one row, serially or pipelined through several tabs."""
+import time
+
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import NoSuchWindowException, TimeoutException, WebDriverException
+
+from .config import AMZ_EMAIL, AMZ_PASS, HTTP_FAST_PATH, PIPELINE_TICK
+from .tracing import RowTrace, row_phase, trace_outcome, tracing
+from .ratelimit import rate_limiter
+from .metrics import commission_wait, row_attempts, rows_total
+from .state import commission_cache, result_store
+from .browser import (
+    DriverCrashed,
+    apply_block_profile,
+    ensure_amazon_session,
+    ensure_on_amazon,
+    is_driver_connection_error,
+    measure_page,
+    profile_store,
+    read_performance_log,
+    safe_close_extra_tabs,
+)
+from .commission import (
+    extract_rate,
+    format_commission,
+    get_commission_texts,
+    known_commission,
+    sitestripe,
+)
+from .threads import (
+    any_visible,
+    asin_from_url,
+    best_fallback_url,
+    collect_candidates,
+    find_amazon_url_http,
+    find_amazon_url_or_click,
+    resolve_outclick_url,
+    url_from_ctas,
+)
+
+
+def finish_row(trace, outcome):
+    """Write the row's trace record, count it, and keep what it learned in the result store."""
+    trace.finish(outcome)
+    rows_total.inc(outcome=outcome)
+    if trace.attempts:
+        row_attempts.observe(trace.attempts)
+    if "widget_wait" in trace.phases:
+        commission_wait.observe(trace.phases["widget_wait"])
+    result_store.observe(trace, outcome)
+
+
+# === STAGE ONE: THREAD TO AMAZON URL ===
+
+class Link:
+    """What the resolve stage found for a row, on its way to a Chrome worker.
+
+    url is the Amazon URL read from the thread over HTTP, or "" when only a
+    real browser can find it. trace is the row's RowTrace so far; a row
+    requeued after a crash gets a fresh one.
+    """
+
+    def __init__(self, url, trace):
+        self.url = url
+        self.trace = trace
+        self.queued = time.time()
+
+    def retry(self):
+        return Link(self.url, None)
+
+
+def resolve_row(row_num, thread_url):
+    """The browser-free part of a row: (True, result) or (False, Link).
+
+    The thread page alone settles 400 pages, non-Amazon outclicks and ASINs
+    whose rates are cached or can be replayed; everything else needs Chrome.
+    """
+    trace = RowTrace(row_num, thread_url)
+    trace.attempts = 1
+    total_pct = None
+    with tracing(trace):
+        with row_phase("thread_http"):
+            url_hint = find_amazon_url_http(thread_url)
+        if url_hint == "400 Error":
+            print("400 Error")
+            total_pct = "400 Error"
+        elif url_hint and "amazon." not in url_hint.lower():
+            print("ℹ️ Direct outclick is non-Amazon, skipping commission.")
+            total_pct = "NON-AMAZON"
+        elif url_hint:
+            trace.asin = asin_from_url(url_hint)
+            trace.amazon_url = url_hint
+            # No claim: the Chrome worker that takes the row claims the ASIN.
+            known = known_commission(trace.asin, trace, claim=False)
+            if known:
+                total_pct = format_commission(*known)
+    if total_pct is None:
+        return False, Link(url_hint or "", trace)
+    finish_row(trace, trace_outcome(total_pct))
+    return True, total_pct
+
+
+def trace_for(row_num, thread_url, link):
+    """The row's trace: carried over from the resolve stage, or a new one."""
+    if link is None or link.trace is None:
+        return RowTrace(row_num, thread_url)
+    link.trace.phases["browser_queue"] = round(time.time() - link.queued, 3)
+    return link.trace
+
+
+# === STAGE TWO: COMMISSION IN CHROME ===
+
+def process_row(driver, row_num, thread_url, link=None):
+    trace = trace_for(row_num, thread_url, link)
+    try:
+        with tracing(trace):
+            total_pct = scrape_row(driver, row_num, thread_url, trace, link.url if link else None)
+    except DriverCrashed:
+        finish_row(trace, "CRASHED")
+        raise
+    finally:
+        commission_cache.release_claims()
+    finish_row(trace, trace_outcome(total_pct))
+    return total_pct
+
+
+def scrape_row(driver, row_num, thread_url, trace, resolved=None, claim=True):
+    """Scrape one row in driver; resolved is the resolve stage's Link.url, if it ran.
+
+    claim=False looks ASINs up without waiting on another worker's claim, for
+    callers (the tab pipeline) that must not stall on a single row.
+    """
+    attempts = 2
+    relogin_done = False
+
+    for attempt in range(1, attempts + 1):
+        trace.attempts = attempt
+        try:
+            print(f"\n➡ Row {row_num} attempt {attempt} → {thread_url}")
+            url_hint, tab_tuple = (resolved if attempt == 1 else None), None
+            if url_hint is None and HTTP_FAST_PATH and attempt == 1:
+                with row_phase("thread_http"):
+                    url_hint = find_amazon_url_http(thread_url)
+                if url_hint == "400 Error":
+                    print("400 Error")
+                    return "400 Error"
+
+            if not url_hint:
+                rate_limiter.acquire(thread_url)
+                with row_phase("thread_get"):
+                    driver.get(thread_url)
+                measure_page(driver, row_num, "thread")
+
+                try:
+                    err = driver.find_element(By.CSS_SELECTOR, "h2.errorPage__headline")
+                    if "400 Error" in err.text:
+                        print("400 Error")
+                        return "400 Error"
+                except Exception:
+                    pass
+
+                with row_phase("find_cta"):
+                    url_hint, tab_tuple = find_amazon_url_or_click(driver)
+
+            if url_hint:
+                if "amazon." not in url_hint.lower():
+                    print("ℹ️ Direct outclick is non-Amazon, skipping commission.")
+                    return "NON-AMAZON"
+                asin = asin_from_url(url_hint)
+                trace.asin = asin
+                trace.amazon_url = url_hint
+                # The resolve stage already tried a replay for this URL.
+                known = known_commission(asin, trace, claim=claim, replay=not resolved)
+                if known:
+                    return format_commission(*known)
+                try:
+                    rate_limiter.acquire(url_hint)
+                    with row_phase("amazon_get"):
+                        driver.set_page_load_timeout(60)
+                        driver.get(url_hint)
+                except TimeoutException:
+                    print("⏱️ Timeout navigating to Amazon direct link")
+            else:
+                orig, newh = tab_tuple
+                if newh:
+                    try:
+                        driver.switch_to.window(newh)
+                        apply_block_profile(driver)
+                    except Exception:
+                        pass
+
+                with row_phase("ensure_on_amazon"):
+                    arrived = ensure_on_amazon(driver, 25)
+                if not arrived:
+                    try:
+                        cur = driver.current_url.lower()
+                    except Exception:
+                        cur = ""
+                    if (
+                        "amazon." not in cur
+                        and "slickdeals" not in cur
+                        and cur
+                    ):
+                        print(
+                            "ℹ️ Outclick goes to non-Amazon store, skipping commission."
+                        )
+                        if tab_tuple[0]:
+                            safe_close_extra_tabs(driver, tab_tuple[0])
+                        return "NON-AMAZON"
+                    print("❌ Did not arrive on Amazon after outclick")
+                    if tab_tuple[0]:
+                        safe_close_extra_tabs(driver, tab_tuple[0])
+                    continue
+
+            with row_phase("ensure_on_amazon"):
+                arrived = ensure_on_amazon(driver, 10)
+            if not arrived:
+                print("❌ Not on Amazon")
+                continue
+
+            current_product_url = driver.current_url
+            trace.asin = asin_from_url(current_product_url) or trace.asin
+            trace.amazon_url = current_product_url
+            print(f"✅ On Amazon: {current_product_url[:140]}")
+            if not url_hint:
+                # Only known now that the outclick landed; skip the widget wait if
+                # the rates are already known or can be replayed.
+                known = known_commission(trace.asin, trace, claim=claim)
+                if known:
+                    return format_commission(*known)
+
+            with row_phase("widget_wait"):
+                base_text, bonus_text = get_commission_texts(driver, max_wait=50)
+            if not base_text and not bonus_text and not relogin_done:
+                print("🔄 No commission widgets seen, verifying Amazon session...")
+                with row_phase("relogin"):
+                    profile_store.invalidate()
+                    logged_in = ensure_amazon_session(driver, AMZ_EMAIL, AMZ_PASS, trust_saved=False)
+                    if logged_in:
+                        relogin_done = True
+                        sitestripe.refresh_cookies(driver)
+                        rate_limiter.acquire(current_product_url)
+                        driver.get(current_product_url)
+                if logged_in:
+                    with row_phase("widget_wait"):
+                        base_text, bonus_text = get_commission_texts(
+                            driver, max_wait=40
+                        )
+
+            messages = read_performance_log(driver)
+            measure_page(driver, row_num, "amazon", messages)
+            if not base_text and not bonus_text:
+                print("❌ Commission widgets not found")
+                continue
+
+            base_value = extract_rate(base_text)
+            bonus_value = extract_rate(bonus_text)
+            asin = asin_from_url(current_product_url) or asin_from_url(url_hint)
+            sitestripe.learn(driver, messages, asin, base_text, bonus_text)
+            commission_cache.put(asin, base_value, bonus_value)
+            return format_commission(base_value, bonus_value)
+
+        except (NoSuchWindowException, WebDriverException) as e:
+            print(f"💥 Browser error: {e}")
+            if is_driver_connection_error(e):
+                print("💥 Detected WebDriver connection crash (NoSuchWindow/WebDriverException).")
+                raise DriverCrashed(str(e))
+            time.sleep(2)
+            continue
+
+        except Exception as e:
+            print(f"❌ Unexpected error row {row_num}: {e}")
+            if is_driver_connection_error(e):
+                print("💥 Detected WebDriver connection crash (HTTPConnectionPool/DevTools/etc).")
+                raise DriverCrashed(str(e))
+            time.sleep(2)
+            continue
+
+    return None
+
+
+# === MULTI-TAB PIPELINE ===
+
+# One round trip per tab per tick: load state, URL, 400 page and SiteStripe
+# texts from the document or its first same-origin iframes.
+JS_TAB_STATUS = r"""
+function texts(doc) {
+  const b = doc.getElementById('amzn-ss-commission-rate-content');
+  const c = doc.getElementById('amzn-ss-cc-rate');
+  return [b ? b.textContent.trim() : '', c ? c.textContent.trim() : ''];
+}
+let rates = texts(document);
+if (!rates[0] && !rates[1]) {
+  for (const fr of Array.from(document.querySelectorAll('iframe')).slice(0, 6)) {
+    try {
+      if (!fr.contentDocument) continue;
+      const r = texts(fr.contentDocument);
+      if (r[0] || r[1]) { rates = r; break; }
+    } catch (e) {}
+  }
+}
+const err = document.querySelector('h2.errorPage__headline');
+return {
+  ready: document.readyState,
+  url: location.href,
+  base: rates[0],
+  bonus: rates[1],
+  error400: !!(err && err.textContent.indexOf('400 Error') >= 0),
+};
+"""
+
+THREAD_TAB_TIMEOUT = 45
+ARRIVAL_TIMEOUT = 25
+WIDGET_TIMEOUT = 50
+
+
+class TabTask:
+    """One row in flight in its own tab.
+
+    States: "thread" while the thread page loads, "amazon" while the product
+    page loads and SiteStripe renders. Time spent in each state is recorded
+    as the row's thread_get / widget_wait phase.
+    """
+
+    PHASES = {"thread": "thread_get", "amazon": "widget_wait"}
+
+    def __init__(self, item):
+        self.item = item
+        self.seq, self.row_num, self.thread_url, self.crashes, self.link = item
+        self.trace = trace_for(self.row_num, self.thread_url, self.link)
+        self.trace.attempts = 1
+        self.handle = None
+        self.state = None
+        self.since = time.time()
+        self.deadline = None
+        self.arrived = False
+        self.serial_tried = False
+
+    def enter(self, state, timeout):
+        self._close_phase()
+        self.state = state
+        self.since = time.time()
+        self.deadline = self.since + timeout
+
+    def _close_phase(self):
+        phase = self.PHASES.get(self.state)
+        if phase:
+            elapsed = time.time() - self.since
+            self.trace.phases[phase] = round(self.trace.phases.get(phase, 0.0) + elapsed, 3)
+
+    def expired(self):
+        return time.time() > self.deadline
+
+
+class TabPipeline:
+    """Keeps up to `depth` rows in flight in separate tabs of one driver.
+
+    WebDriver drives one tab at a time, but pages keep loading and SiteStripe
+    keeps rendering in the others, so a tick visits each tab with a single
+    status probe and advances whichever is ready. Anything off the common
+    path (outclicks that need a click, missing widgets, relogin, odd errors)
+    finishes on the serial scrape_row in that row's tab.
+    """
+
+    def __init__(self, driver, depth):
+        self.driver = driver
+        self.depth = depth
+        self.tasks = []
+        self.home = driver.current_window_handle
+        self.finished = []
+        self._pin()
+
+    def _pin(self):
+        self.driver.pinned_tabs = {self.home} | {t.handle for t in self.tasks if t.handle}
+
+    def has_room(self):
+        return len(self.tasks) < self.depth
+
+    def in_flight(self):
+        return [t.item for t in self.tasks]
+
+    def _open_tab(self, task, url):
+        self.driver.switch_to.new_window("tab")
+        task.handle = self.driver.current_window_handle
+        self._pin()
+        apply_block_profile(self.driver)
+        self._navigate(url)
+
+    def _navigate(self, url):
+        # Returns at once; the tab loads while the pipeline works on others.
+        rate_limiter.acquire(url)
+        self.driver.execute_script("window.location.href = arguments[0];", url)
+        self.driver.pages_loaded = getattr(self.driver, "pages_loaded", 0) + 1
+
+    def start(self, item):
+        """Begin a row: HTTP fast path first, then a tab for whatever is left."""
+        task = TabTask(item)
+        self.tasks.append(task)
+        print(f"\n➡ Row {task.row_num} (pipelined) → {task.thread_url}")
+        with tracing(task.trace):
+            try:
+                url_hint = task.link.url if task.link else None
+                if url_hint is None and HTTP_FAST_PATH:
+                    with row_phase("thread_http"):
+                        url_hint = find_amazon_url_http(task.thread_url)
+                if url_hint:
+                    self._go_amazon(task, url_hint)
+                else:
+                    self._open_tab(task, task.thread_url)
+                    task.enter("thread", THREAD_TAB_TIMEOUT)
+            except DriverCrashed:
+                raise
+            except Exception as e:
+                self._on_error(task, e)
+
+    def _go_amazon(self, task, url):
+        if url == "400 Error":
+            print("400 Error")
+            return self._finish(task, "400 Error")
+        if "amazon." not in url.lower():
+            print("ℹ️ Direct outclick is non-Amazon, skipping commission.")
+            return self._finish(task, "NON-AMAZON")
+        task.trace.asin = asin_from_url(url)
+        task.trace.amazon_url = url
+        # No claim: waiting on another worker's claim here would stall every tab.
+        replay = not (task.link and task.link.url)
+        known = known_commission(task.trace.asin, task.trace, claim=False, replay=replay)
+        if known:
+            return self._finish(task, format_commission(*known))
+        if task.handle:
+            self.driver.switch_to.window(task.handle)
+            self._navigate(url)
+        else:
+            self._open_tab(task, url)
+        task.enter("amazon", ARRIVAL_TIMEOUT + WIDGET_TIMEOUT)
+
+    def tick(self):
+        """Visit every tab once; return [(item, total_pct)] for finished rows."""
+        for task in list(self.tasks):
+            with tracing(task.trace):
+                try:
+                    self._step(task)
+                except DriverCrashed:
+                    raise
+                except Exception as e:
+                    self._on_error(task, e)
+        finished = self.take_finished()
+        if not finished and self.tasks:
+            time.sleep(PIPELINE_TICK)
+        return finished
+
+    def take_finished(self):
+        """[(item, total_pct)] for rows finished since the last call.
+
+        Also called after a crash: rows that finished earlier in the same tick,
+        or from the cache in start(), are done even though the driver died.
+        """
+        finished, self.finished = self.finished, []
+        return finished
+
+    def _step(self, task):
+        self.driver.switch_to.window(task.handle)
+        status = self.driver.execute_script(JS_TAB_STATUS) or {}
+        url = status.get("url") or ""
+
+        if task.state == "thread":
+            if status.get("ready") == "loading":
+                if task.expired():
+                    self._serial(task, "thread page did not load")
+                return
+            if status.get("error400"):
+                print("400 Error")
+                return self._finish(task, "400 Error")
+            hint = self._find_url()
+            if hint:
+                return self._go_amazon(task, hint)
+            return self._serial(task, "outclick needs a click")
+
+        if "amazon." not in url.lower():
+            if time.time() - task.since > ARRIVAL_TIMEOUT:
+                self._serial(task, "did not arrive on Amazon")
+            return
+        if not task.arrived:
+            task.arrived = True
+            task.deadline = time.time() + WIDGET_TIMEOUT
+            task.trace.asin = asin_from_url(url) or task.trace.asin
+            task.trace.amazon_url = url
+            print(f"✅ On Amazon (row {task.row_num}): {url[:140]}")
+        base_text, bonus_text = status.get("base") or "", status.get("bonus") or ""
+        if base_text or bonus_text:
+            messages = read_performance_log(self.driver)
+            measure_page(self.driver, task.row_num, "amazon", messages)
+            sitestripe.learn(self.driver, messages, task.trace.asin, base_text, bonus_text)
+            base_value, bonus_value = extract_rate(base_text), extract_rate(bonus_text)
+            commission_cache.put(task.trace.asin, base_value, bonus_value)
+            return self._finish(task, format_commission(base_value, bonus_value))
+        if task.expired():
+            self._serial(task, "commission widgets not seen")
+
+    def _find_url(self):
+        """find_amazon_url_or_click without the clicking."""
+        preferred, fallback = collect_candidates(self.driver)
+        base_url = self.driver.current_url
+        found = url_from_ctas(preferred) or resolve_outclick_url(preferred, base_url)
+        if found or any_visible(preferred):
+            # A CTA left unresolved gets clicked on the serial path, as in Chrome.
+            return found
+        return best_fallback_url(fallback) or resolve_outclick_url(fallback, base_url)
+
+    def _serial(self, task, reason):
+        """Finish the row on the serial path (clicks, relogin, retries) in its tab."""
+        print(f"↪️ Row {task.row_num}: {reason}; finishing it on the serial path.")
+        task.serial_tried = True
+        task._close_phase()
+        task.state = None
+        try:
+            self.driver.switch_to.window(task.handle)
+        except Exception:
+            self._open_tab(task, "about:blank")
+        resolved = task.link.url if task.link else None
+        total_pct = scrape_row(self.driver, task.row_num, task.thread_url, task.trace, resolved, claim=False)
+        self._finish(task, total_pct)
+
+    def _on_error(self, task, e):
+        print(f"❌ Pipelined row {task.row_num}: {e}")
+        if is_driver_connection_error(e):
+            raise DriverCrashed(str(e))
+        if task not in self.tasks:
+            return
+        if task.serial_tried:
+            self._finish(task, None)
+        else:
+            self._serial(task, "error in the pipeline")
+
+    def _finish(self, task, total_pct):
+        task._close_phase()
+        task.state = None
+        self.tasks.remove(task)
+        self._pin()
+        # Closes the row's tab and any tab its outclick opened.
+        safe_close_extra_tabs(self.driver, self.home)
+        commission_cache.release_claims([task.trace.asin])
+        finish_row(task.trace, trace_outcome(total_pct))
+        self.finished.append((task.item, total_pct))
+
+    def abandon(self, outcome="CRASHED"):
+        """Drop every in-flight row (the driver died); returns their items."""
+        items = []
+        for task in self.tasks:
+            finish_row(task.trace, outcome)
+            commission_cache.release_claims([task.trace.asin])
+            items.append(task.item)
+        self.tasks = []
+        self._pin()
+        return items
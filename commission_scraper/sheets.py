@@ -0,0 +1,349 @@
+"""The worksheet connection and the background writer that batches cell updates."""
+import os, time, random, json, threading
+
+import requests
+import gspread
+from google.oauth2.service_account import Credentials
+from gspread.exceptions import APIError
+
+from .config import (
+    SCOPES,
+    SHEET_FLUSH_CELLS,
+    SHEET_FLUSH_SECONDS,
+    SHEET_JOURNAL_PATH,
+    SHEET_NAME,
+    required_env,
+    service_account_info,
+)
+from .tracing import write_trace
+from .ratelimit import rate_limiter
+from .metrics import queue_depth, sheets_errors, sheets_latency
+from .state import result_store
+
+
+# === INITIALIZATION WITH RETRY ===
+def get_sheet_with_retry(retries=5, backoff=10):
+    creds = Credentials.from_service_account_info(service_account_info(), scopes=SCOPES)
+    gc = gspread.authorize(creds)
+    spreadsheet_id = required_env("SPREADSHEET_ID")
+
+    for i in range(retries):
+        try:
+            sh = gc.open_by_key(spreadsheet_id).worksheet(SHEET_NAME)
+            print("✅ Connected to Google Sheet.")
+            return sh
+        except APIError as e:
+            if e.response.status_code in [500, 502, 503, 504]:
+                print(f"⚠️ Google Sheets API 503 Error (Attempt {i+1}/{retries}). Retrying in {backoff}s...")
+                time.sleep(backoff)
+            else:
+                raise e
+        except Exception as e:
+            print(f"⚠️ Google Sheets Error: {e}. Retrying in {backoff}s...")
+            time.sleep(backoff)
+            
+    raise Exception("Could not connect to Google Sheets after multiple retries.")
+
+_sheet = None
+_sheet_lock = threading.Lock()
+
+
+def get_sheet():
+    """The worksheet, connected on first use so imports and `probe` need no credentials."""
+    global _sheet
+    with _sheet_lock:
+        if _sheet is None:
+            _sheet = get_sheet_with_retry()
+        return _sheet
+
+
+def set_sheet(worksheet):
+    """Use worksheet instead of connecting (bench/run_bench.py plugs in a fake one)."""
+    global _sheet
+    with _sheet_lock:
+        _sheet = worksheet
+
+
+def sheet_api(call, *args):
+    """worksheet.<call>(*args) under the Sheets rate limit, timed and counted for /metrics."""
+    sheet = get_sheet()
+    rate_limiter.acquire("sheets")
+    t0 = time.time()
+    try:
+        return getattr(sheet, call)(*args)
+    except Exception:
+        sheets_errors.inc(call=call)
+        raise
+    finally:
+        sheets_latency.observe(time.time() - t0, call=call)
+
+
+# === SHEET WRITER ===
+
+def is_retryable_sheet_error(e):
+    if isinstance(e, APIError):
+        code = e.response.status_code
+        return code == 429 or code >= 500
+    return isinstance(e, requests.RequestException)
+
+
+class SheetWriter(threading.Thread):
+    """Background thread owning every result write to the sheet.
+
+    Cells are coalesced (the last value queued for a cell wins), contiguous
+    rows of a column are merged into one range, and a batch goes out once
+    SHEET_FLUSH_CELLS cells are pending or the oldest is SHEET_FLUSH_SECONDS
+    old. Quota (429) and server errors back off and retry; failed cells are
+    re-queued unless a newer value arrived meanwhile. Other errors are
+    retried range by range, and ranges the sheet still rejects are dropped.
+
+    Every put is appended to a journal first, and the journal is rewritten
+    to what is still pending after each successful flush, so cells queued
+    before the process died are recovered on the next start.
+    """
+
+    MAX_BACKOFF = 64
+
+    def __init__(self, flush_cells, flush_seconds, journal_path=None):
+        super().__init__(name="sheet-writer", daemon=True)
+        self.flush_cells = flush_cells
+        self.flush_seconds = flush_seconds
+        self.journal_path = journal_path
+        self.pending = {}  # (column, row) -> value
+        self.oldest = None
+        self.in_flight = 0
+        self.writing = {}
+        self.flush_requested = False
+        self.stopping = False
+        self.cond = threading.Condition()
+
+    def put(self, row_num, value, column="I"):
+        with self.cond:
+            self._journal_append(column, row_num, value)
+            self.pending[(column, row_num)] = value
+            if self.oldest is None:
+                self.oldest = time.time()
+            self.cond.notify_all()
+
+    def _journal_append(self, column, row_num, value):
+        if not self.journal_path:
+            return
+        try:
+            with open(self.journal_path, "a") as f:
+                f.write(json.dumps([column, row_num, value]) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            print(f"⚠️ Could not journal sheet write for row {row_num}: {e}")
+
+    def _journal_rewrite(self):
+        """Shrink the journal to the cells not yet written (caller holds cond)."""
+        if not self.journal_path:
+            return
+        cells = dict(self.pending)
+        cells.update(self.writing)
+        try:
+            if not cells:
+                open(self.journal_path, "w").close()
+                return
+            tmp = f"{self.journal_path}.tmp"
+            with open(tmp, "w") as f:
+                for (column, row_num), value in cells.items():
+                    f.write(json.dumps([column, row_num, value]) + "\n")
+            os.replace(tmp, self.journal_path)
+        except OSError as e:
+            print(f"⚠️ Could not rewrite the sheet journal: {e}")
+
+    def recover(self):
+        """Queue the cells a previous run journaled but never wrote."""
+        if not self.journal_path:
+            return 0
+        cells = {}
+        try:
+            with open(self.journal_path) as f:
+                for line in f:
+                    try:
+                        column, row_num, value = json.loads(line)
+                    except ValueError:
+                        continue  # A torn last line from a crash mid-append.
+                    cells[(column, row_num)] = value
+        except FileNotFoundError:
+            return 0
+        with self.cond:
+            for cell, value in cells.items():
+                self.pending.setdefault(cell, value)
+            if self.pending and self.oldest is None:
+                self.oldest = time.time()
+            self._journal_rewrite()
+            self.cond.notify_all()
+        if cells:
+            print(f"📒 Recovered {len(cells)} unwritten sheet cells from the journal.")
+        return len(cells)
+
+    def _due(self):
+        if not self.pending:
+            return False
+        if self.flush_requested or self.stopping or len(self.pending) >= self.flush_cells:
+            return True
+        return time.time() - self.oldest >= self.flush_seconds
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self._due():
+                    if self.stopping:
+                        return
+                    timeout = None
+                    if self.oldest is not None:
+                        timeout = max(0.0, self.oldest + self.flush_seconds - time.time())
+                    self.cond.wait(timeout)
+                batch = self.pending
+                self.pending = {}
+                self.oldest = None
+                self.in_flight = len(batch)
+                self.writing = batch
+
+            ok = self._write(batch)
+
+            with self.cond:
+                self.writing = {}
+                if not ok:
+                    for cell, value in batch.items():
+                        self.pending.setdefault(cell, value)
+                    if self.pending and self.oldest is None:
+                        self.oldest = time.time()
+                else:
+                    self._journal_rewrite()
+                self.in_flight = 0
+                if not self.pending:
+                    self.flush_requested = False
+                self.cond.notify_all()
+
+    @staticmethod
+    def contiguous_runs(batch):
+        """(column, [rows]) for each run of contiguous rows in {(col, row): value}."""
+        runs = []
+        for column in sorted({col for col, _ in batch}):
+            rows = sorted(row for col, row in batch if col == column)
+            run = [rows[0]]
+            for row in rows[1:] + [None]:
+                if row is not None and row == run[-1] + 1:
+                    run.append(row)
+                    continue
+                runs.append((column, run))
+                if row is not None:
+                    run = [row]
+        return runs
+
+    @staticmethod
+    def range_update(batch, column, run):
+        rng = f"{column}{run[0]}" if len(run) == 1 else f"{column}{run[0]}:{column}{run[-1]}"
+        return {"range": rng, "values": [[batch[(column, r)]] for r in run]}
+
+    @classmethod
+    def merge_ranges(cls, batch):
+        """Turn {(col, row): value} into batch_update ranges over contiguous rows."""
+        return [cls.range_update(batch, column, run) for column, run in cls.contiguous_runs(batch)]
+
+    def _write_isolated(self, batch):
+        """After a non-retryable error, write range by range and drop the ranges that fail.
+
+        One bad range (a 400, a protected cell's 403) would otherwise fail
+        every flush it is part of, and hold back every cell queued with it.
+        False if a retryable error came up; the batch is then retried whole.
+        """
+        dropped = 0
+        for column, run in self.contiguous_runs(batch):
+            update = self.range_update(batch, column, run)
+            cells = {(column, r): batch[(column, r)] for r in run}
+            try:
+                sheet_api("batch_update", [update])
+            except Exception as e:
+                if is_retryable_sheet_error(e):
+                    print(f"⚠️ Sheets API busy while isolating a failed write ({e}); retrying on next flush.")
+                    return False
+                print(f"❌ Dropping {len(cells)} cells in {update['range']}, the sheet rejects them: {e}")
+                dropped += len(cells)
+                continue
+            result_store.projected(cells)
+        print(f"✅ Wrote {len(batch) - dropped} cells range by range, dropped {dropped}.")
+        return True
+
+    def _write(self, batch):
+        batch = result_store.changed_cells(batch)
+        if not batch:
+            return True
+        updates = self.merge_ranges(batch)
+        backoff = 2
+        while True:
+            t0 = time.time()
+            try:
+                sheet_api("batch_update", updates)
+                write_trace({
+                    "type": "flush", "cells": len(batch), "ranges": len(updates),
+                    "start": round(t0, 3), "duration": round(time.time() - t0, 3), "ok": True,
+                })
+                print(f"✅ Wrote {len(batch)} cells in {len(updates)} ranges to the sheet.")
+                result_store.projected(batch)
+                return True
+            except Exception as e:
+                write_trace({
+                    "type": "flush", "cells": len(batch), "ranges": len(updates),
+                    "start": round(t0, 3), "duration": round(time.time() - t0, 3), "ok": False,
+                })
+                if not is_retryable_sheet_error(e):
+                    print(f"⚠️ Sheet write failed ({e}); retrying its ranges one at a time.")
+                    return self._write_isolated(batch)
+                retry_after = None
+                if isinstance(e, APIError):
+                    retry_after = e.response.headers.get("Retry-After")
+                try:
+                    delay = float(retry_after)
+                except (TypeError, ValueError):
+                    delay = backoff + random.uniform(0, 1)
+                print(f"⚠️ Sheets API busy ({e}); retrying write in {delay:.0f}s...")
+                time.sleep(delay)
+                backoff = min(backoff * 2, self.MAX_BACKOFF)
+                if self.stopping and backoff >= self.MAX_BACKOFF:
+                    return False
+
+    def drain(self, timeout=None):
+        """Flush everything queued so far; True once nothing is pending."""
+        deadline = time.time() + timeout if timeout is not None else None
+        with self.cond:
+            self.flush_requested = True
+            self.cond.notify_all()
+            while self.pending or self.in_flight:
+                if not self.is_alive():
+                    break
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            drained = not self.pending and not self.in_flight
+        if not drained:
+            print(f"⚠️ Sheet writer still holds {len(self.pending)} unwritten cells.")
+        return drained
+
+    def stop(self, timeout=120):
+        self.drain(timeout)
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+        self.join(timeout=5)
+
+
+sheet_writer = SheetWriter(SHEET_FLUSH_CELLS, SHEET_FLUSH_SECONDS, SHEET_JOURNAL_PATH)
+queue_depth.set_function(lambda: len(sheet_writer.pending), queue="sheet_writer")
+
+
+def mark_manual(row):
+    sheet_writer.put(row, "MANUAL")
+    print(f"✍️  Row {row} marked as MANUAL")
+
+
+def queue_result(row_num, total_pct):
+    if total_pct is None:
+        mark_manual(row_num)
+    else:
+        sheet_writer.put(row_num, total_pct)
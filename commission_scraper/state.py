@@ -0,0 +1,386 @@
+"""State that outlives a cycle: the commission cache and the result store."""
+import os, time, json, threading, sqlite3
+from collections import OrderedDict
+from contextlib import closing
+
+from .config import (
+    ASIN_SINGLE_FLIGHT_WAIT,
+    COMMISSION_CACHE_MAX,
+    COMMISSION_CACHE_PATH,
+    COMMISSION_CACHE_TTL,
+    RESULT_DB_PATH,
+)
+from .tracing import trace_outcome
+
+
+def write_json_atomic(path, data):
+    tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+# === COMMISSION CACHE ===
+
+class CommissionCache:
+    """ASIN -> (base, bonus) rates, persisted as JSON with a TTL and LRU bound.
+
+    Shared by all workers, so every access goes through the lock. It also
+    single-flights ASINs: while one worker scrapes an ASIN, others asking for
+    it through get_or_claim wait for that result instead of loading the page.
+    Hits on rates stored since start_cycle() also count as `reused`, to tell
+    dedup within a cycle apart from rates remembered from earlier ones.
+    """
+
+    SAVE_EVERY = 20
+
+    def __init__(self, path, ttl, max_entries):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.reused = 0
+        self.cycle_started = time.time()
+        self.dirty = 0
+        self.claims = {}  # asin -> [owner thread ident, Event, rates or None]
+        self.load()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    def load(self):
+        if not self.enabled:
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable commission cache {self.path}: {e}")
+            return
+
+        now = time.time()
+        # Stored oldest-first, so re-inserting keeps the LRU order.
+        for asin, base, bonus, stored_at in data.get("entries", []):
+            if now - stored_at < self.ttl:
+                self.entries[asin] = (base, bonus, stored_at)
+        self._evict()
+        print(f"🗃️ Loaded {len(self.entries)} cached commission rates.")
+
+    def save(self):
+        if not self.enabled:
+            return
+        with self.lock:
+            if not self.dirty:
+                return
+            data = {"entries": [[asin, *v] for asin, v in self.entries.items()]}
+            self.dirty = 0
+        try:
+            write_json_atomic(self.path, data)
+        except Exception as e:
+            print(f"⚠️ Could not save commission cache: {e}")
+
+    def _evict(self):
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, asin, count_miss=True):
+        if not self.enabled or not asin:
+            return None
+        with self.lock:
+            entry = self.entries.get(asin)
+            if entry and time.time() - entry[2] < self.ttl:
+                self.entries.move_to_end(asin)
+                self.hits += 1
+                if entry[2] >= self.cycle_started:
+                    self.reused += 1
+                return entry[0], entry[1]
+            if entry:
+                del self.entries[asin]
+                self.dirty += 1
+            if count_miss:
+                self.misses += 1
+            return None
+
+    def start_cycle(self):
+        with self.lock:
+            self.cycle_started = time.time()
+
+    def get_or_claim(self, asin, wait=ASIN_SINGLE_FLIGHT_WAIT):
+        """Cached rates, or rates from a worker already scraping asin, or None.
+
+        None means the calling thread now owns the ASIN; its rates reach the
+        waiters through put() and the claim ends with release_claims().
+        """
+        if not asin:
+            return None
+        me = threading.get_ident()
+        deadline = time.time() + wait
+        while True:
+            cached = self.get(asin)
+            if cached:
+                return cached
+            with self.lock:
+                claim = self.claims.get(asin)
+                if claim is None or claim[0] == me:
+                    self.claims[asin] = claim or [me, threading.Event(), None]
+                    return None
+            print(f"⏳ {asin} is being scraped by another worker, waiting for its result...")
+            claim[1].wait(max(0.0, deadline - time.time()))
+            with self.lock:
+                if claim[2] is not None:
+                    self.shared += 1
+                    return claim[2]
+                if time.time() >= deadline:
+                    return None
+            # The owner gave up without rates; try to take the claim over.
+
+    def release_claims(self, asins=None):
+        """End claims held by the calling thread (only `asins` if given) and wake waiters."""
+        me = threading.get_ident()
+        with self.lock:
+            mine = [
+                asin for asin, claim in self.claims.items()
+                if claim[0] == me and (asins is None or asin in asins)
+            ]
+            for asin in mine:
+                self.claims.pop(asin)[1].set()
+
+    def put(self, asin, base, bonus):
+        if not asin:
+            return
+        with self.lock:
+            claim = self.claims.get(asin)
+            if claim is not None:
+                claim[2] = (base, bonus)
+        if not self.enabled:
+            return
+        with self.lock:
+            self.entries[asin] = (base, bonus, time.time())
+            self.entries.move_to_end(asin)
+            self._evict()
+            self.dirty += 1
+            should_save = self.dirty >= self.SAVE_EVERY
+        if should_save:
+            self.save()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared": self.shared,
+                "reused": self.reused,
+                "size": len(self.entries),
+            }
+
+
+commission_cache = CommissionCache(COMMISSION_CACHE_PATH, COMMISSION_CACHE_TTL, COMMISSION_CACHE_MAX)
+
+
+# === RESULT STORE ===
+
+class ResultStore:
+    """Every row's latest result, plus a history of observed rates, in SQLite.
+
+    The sheet is a projection of the rows table: sheet_value is what column I
+    is known to hold (from the last scan or write), and the sheet writer drops
+    cells that would not change it. Scrape details come from the row traces;
+    the outcome per row from write_results, so repeated threads get a row each.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS rows ("
+        " row INTEGER PRIMARY KEY, thread_url TEXT NOT NULL, amazon_url TEXT, asin TEXT,"
+        " base REAL, bonus REAL, total TEXT, status TEXT NOT NULL DEFAULT 'pending',"
+        " attempts INTEGER NOT NULL DEFAULT 0, sheet_value TEXT,"
+        " first_seen REAL NOT NULL, last_attempt REAL, updated REAL NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS rate_history ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT, asin TEXT, row INTEGER, thread_url TEXT,"
+        " base REAL, bonus REAL, total REAL, source TEXT NOT NULL, observed REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS rate_history_asin ON rate_history (asin, observed)",
+        "CREATE INDEX IF NOT EXISTS rows_status ON rows (status)",
+    )
+    STATUS = {"percent": "ok", "MANUAL": "manual", "400 Error": "error", "NON-AMAZON": "non_amazon"}
+
+    def __init__(self, path):
+        self.path = path
+        if not self.enabled:
+            return
+        try:
+            with closing(self._connect()) as db, db:
+                db.execute("PRAGMA journal_mode=WAL")
+                for statement in self.SCHEMA:
+                    db.execute(statement)
+        except sqlite3.Error as e:
+            print(f"⚠️ Result store disabled, could not open {path}: {e}")
+            self.path = ""
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _run(self, fn):
+        """Run fn(db) in a transaction; store errors never stop a cycle."""
+        if not self.enabled:
+            return None
+        try:
+            with closing(self._connect()) as db, db:
+                return fn(db)
+        except sqlite3.Error as e:
+            print(f"⚠️ Result store error: {e}")
+            return None
+
+    @staticmethod
+    def _upsert(db, row_num, thread_url, now):
+        """Make sure row exists for thread_url; a replaced row starts over."""
+        held = db.execute("SELECT thread_url FROM rows WHERE row = ?", (row_num,)).fetchone()
+        if held and held[0] == thread_url:
+            return
+        db.execute(
+            "INSERT OR REPLACE INTO rows (row, thread_url, first_seen, updated) VALUES (?, ?, ?, ?)",
+            (row_num, thread_url, now, now),
+        )
+
+    def sync_scan(self, rows_to_process, manual_rows, first_row=2):
+        """Record what the scan of rows first_row and below saw in column I.
+
+        A cleared cell starts the row's attempts over. Rows the scan read that
+        were waiting for a result but came back with neither an empty cell nor
+        MANUAL were filled in (or removed) by someone else.
+        """
+        def sync(db):
+            now = time.time()
+            for cells, value, status in ((rows_to_process, "", "pending"), (manual_rows, "MANUAL", "manual")):
+                for row_num, thread_url in cells:
+                    self._upsert(db, row_num, thread_url, now)
+                    db.execute(
+                        "UPDATE rows SET sheet_value = ?, status = ?,"
+                        " attempts = CASE WHEN ? = 'pending' THEN 0 ELSE attempts END WHERE row = ?",
+                        (value, status, status, row_num),
+                    )
+            listed = {row_num for row_num, _ in rows_to_process} | {row_num for row_num, _ in manual_rows}
+            waiting = db.execute(
+                "SELECT row FROM rows WHERE row >= ? AND status IN ('pending', 'manual', 'crashed')", (first_row,)
+            ).fetchall()
+            self._mark_filled(db, [row_num for (row_num,) in waiting if row_num not in listed], now)
+        self._run(sync)
+
+    @staticmethod
+    def _mark_filled(db, rows, now):
+        db.executemany(
+            "UPDATE rows SET status = 'filled', sheet_value = NULL, attempts = 0, updated = ? WHERE row = ?",
+            [(now, row_num) for row_num in rows],
+        )
+
+    def mark_filled(self, rows):
+        """Rows someone else gave a value in column I since the scan."""
+        self._run(lambda db: self._mark_filled(db, rows, time.time()))
+
+    def manual_rows(self):
+        """[(row, thread_url, attempts, last_attempt)] for rows column I has as MANUAL."""
+        rows = self._run(lambda db: db.execute(
+            "SELECT row, thread_url, attempts, last_attempt FROM rows WHERE status = 'manual'"
+        ).fetchall())
+        return rows or []
+
+    def observe(self, trace, outcome):
+        """Store what one scrape attempt learned, and its rates in the history."""
+        # Row 0 is a probe, not a sheet row: only its rates are kept.
+        sheet_row = trace.row_num or None
+
+        def save(db):
+            now = time.time()
+            if sheet_row:
+                self._upsert(db, sheet_row, trace.thread_url, now)
+            db.execute(
+                "UPDATE rows SET attempts = attempts + 1, last_attempt = ?, updated = ?,"
+                " amazon_url = COALESCE(?, amazon_url), asin = COALESCE(?, asin) WHERE row = ?",
+                (trace.started, now, trace.amazon_url, trace.asin, sheet_row),
+            )
+            if trace.rates and outcome == "percent":
+                base, bonus = trace.rates
+                if trace.notes.get("cache_hit"):
+                    source = "cache"
+                elif trace.notes.get("sitestripe_replay"):
+                    source = "replay"
+                else:
+                    source = "widget"
+                db.execute("UPDATE rows SET base = ?, bonus = ? WHERE row = ?", (base, bonus, sheet_row))
+                db.execute(
+                    "INSERT INTO rate_history (asin, row, thread_url, base, bonus, total, source, observed)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (trace.asin, sheet_row, trace.thread_url, base, bonus, round(base + bonus, 4), source, now),
+                )
+        self._run(save)
+
+    def record(self, row_num, thread_url, total_pct, source_row=None):
+        """The result a row gets in the sheet; followers copy their leader's details.
+
+        attempts counts the tries since the row last got a result, so for a
+        MANUAL row it is the number of failed ones the retry backoff needs.
+        """
+        status = "crashed" if total_pct == "CRASHED" else self.STATUS[trace_outcome(total_pct)]
+
+        def save(db):
+            now = time.time()
+            self._upsert(db, row_num, thread_url, now)
+            db.execute(
+                "UPDATE rows SET status = ?, total = ?, updated = ?,"
+                " attempts = CASE WHEN ? IN ('manual', 'crashed') THEN attempts ELSE 0 END WHERE row = ?",
+                (status, None if status == "crashed" else (total_pct or "MANUAL"), now, status, row_num),
+            )
+            if source_row is not None and source_row != row_num:
+                db.execute(
+                    "UPDATE rows SET (amazon_url, asin, base, bonus, attempts, last_attempt) ="
+                    " (SELECT amazon_url, asin, base, bonus, attempts, last_attempt FROM rows WHERE row = ?)"
+                    " WHERE row = ?",
+                    (source_row, row_num),
+                )
+        self._run(save)
+
+    def changed_cells(self, batch):
+        """The cells of a sheet batch that differ from what column I holds."""
+        rows = [row for column, row in batch if column == "I"]
+        if not rows:
+            return batch
+
+        def known(db):
+            found = {}
+            for i in range(0, len(rows), 500):  # SQLite caps bound parameters.
+                chunk = rows[i:i + 500]
+                found.update(db.execute(
+                    "SELECT row, sheet_value FROM rows WHERE sheet_value IS NOT NULL"
+                    f" AND row IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall())
+            return found
+        current = self._run(known) or {}
+        changed = {
+            cell: value for cell, value in batch.items()
+            if cell[0] != "I" or current.get(cell[1]) != str(value)
+        }
+        if len(changed) < len(batch):
+            print(f"🗄️ Skipped {len(batch) - len(changed)} sheet cells that already hold their value.")
+        return changed
+
+    def projected(self, batch):
+        """Remember what was just written to column I."""
+        cells = [(str(value), row) for (column, row), value in batch.items() if column == "I"]
+        if cells:
+            self._run(lambda db: db.executemany("UPDATE rows SET sheet_value = ? WHERE row = ?", cells))
+
+    def status_counts(self):
+        counts = self._run(lambda db: db.execute("SELECT status, COUNT(*) FROM rows GROUP BY status").fetchall())
+        return dict(counts or [])
+
+
+result_store = ResultStore(RESULT_DB_PATH)
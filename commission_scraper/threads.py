@@ -0,0 +1,597 @@
+"""Finding the Amazon product URL behind a Slickdeals thread."""
+import os, re, time, threading
+from collections import OrderedDict
+from html.parser import HTMLParser
+from urllib.parse import parse_qs, unquote, urljoin, urlparse
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
+import requests
+from requests.adapters import HTTPAdapter
+
+from .config import (
+    DEFAULT_USER_AGENT,
+    DOM_EXTRACT,
+    HTTP_TIMEOUT,
+    REDIRECT_CACHE_MAX,
+    REDIRECT_HOP_TIMEOUT,
+    REDIRECT_MAX_HOPS,
+    REDIRECT_MAX_LINKS,
+    REDIRECT_RESOLVE,
+)
+from .tracing import row_phase
+from .ratelimit import rate_limiter
+
+
+def decode_redirect(url):
+    try:
+        pr = urlparse(url)
+        qs = parse_qs(pr.query)
+        for key in ("u2", "u"):
+            if key in qs and qs[key]:
+                return unquote(qs[key][0])
+        return url
+    except Exception:
+        return url
+
+
+def build_amazon_from_cta(a):
+    asin = a.get_attribute("data-aps-asin") or ""
+    if not asin:
+        return None
+    tag = a.get_attribute("data-aps-asc-tag") or ""
+    sub = a.get_attribute("data-aps-asc-subtag") or ""
+    url = f"https://www.amazon.com/dp/{asin}"
+    qs = []
+    if tag:
+        qs.append(f"tag={tag}")
+    if sub and "%ascsubtag%" not in sub:
+        qs.append(f"ascsubtag={sub}")
+    if qs:
+        url += "?" + "&".join(qs)
+    return url
+
+
+ASIN_RE = re.compile(r"/(?:dp|gp/product|gp/aw/d)/([A-Z0-9]{10})(?:[/?#]|$)", re.I)
+
+
+def asin_from_url(url):
+    m = ASIN_RE.search(urlparse(url or "").path + "/")
+    return m.group(1).upper() if m else None
+
+
+def looks_like_product_url(u):
+    ul = (u or "").lower()
+    if "amazon." not in ul:
+        return False
+    bad = ("product-reviews", "/review", "customer-reviews", "/ask", "/questions")
+    if any(x in ul for x in bad):
+        return False
+    return True
+
+
+PREFERRED_CTA_SELECTORS = [
+    "a.dealDetailsOutclickButton[data-store-slug*='amazon']",
+    "a.dealDetailsOutclickButton[data-aps-asin]",
+    "a.dealDetailsMainBlock__outclickButton[data-store-slug*='amazon']",
+    "a[data-cta='outclick'][data-store-slug*='amazon']",
+    "a[data-qa-ddp-seedeal-button][data-store-slug*='amazon']",
+]
+
+FALLBACK_LINK_SELECTORS = [
+    "a.dealDetailsOutclickButton",
+    "a.dealCardCTALink",
+    "a[data-role='outclick']",
+    "a[data-tracking*='outclick']",
+    "a[href*='/f/redirect']",
+    "a[href*='slickdeals.net/click']",
+    "a[href*='amazon.']",
+]
+
+
+def rank(u):
+    ul = u.lower()
+    if "/dp/" in ul or "/gp/product/" in ul or "/gp/aw/d/" in ul:
+        return 100
+    if "/offer-listing/" in ul:
+        return 80
+    return 50
+
+
+def url_from_ctas(ctas):
+    """First visible CTA carrying an ASIN, built into an Amazon product URL."""
+    for a in ctas:
+        try:
+            if not a.is_displayed():
+                continue
+            built = build_amazon_from_cta(a)
+            if built and looks_like_product_url(built):
+                return built
+        except Exception:
+            continue
+    return None
+
+
+def any_visible(anchors):
+    """Whether Chrome would click one of anchors before looking any further."""
+    for a in anchors:
+        try:
+            if a.is_displayed():
+                return True
+        except Exception:
+            continue
+    return False
+
+
+def best_fallback_url(links):
+    """Highest-ranked Amazon product URL among (possibly redirecting) hrefs."""
+    candidates = []
+    for a in links:
+        try:
+            href = a.get_attribute("href") or ""
+            if not href:
+                continue
+            decoded = decode_redirect(href)
+            if looks_like_product_url(decoded):
+                candidates.append(decoded)
+        except Exception:
+            continue
+
+    if candidates:
+        return sorted(set(candidates), key=rank, reverse=True)[0]
+    return None
+
+
+# === BROWSERLESS THREAD PAGE FAST PATH ===
+
+_http_local = threading.local()
+
+
+def new_http_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "User-Agent": os.environ.get("USER_AGENT") or DEFAULT_USER_AGENT,
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        "Accept-Language": "en-US,en;q=0.9",
+    })
+    return session
+
+
+def http_session():
+    """Keep-alive session for the calling thread (requests.Session isn't thread-safe)."""
+    session = getattr(_http_local, "session", None)
+    if session is None:
+        session = _http_local.session = new_http_session()
+    return session
+
+
+_SIMPLE_SELECTOR_RE = re.compile(r"^(\w+)?((?:\.[\w-]+)*)((?:\[[^\]]+\])*)$")
+_ATTR_SELECTOR_RE = re.compile(r"\[([\w-]+)(?:([*^$]?=)'([^']*)')?\]")
+
+
+def selector_matches(selector, tag, attrs):
+    """Match the tag.class[attr op 'value'] subset of CSS used by the CTA selectors."""
+    m = _SIMPLE_SELECTOR_RE.match(selector)
+    if not m:
+        return False
+    want_tag, classes, attr_part = m.groups()
+    if want_tag and want_tag != tag:
+        return False
+    have_classes = (attrs.get("class") or "").split()
+    if any(c not in have_classes for c in classes.split(".")[1:]):
+        return False
+    for name, op, value in _ATTR_SELECTOR_RE.findall(attr_part):
+        have = attrs.get(name)
+        if have is None:
+            return False
+        if op == "=" and have != value:
+            return False
+        if op == "*=" and value not in have:
+            return False
+        if op == "^=" and not have.startswith(value):
+            return False
+        if op == "$=" and not have.endswith(value):
+            return False
+    return True
+
+
+class StaticAnchor:
+    """Parsed <a> tag that quacks like a WebElement for the CTA helpers."""
+
+    def __init__(self, attrs):
+        self.attrs = attrs
+
+    def get_attribute(self, name):
+        return self.attrs.get(name)
+
+    def is_displayed(self):
+        style = (self.attrs.get("style") or "").replace(" ", "").lower()
+        return "hidden" not in self.attrs and "display:none" not in style
+
+
+class ThreadPageParser(HTMLParser):
+    """Collects anchors and the error headline from a Slickdeals thread page."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.anchors = []
+        self.error_headline = ""
+        self._in_error_headline = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {k: (v if v is not None else "") for k, v in attrs}
+        if tag == "a":
+            self.anchors.append(StaticAnchor(attrs))
+        elif tag == "h2" and "errorPage__headline" in (attrs.get("class") or "").split():
+            self._in_error_headline = True
+
+    def handle_endtag(self, tag):
+        if tag == "h2":
+            self._in_error_headline = False
+
+    def handle_data(self, data):
+        if self._in_error_headline:
+            self.error_headline += data
+
+
+def select_anchors(anchors, selectors):
+    return [
+        a for a in anchors
+        if any(selector_matches(sel, "a", a.attrs) for sel in selectors)
+    ]
+
+
+# === OUTCLICK REDIRECT RESOLUTION ===
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+
+def canonical_product_url(url):
+    """https://<amazon host>/dp/<ASIN> for an Amazon product URL, else None."""
+    asin = asin_from_url(url)
+    host = urlparse(url or "").netloc.lower()
+    if not asin or "amazon." not in host:
+        return None
+    return f"https://{host}/dp/{asin}"
+
+
+def is_slickdeals_url(url):
+    return "slickdeals." in urlparse(url or "").netloc.lower()
+
+
+class RedirectResolver:
+    """Follows outclick redirect chains hop by hop without rendering anything.
+
+    Each hop is a HEAD (GET when the server refuses HEAD) on the calling
+    thread's pooled session with redirects disabled, so the chain stops at the
+    first Amazon product URL instead of downloading the product page. Final
+    URLs are cached by source link, LRU-bounded; failures are not cached.
+    """
+
+    def __init__(self, max_hops, timeout, max_entries):
+        self.max_hops = max_hops
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, url):
+        with self.lock:
+            if url in self.entries:
+                self.entries.move_to_end(url)
+                self.hits += 1
+                return self.entries[url]
+            self.misses += 1
+            return None
+
+    def _store(self, url, final):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[url] = final
+            self.entries.move_to_end(url)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _hop(self, url):
+        """Status and Location header of one request, without following it."""
+        session = http_session()
+        rate_limiter.acquire(url)
+        resp = session.head(url, allow_redirects=False, timeout=self.timeout)
+        if resp.status_code in (403, 405, 501):
+            resp = session.get(url, allow_redirects=False, timeout=self.timeout, stream=True)
+            resp.close()
+        return resp.status_code, resp.headers.get("Location")
+
+    def resolve(self, url):
+        """Final URL of the chain starting at url, or None if it could not be followed."""
+        cached = self._lookup(url)
+        if cached:
+            return cached
+
+        current = url
+        for _ in range(self.max_hops):
+            # u2=/u= parameters carry the target already; no request needed.
+            current = decode_redirect(current)
+            if canonical_product_url(current):
+                break
+            try:
+                status, location = self._hop(current)
+            except requests.RequestException as e:
+                print(f"⚠️ Redirect hop failed for {current[:120]}: {e}")
+                return None
+            if status in REDIRECT_STATUSES and location:
+                current = urljoin(current, location)
+                continue
+            break
+        else:
+            # The last hop may have landed on the product itself.
+            current = decode_redirect(current)
+            if not canonical_product_url(current):
+                print(f"⚠️ Gave up on {url[:120]} after {self.max_hops} redirects.")
+                return None
+
+        final = canonical_product_url(current) or current
+        self._store(url, final)
+        return final
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
+
+
+redirect_resolver = RedirectResolver(REDIRECT_MAX_HOPS, REDIRECT_HOP_TIMEOUT, REDIRECT_CACHE_MAX)
+
+
+def outclick_hrefs(anchors, base_url):
+    """Distinct absolute hrefs of visible outclick anchors, in the given order."""
+    hrefs = []
+    for a in anchors:
+        try:
+            if not a.is_displayed():
+                continue
+            href = a.get_attribute("href") or ""
+        except Exception:
+            continue
+        if not href or href.startswith(("#", "javascript:", "mailto:")):
+            continue
+        href = urljoin(base_url, href)
+        if href not in hrefs:
+            hrefs.append(href)
+    return hrefs
+
+
+def resolve_outclick_url(anchors, base_url):
+    """Where the first resolvable outclick among anchors lands, like a click would.
+
+    Returns a canonical Amazon /dp/ URL, the non-Amazon store URL, or None when
+    no chain left Slickdeals (Chrome has to click it).
+    """
+    if not REDIRECT_RESOLVE:
+        return None
+    with row_phase("redirect_resolve"):
+        hrefs = [
+            h for h in outclick_hrefs(anchors, base_url)
+            if "amazon." not in urlparse(h).netloc.lower() or canonical_product_url(h)
+        ]
+        for href in hrefs[:REDIRECT_MAX_LINKS]:
+            final = redirect_resolver.resolve(href)
+            if not final or is_slickdeals_url(final):
+                continue
+            if "amazon." in final.lower() and not looks_like_product_url(final):
+                continue
+            print(f"🔗 Resolved outclick {href[:100]} → {final[:120]}")
+            return final
+    return None
+
+
+def find_amazon_url_http(thread_url):
+    """Resolve a thread to an Amazon URL from its static HTML, without Chrome.
+
+    Returns the Amazon URL, "400 Error", or None when Chrome has to take over.
+    """
+    rate_limiter.acquire(thread_url)
+    try:
+        resp = http_session().get(thread_url, timeout=HTTP_TIMEOUT)
+    except requests.RequestException as e:
+        print(f"⚠️ HTTP fetch failed, falling back to Chrome: {e}")
+        return None
+
+    parser = ThreadPageParser()
+    try:
+        parser.feed(resp.text)
+        parser.close()
+    except Exception as e:
+        print(f"⚠️ Could not parse thread HTML, falling back to Chrome: {e}")
+        return None
+
+    if "400 Error" in parser.error_headline:
+        return "400 Error"
+    if resp.status_code != 200:
+        print(f"⚠️ HTTP {resp.status_code} for thread page, falling back to Chrome.")
+        return None
+
+    # Same order as find_amazon_url_or_click: the deal's own CTA before body links.
+    base_url = resp.url or thread_url
+    preferred = select_anchors(parser.anchors, PREFERRED_CTA_SELECTORS)
+    built = url_from_ctas(preferred)
+    if built:
+        print(f"⚡ Pref Amazon CTA (HTTP): {built}")
+        return built
+    resolved = resolve_outclick_url(preferred, base_url)
+    if resolved:
+        return resolved
+    if any_visible(preferred):
+        # Chrome would click it; a /dp/ link in the body may be another product.
+        print("ℹ️ Amazon CTA without an ASIN, falling back to Chrome.")
+        return None
+
+    fallback_links = select_anchors(parser.anchors, FALLBACK_LINK_SELECTORS)
+    best = best_fallback_url(fallback_links)
+    if best:
+        print(f"⚡ Fallback Amazon link (HTTP): {best}")
+        return best
+    return resolve_outclick_url(fallback_links, base_url)
+
+
+# Attributes the CTA helpers read; a.href is the resolved absolute URL, the
+# same value WebElement.get_attribute("href") returns.
+JS_COLLECT_ANCHORS = r"""
+const preferred = arguments[0], fallback = arguments[1];
+const NAMES = ["data-aps-asin", "data-aps-asc-tag", "data-aps-asc-subtag", "data-store-slug", "class"];
+function visible(el) {
+  if (!(el.offsetWidth || el.offsetHeight || el.getClientRects().length)) return false;
+  const style = window.getComputedStyle(el);
+  return style.visibility !== "hidden" && style.display !== "none";
+}
+function describe(el, origin) {
+  const attrs = {href: el.href || el.getAttribute("href") || ""};
+  for (const name of NAMES) {
+    const v = el.getAttribute(name);
+    if (v !== null) attrs[name] = v;
+  }
+  return {attrs: attrs, visible: visible(el), origin: origin, el: el};
+}
+const out = {preferred: [], fallback: []};
+try {
+  for (const el of document.querySelectorAll(preferred.join(", "))) {
+    out.preferred.push(describe(el, "preferred"));
+  }
+} catch (e) {}
+for (const sel of fallback) {
+  try {
+    for (const el of document.querySelectorAll(sel)) out.fallback.push(describe(el, sel));
+  } catch (e) {}
+}
+return out;
+"""
+
+
+class DomAnchor(StaticAnchor):
+    """Anchor snapshot from JS_COLLECT_ANCHORS; keeps the element for clicking."""
+
+    def __init__(self, item):
+        super().__init__(item.get("attrs") or {})
+        self.visible = bool(item.get("visible"))
+        self.origin = item.get("origin")
+        self.element = item.get("el")
+
+    def is_displayed(self):
+        return self.visible
+
+
+def collect_candidates(driver):
+    """(preferred CTAs, fallback links) on the current page."""
+    if DOM_EXTRACT == "legacy":
+        preferred = driver.find_elements(By.CSS_SELECTOR, ", ".join(PREFERRED_CTA_SELECTORS))
+        fallback = []
+        for sel in FALLBACK_LINK_SELECTORS:
+            try:
+                fallback.extend(driver.find_elements(By.CSS_SELECTOR, sel))
+            except Exception:
+                continue
+        return preferred, fallback
+
+    data = driver.execute_script(
+        JS_COLLECT_ANCHORS, PREFERRED_CTA_SELECTORS, FALLBACK_LINK_SELECTORS
+    ) or {}
+    return (
+        [DomAnchor(item) for item in data.get("preferred") or []],
+        [DomAnchor(item) for item in data.get("fallback") or []],
+    )
+
+
+def click_anchor(driver, a):
+    el = getattr(a, "element", a)
+    driver.execute_script("arguments[0].scrollIntoView({block:'center'});", el)
+    time.sleep(0.1)
+    driver.execute_script("arguments[0].click();", el)
+
+
+def find_amazon_url_or_click(driver):
+    preferred_ctas, fallback_links = collect_candidates(driver)
+    built = url_from_ctas(preferred_ctas)
+    if built:
+        print(f"✅ Pref Amazon CTA: {built}")
+        return built, None
+
+    resolved = resolve_outclick_url(preferred_ctas, driver.current_url)
+    if resolved:
+        return resolved, None
+
+    for a in preferred_ctas:
+        try:
+            if not a.is_displayed():
+                continue
+            original = driver.current_window_handle
+            before = set(driver.window_handles)
+            before_url = driver.current_url
+            click_anchor(driver, a)
+            try:
+                WebDriverWait(driver, 10).until(
+                    lambda d: len(d.window_handles) > len(before)
+                )
+                new_handle = (set(driver.window_handles) - before).pop()
+                driver.switch_to.window(new_handle)
+                print("🧭 Switched via CTA (new tab)")
+                return None, (original, new_handle)
+            except TimeoutException:
+                try:
+                    WebDriverWait(driver, 10).until(
+                        lambda d: d.current_url != before_url
+                    )
+                except TimeoutException:
+                    pass
+                if looks_like_product_url(driver.current_url):
+                    print("🧭 Switched via CTA (same tab)")
+                    return None, (original, None)
+        except Exception:
+            continue
+
+    best = best_fallback_url(fallback_links)
+    if best:
+        print(f"✅ Fallback Amazon link: {best}")
+        return best, None
+
+    resolved = resolve_outclick_url(fallback_links, driver.current_url)
+    if resolved:
+        return resolved, None
+
+    original = driver.current_window_handle
+    before = set(driver.window_handles)
+    for a in fallback_links:
+        try:
+            click_anchor(driver, a)
+            break
+        except Exception:
+            continue
+
+    try:
+        WebDriverWait(driver, 10).until(
+            lambda d: len(d.window_handles) > len(before)
+        )
+        new_handle = (set(driver.window_handles) - before).pop()
+        driver.switch_to.window(new_handle)
+        print("🧭 Switched via generic outclick")
+        return None, (original, new_handle)
+    except TimeoutException:
+        return None, (original, None)
+
+
+def thread_key(url):
+    """Normalized thread URL, so reposted rows of the same thread group together."""
+    pr = urlparse((url or "").strip())
+    host = pr.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    path = pr.path.rstrip("/")
+    m = re.match(r"^/f/(\d+)", path)
+    if "slickdeals." in host and m:
+        return f"slickdeals/f/{m.group(1)}"
+    return f"{host}{path}" or url
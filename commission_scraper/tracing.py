@@ -0,0 +1,124 @@
+"""Per-row phase timings and outcomes, written as JSONL."""
+import time, json, threading
+from contextlib import contextmanager
+
+from .config import TRACE_PATH
+
+
+# === ROW TRACING ===
+
+_trace_lock = threading.Lock()
+_trace_local = threading.local()
+
+
+def write_trace(record):
+    if not TRACE_PATH:
+        return
+    line = json.dumps(record, separators=(",", ":"))
+    try:
+        with _trace_lock, open(TRACE_PATH, "a") as f:
+            f.write(line + "\n")
+    except Exception as e:
+        print(f"⚠️ Could not write trace record: {e}")
+
+
+class RowTrace:
+    """Phase durations, attempts and outcome for one process_row call."""
+
+    def __init__(self, row_num, thread_url):
+        self.row_num = row_num
+        self.thread_url = thread_url
+        self.asin = None
+        self.attempts = 0
+        self.phases = {}
+        self.notes = {}
+        self.commands = 0
+        self.phase_commands = {}
+        self.amazon_url = None
+        self.rates = None
+        self.started = time.time()
+
+    @contextmanager
+    def phase(self, name):
+        t0 = time.time()
+        c0 = self.commands
+        try:
+            yield
+        finally:
+            self.phases[name] = round(self.phases.get(name, 0.0) + time.time() - t0, 3)
+            if self.commands > c0:
+                self.phase_commands[name] = self.phase_commands.get(name, 0) + self.commands - c0
+
+    def finish(self, outcome):
+        ended = time.time()
+        write_trace({
+            "type": "row",
+            "row": self.row_num,
+            "url": self.thread_url,
+            "asin": self.asin,
+            "attempts": self.attempts,
+            "outcome": outcome,
+            "start": round(self.started, 3),
+            "end": round(ended, 3),
+            "total": round(ended - self.started, 3),
+            "phases": self.phases,
+            "webdriver_cmds": self.commands,
+            "phase_cmds": self.phase_commands,
+            **self.notes,
+        })
+
+
+def current_trace():
+    return getattr(_trace_local, "trace", None)
+
+
+@contextmanager
+def row_phase(name):
+    """Time a block against the row being processed on this thread, if any."""
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    with trace.phase(name):
+        yield
+
+
+def count_webdriver_commands(driver):
+    """Count every WebDriver HTTP command against the row being traced.
+
+    WebElement calls go through their parent's execute too, so patching the
+    driver instance catches find_element, is_displayed, get_attribute, etc.
+    Navigations are also counted on the driver as pages_loaded.
+    """
+    execute = driver.execute
+    driver.pages_loaded = 0
+
+    def counted_execute(driver_command, params=None):
+        trace = current_trace()
+        if trace is not None:
+            trace.commands += 1
+        if driver_command == "get":
+            driver.pages_loaded += 1
+        return execute(driver_command, params)
+
+    driver.execute = counted_execute
+    return driver
+
+
+def trace_outcome(total_pct):
+    if total_pct is None:
+        return "MANUAL"
+    if total_pct in ("400 Error", "NON-AMAZON"):
+        return total_pct
+    return "percent"
+
+
+@contextmanager
+def tracing(trace):
+    """Make trace the calling thread's current row trace for a block."""
+    previous = current_trace()
+    _trace_local.trace = trace
+    try:
+        yield
+    finally:
+        _trace_local.trace = previous
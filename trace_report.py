@@ -0,0 +1,106 @@
+import os, sys, json, math
+from collections import Counter, defaultdict
+
+DEFAULT_TRACE_PATH = os.path.join(
+    os.environ.get("STATE_DIR", "/tmp/commission-scraper"), "row-trace.jsonl"
+)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    k = max(0, min(len(values) - 1, math.ceil(pct / 100.0 * len(values)) - 1))
+    return values[k]
+
+
+def load_records(path):
+    rows, flushes = [], []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if rec.get("type") == "row":
+                rows.append(rec)
+            elif rec.get("type") == "flush":
+                flushes.append(rec)
+    return rows, flushes
+
+
+def summarize(rows, flushes):
+    lines = []
+    if not rows:
+        return "No row records found."
+
+    timings = defaultdict(list)
+    for rec in rows:
+        timings["total"].append(rec.get("total", 0.0))
+        for phase, secs in (rec.get("phases") or {}).items():
+            timings[phase].append(secs)
+    if flushes:
+        timings["sheet_flush"] = [f.get("duration", 0.0) for f in flushes]
+
+    width = max(len(name) for name in timings)
+    lines.append(f"{'phase':<{width}}  {'n':>6}  {'p50':>8}  {'p95':>8}  {'p99':>8}  {'sum':>10}")
+    order = sorted(timings, key=lambda name: (name == "total", -sum(timings[name])))
+    for name in order:
+        vals = sorted(timings[name])
+        lines.append(
+            f"{name:<{width}}  {len(vals):>6}  {percentile(vals, 50):>7.2f}s  "
+            f"{percentile(vals, 95):>7.2f}s  {percentile(vals, 99):>7.2f}s  {sum(vals):>9.1f}s"
+        )
+
+    lines.append("")
+    outcomes = Counter(rec.get("outcome") for rec in rows)
+    lines.append("outcomes: " + ", ".join(f"{k}={v}" for k, v in outcomes.most_common()))
+    attempts = Counter(rec.get("attempts", 0) for rec in rows)
+    lines.append("attempts: " + ", ".join(f"{k}={v}" for k, v in sorted(attempts.items())))
+    cmds = sorted(rec["webdriver_cmds"] for rec in rows if "webdriver_cmds" in rec)
+    if cmds:
+        lines.append(
+            f"webdriver commands/row: p50={percentile(cmds, 50)} p95={percentile(cmds, 95)} "
+            f"max={cmds[-1]} total={sum(cmds)}"
+        )
+        by_phase = defaultdict(list)
+        for rec in rows:
+            for phase, n in (rec.get("phase_cmds") or {}).items():
+                by_phase[phase].append(n)
+        for phase, counts in sorted(by_phase.items(), key=lambda kv: -sum(kv[1])):
+            counts.sort()
+            lines.append(f"  {phase}: p50={percentile(counts, 50)} p95={percentile(counts, 95)} total={sum(counts)}")
+    cache_hits = sum(1 for rec in rows if rec.get("cache_hit"))
+    lines.append(f"cache hits: {cache_hits}/{len(rows)}")
+    replays = sum(1 for rec in rows if rec.get("sitestripe_replay"))
+    if replays:
+        lines.append(f"sitestripe replays: {replays}/{len(rows)}")
+
+    start = min(rec.get("start", 0.0) for rec in rows)
+    end = max(rec.get("end", 0.0) for rec in rows)
+    span = max(end - start, 1e-9)
+    lines.append(f"rows/hour: {len(rows) / span * 3600:.1f} ({len(rows)} rows over {span / 60:.1f} min)")
+    if flushes:
+        failed = sum(1 for f in flushes if not f.get("ok"))
+        cells = sum(f.get("cells", 0) for f in flushes if f.get("ok"))
+        lines.append(f"sheet flushes: {len(flushes)} ({failed} failed), {cells} cells written")
+    return "\n".join(lines)
+
+
+def main(argv):
+    path = argv[1] if len(argv) > 1 else os.environ.get("TRACE_PATH") or DEFAULT_TRACE_PATH
+    try:
+        rows, flushes = load_records(path)
+    except FileNotFoundError:
+        print(f"❌ No trace file at {path}")
+        return 1
+    print(f"📊 Trace report for {path}\n")
+    print(summarize(rows, flushes))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv))